@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Stand-in FreeIPA JSON-RPC servers, for benchmarks and replica tests
+
+Implements just enough of the /ipa/session API for the jsonrpc backend:
+login_password, user_find, user_show, group_find, user_mod and batch.
+Several servers can run in one process, each on its own port with its own
+latency and busy rate, to play a set of replicas:
+
+    fake_ipa_server.py --ports 8801,8802:0.2,8803:0.01:0.5 --users 5000
+
+starts three servers; 8802 answers after 0.2s, 8803 after 0.01s and fails
+half of its changes with a retryable "server is busy" error. GET on any
+path returns the request counters of that server as JSON; expire_sessions()
+makes the session cookies handed out so far invalid, to test re-login.
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from generate_users import iter_users, iter_groups
+
+BASE_DN = "dc=example,dc=com"
+
+
+class FakeIpaServer(ThreadingHTTPServer):
+    """
+    One stand-in server; the user directory is shared between servers like replicated data
+    """
+    daemon_threads = True
+    
+    def __init__(self, port: int, directory: dict, latency: float = 0.0, call_latency: float = 0.0,
+                 busy_rate: float = 0.0, groups: list = ()):
+        super().__init__(('127.0.0.1', port), FakeIpaHandler)
+        self.directory = directory
+        self.groups = groups
+        self.latency = latency
+        self.call_latency = call_latency
+        self.busy_rate = busy_rate
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'calls': 0, 'modified': 0, 'busy': 0, 'logins': 0}
+        # Cookie value of the current session; expire_sessions() invalidates the ones handed out
+        self.session = 'fake'
+        self.generation = 0
+    
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+    
+    def expire_sessions(self):
+        """
+        Make every session cookie handed out so far invalid (answered with HTTP 401)
+        """
+        with self.lock:
+            self.generation += 1
+            self.session = f"fake{self.generation}"
+    
+    def count(self, key: str, value: int = 1):
+        with self.lock:
+            self.stats[key] += value
+    
+    def run(self, method: str, params: list) -> dict:
+        self.count('calls')
+        args, options = (params + [[], {}])[:2]
+        if method == 'user_mod':
+            login = args[0] if args else ''
+            entry = self.directory.get(login)
+            if entry is None:
+                return {'error': {'message': f"{login}: user not found", 'code': 4001, 'name': 'NotFound'}}
+            if random.random() < self.busy_rate:
+                self.count('busy')
+                return {'error': {'message': "Server is busy, try again later", 'code': 4203, 'name': 'Busy'}}
+            attribute, _, value = options.get('setattr', '').partition('=')
+            if attribute.lower() == 'krbpasswordexpiration':
+                entry['krbpasswordexpiration'] = [value]
+            self.count('modified')
+            return {'result': {'value': login}}
+        if method == 'user_find':
+            entries = list(self.directory.values())
+            if options.get('nsaccountlock'):
+                entries = [{'uid': entry['uid']} for entry in entries if entry.get('nsaccountlock') == ['TRUE']]
+            return {'result': {'result': entries, 'count': len(entries), 'truncated': False}}
+        if method == 'user_show':
+            login = args[0] if args else ''
+            entry = self.directory.get(login) or self.directory.get(login.lower())
+            if entry is None:
+                return {'error': {'message': f"{login}: user not found", 'code': 4001, 'name': 'NotFound'}}
+            return {'result': {'result': entry, 'value': entry['uid'][0]}}
+        if method == 'group_find':
+            return {'result': {'result': list(self.groups), 'count': len(self.groups), 'truncated': False}}
+        return {'error': {'message': f"unknown command '{method}'", 'code': 1, 'name': 'CommandError'}}
+
+
+class FakeIpaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, *args):
+        pass
+    
+    def reply(self, status: int, body: bytes = b"", headers: dict = None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_POST(self):
+        server = self.server
+        server.count('requests')
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/ipa/session/login_password":
+            server.count('logins')
+            self.reply(200, headers={"Set-Cookie": f"ipa_session={server.session}; Path=/ipa; HttpOnly"})
+            return
+        if f"ipa_session={server.session}" != (self.headers.get("Cookie") or ""):
+            self.reply(401)
+            return
+        
+        request = json.loads(body)
+        if request['method'] == 'batch':
+            calls = request['params'][0]
+            time.sleep(server.latency + server.call_latency * len(calls))
+            results = []
+            for call in calls:
+                outcome = server.run(call['method'], call['params'])
+                if outcome.get('error'):
+                    error = outcome['error']
+                    results.append({'error': error['message'], 'error_code': error['code'],
+                                    'error_name': error['name']})
+                else:
+                    results.append(dict(outcome['result'], error=None))
+            response = {'error': None, 'result': {'count': len(results), 'results': results}}
+        else:
+            time.sleep(server.latency + server.call_latency)
+            outcome = server.run(request['method'], request['params'])
+            response = {'error': outcome.get('error'), 'result': outcome.get('result')}
+        response['id'] = request.get('id', 0)
+        self.reply(200, json.dumps(response).encode(), {"Content-Type": "application/json"})
+    
+    def do_GET(self):
+        with self.server.lock:
+            body = json.dumps(self.server.stats).encode()
+        self.reply(200, body, {"Content-Type": "application/json"})
+
+
+def build_directory(count: int) -> dict:
+    """
+    Raw user_find entries for `count` synthetic users, keyed by login
+    """
+    directory = {}
+    for user in iter_users(count, heavy_every=0):
+        directory[user['login']] = {
+            'uid': [user['login']],
+            'givenname': [user['first_name']],
+            'sn': [user['last_name']],
+            'uidnumber': [str(user['uid'])],
+            'mail': [user['email']],
+            'krbpasswordexpiration': [user['expiration']],
+            'memberof': [f"cn={group},cn=groups,cn=accounts,{BASE_DN}" for group in user['groups']],
+        }
+        if user['disabled']:
+            directory[user['login']]['nsaccountlock'] = ['TRUE']
+    return directory
+
+
+def build_groups(count: int) -> list:
+    """
+    Raw group_find entries of the directory of build_directory
+    """
+    return [{
+        'dn': f"cn={group['name']},cn=groups,cn=accounts,{BASE_DN}",
+        'cn': [group['name']],
+        'member': ([f"uid={login},cn=users,cn=accounts,{BASE_DN}" for login in group['users']]
+                   + [f"cn={name},cn=groups,cn=accounts,{BASE_DN}" for name in group['subgroups']]),
+    } for group in iter_groups(count, heavy_every=0)]
+
+
+def start_servers(specs, users: int = 1000, latency: float = 0.0, call_latency: float = 0.0,
+                  busy_rate: float = 0.0):
+    """
+    Start one server per spec in background threads
+    
+    Args:
+        specs: "PORT[:LATENCY[:BUSY_RATE]]" strings (port 0 picks a free port)
+        users: Size of the shared directory
+        latency, call_latency, busy_rate: Defaults for specs that do not override them
+    
+    Returns:
+        list: The running FakeIpaServer instances
+    """
+    directory = build_directory(users)
+    groups = build_groups(users)
+    servers = []
+    for spec in specs:
+        fields = str(spec).split(':')
+        server = FakeIpaServer(int(fields[0]), directory,
+                               latency=float(fields[1]) if len(fields) > 1 else latency,
+                               call_latency=call_latency,
+                               busy_rate=float(fields[2]) if len(fields) > 2 else busy_rate,
+                               groups=groups)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run stand-in FreeIPA JSON-RPC servers')
+    parser.add_argument('--ports', default='8801',
+                        help='Comma separated PORT[:LATENCY[:BUSY_RATE]] specs (default: 8801)')
+    parser.add_argument('--users', type=int, default=1000, help='Users in the directory (default: 1000)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds per request (default: 0)')
+    parser.add_argument('--call-latency', type=float, default=0.0,
+                        help='Extra seconds per command inside a request (default: 0)')
+    parser.add_argument('--busy-rate', type=float, default=0.0,
+                        help='Fraction of user_mod calls failing with "server is busy" (default: 0)')
+    args = parser.parse_args()
+    
+    servers = start_servers(args.ports.split(','), users=args.users, latency=args.latency,
+                            call_latency=args.call_latency, busy_rate=args.busy_rate)
+    for server in servers:
+        print(f"Serving {server.url} (latency {server.latency}s, busy rate {server.busy_rate})", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+            print(f"{server.url}: {json.dumps(server.stats)}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
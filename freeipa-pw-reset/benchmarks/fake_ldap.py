@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the OpenLDAP ldapsearch and ldapmodify clients, for benchmarks and tests
+
+fake_ldapsearch and fake_ldapmodify are thin wrappers around this module;
+install them on PATH as `ldapsearch` and `ldapmodify` (run_benchmarks.py
+and the tests do this with symlinks in a temporary directory). They accept
+the arguments the ldap backend passes, evaluate search filters (&, |, !,
+=, =*, substrings, >=, <=) and answer in -LLL LDIF. Behaviour is controlled
+through the environment:
+
+    FAKE_LDAP_USERS         Users in the generated directory (default: 1000)
+    FAKE_LDAP_DIRECTORY     JSON file holding the directory; created on first use,
+                            so modifications persist between calls (default: none,
+                            the directory is generated per call and changes are lost)
+    FAKE_LDAP_REJECT        Comma separated logins whose modifications fail with
+                            "Insufficient access (50)"
+    FAKE_LDAP_PASSWORD      Password simple binds must use (default: any)
+    FAKE_LDAP_LATENCY       Seconds every call waits before answering (default: 0)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import fcntl
+import tempfile
+
+from generate_users import BASE_DN, iter_users, iter_groups
+
+USERS_BASE = f"cn=users,cn=accounts,{BASE_DN}"
+GROUPS_BASE = f"cn=groups,cn=accounts,{BASE_DN}"
+# Generated entries were last modified one second apart from this time (all in the past, so only
+# real modifications show up in modifyTimestamp deltas)
+CREATED = 1704067200
+
+# Exit codes and messages of the OpenLDAP tools
+SUCCESS = 0
+TIMELIMIT_EXCEEDED = 3
+SIZELIMIT_EXCEEDED = 4
+NO_SUCH_OBJECT = 32
+INVALID_CREDENTIALS = 49
+INSUFFICIENT_ACCESS = 50
+MESSAGES = {
+    SIZELIMIT_EXCEEDED: "Size limit exceeded",
+    NO_SUCH_OBJECT: "No such object",
+    INVALID_CREDENTIALS: "Invalid credentials",
+    INSUFFICIENT_ACCESS: "Insufficient access",
+}
+
+
+def build_directory(count: int) -> list:
+    """
+    Entries ({'dn': ..., 'attrs': {name: [values]}}) of `count` synthetic users and their groups
+    """
+    entries = []
+    parents = {}
+    groups = list(iter_groups(count, heavy_every=0))
+    for group in groups:
+        for subgroup in group['subgroups']:
+            parents.setdefault(subgroup, []).append(group['name'])
+    for index, user in enumerate(iter_users(count, heavy_every=0)):
+        attrs = {
+            'objectClass': ['top', 'person', 'posixAccount', 'krbPrincipalAux', 'ipaObject'],
+            'uid': [user['login']],
+            'givenName': [user['first_name']],
+            'sn': [user['last_name']],
+            'cn': [f"{user['first_name']} {user['last_name']}"],
+            'uidNumber': [str(user['uid'])],
+            'gidNumber': [str(user['uid'])],
+            'mail': [user['email']],
+            'krbPasswordExpiration': [user['expiration']],
+            'memberOf': [f"cn={group},{GROUPS_BASE}" for group in user['groups']],
+            'modifyTimestamp': [time.strftime('%Y%m%d%H%M%SZ', time.gmtime(CREATED + index))],
+        }
+        if user['disabled']:
+            attrs['nsAccountLock'] = ['TRUE']
+        entries.append({'dn': f"uid={user['login']},{USERS_BASE}", 'attrs': attrs})
+    for group in groups:
+        entries.append({'dn': f"cn={group['name']},{GROUPS_BASE}", 'attrs': {
+            'objectClass': ['top', 'groupOfNames', 'ipausergroup'],
+            'cn': [group['name']],
+            'member': ([f"uid={login},{USERS_BASE}" for login in group['users']]
+                       + [f"cn={name},{GROUPS_BASE}" for name in group['subgroups']]),
+            'memberOf': [f"cn={name},{GROUPS_BASE}" for name in parents.get(group['name'], [])],
+        }})
+    return entries
+
+
+def load_directory() -> list:
+    path = os.environ.get('FAKE_LDAP_DIRECTORY')
+    if path and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    entries = build_directory(int(os.environ.get('FAKE_LDAP_USERS', '1000')))
+    if path:
+        save_directory(path, entries)
+    return entries
+
+
+def save_directory(path: str, entries: list):
+    """
+    Replace the directory file atomically, so concurrent searches never see half of it
+    """
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(entries, f)
+    os.replace(temporary, path)
+
+
+def unescape(value: str) -> str:
+    return re.sub(r'\\([0-9a-fA-F]{2})', lambda match: chr(int(match.group(1), 16)), value)
+
+
+def parse_filter(text: str, position: int = 0):
+    """
+    Parse one parenthesized filter starting at `position`
+
+    Returns:
+        tuple: (node, position after the closing parenthesis)
+
+    Raises:
+        ValueError: On a malformed filter
+    """
+    if position >= len(text) or text[position] != '(':
+        raise ValueError(f"Bad search filter: {text!r}")
+    position += 1
+    operator = text[position] if position < len(text) else ''
+    if operator in '&|':
+        children = []
+        position += 1
+        while position < len(text) and text[position] == '(':
+            child, position = parse_filter(text, position)
+            children.append(child)
+        node = ('and' if operator == '&' else 'or', children)
+        if (operator == '|' and children and all(child[0] == 'equal' for child in children)
+                and len({child[1] for child in children}) == 1):
+            # A list of logins, (|(uid=a)(uid=b)...): one set lookup, like an indexed attribute
+            node = ('in', children[0][1], frozenset(child[2] for child in children))
+    elif operator == '!':
+        child, position = parse_filter(text, position + 1)
+        node = ('not', child)
+    else:
+        end = text.find(')', position)
+        if end < 0:
+            raise ValueError(f"Bad search filter: {text!r}")
+        match = re.match(r'([\w;.-]+)(>=|<=|=)(.*)$', text[position:end])
+        if match is None:
+            raise ValueError(f"Bad search filter: {text!r}")
+        attribute, comparison, value = match.groups()
+        if comparison == '=' and value == '*':
+            node = ('present', attribute.lower())
+        elif comparison == '=' and '*' in value:
+            pattern = '.*'.join(re.escape(unescape(part).lower()) for part in value.split('*'))
+            node = ('substring', attribute.lower(), re.compile(f"^{pattern}$", re.DOTALL))
+        else:
+            node = ({'=': 'equal', '>=': 'greater', '<=': 'less'}[comparison], attribute.lower(),
+                    unescape(value).lower())
+        position = end
+    if position >= len(text) or text[position] != ')':
+        raise ValueError(f"Bad search filter: {text!r}")
+    return node, position + 1
+
+
+def matches(node, attrs: dict) -> bool:
+    """
+    Evaluate a parsed filter against an entry (values compare case-insensitively)
+    """
+    kind = node[0]
+    if kind == 'and':
+        return all(matches(child, attrs) for child in node[1])
+    if kind == 'or':
+        return any(matches(child, attrs) for child in node[1])
+    if kind == 'not':
+        return not matches(node[1], attrs)
+    values = [value.lower() for name, entry_values in attrs.items() if name.lower() == node[1]
+              for value in entry_values]
+    if kind == 'present':
+        return bool(values)
+    if kind == 'substring':
+        return any(node[2].match(value) for value in values)
+    if kind == 'equal':
+        return node[2] in values
+    if kind == 'in':
+        return any(value in node[2] for value in values)
+    if kind == 'greater':
+        return any(value >= node[2] for value in values)
+    return any(value <= node[2] for value in values)
+
+
+def parse_arguments(args, options_with_values: str, flags: str):
+    """
+    Split OpenLDAP style arguments into ({option: value}, [positional])
+    """
+    options = {}
+    positional = []
+    index = 0
+    while index < len(args):
+        arg = args[index]
+        if arg.startswith('-') and len(arg) > 1 and arg != '-LLL' and arg[1] in options_with_values:
+            value = arg[2:] if len(arg) > 2 else args[index + 1]
+            index += 1 if len(arg) > 2 else 2
+            options.setdefault(arg[1], value)
+            continue
+        if arg == '-LLL' or (arg.startswith('-') and len(arg) == 2 and arg[1] in flags):
+            options[arg[1:]] = True
+        else:
+            positional.append(arg)
+        index += 1
+    return options, positional
+
+
+def check_bind(options: dict) -> int:
+    """
+    Simple binds must name a DN and a readable password file (matching FAKE_LDAP_PASSWORD if set)
+    """
+    if 'x' not in options:
+        return SUCCESS
+    expected = os.environ.get('FAKE_LDAP_PASSWORD')
+    try:
+        with open(options['y'], encoding='utf-8') as f:
+            password = f.read()
+    except (KeyError, OSError):
+        password = None
+    if 'D' not in options or password is None or (expected is not None and password != expected):
+        print(f"ldap_bind: {MESSAGES[INVALID_CREDENTIALS]} ({INVALID_CREDENTIALS})", file=sys.stderr)
+        return INVALID_CREDENTIALS
+    return SUCCESS
+
+
+def write_entry(out, entry: dict, attributes: list):
+    out.write(f"dn: {entry['dn']}\n")
+    wanted = {name.lower() for name in attributes}
+    for name, values in entry['attrs'].items():
+        if not wanted or name.lower() in wanted:
+            for value in values:
+                out.write(f"{name}: {value}\n")
+    out.write("\n")
+
+
+def ldapsearch_main(args) -> int:
+    time.sleep(float(os.environ.get('FAKE_LDAP_LATENCY', '0')))
+    options, positional = parse_arguments(args, 'oEzlHYDyb', 'Qx')
+    status = check_bind(options)
+    if status != SUCCESS:
+        return status
+    try:
+        node, _ = parse_filter(positional[0] if positional else '(objectClass=*)')
+    except ValueError as e:
+        print(f"ldapsearch: {e}", file=sys.stderr)
+        return 87
+    base = options.get('b', BASE_DN).lower()
+    sizelimit = int(options.get('z', 0))
+
+    out = sys.stdout
+    returned = 0
+    for entry in load_directory():
+        if not entry['dn'].lower().endswith(base) or not matches(node, entry['attrs']):
+            continue
+        if sizelimit and returned >= sizelimit:
+            print(f"{MESSAGES[SIZELIMIT_EXCEEDED]} ({SIZELIMIT_EXCEEDED})", file=sys.stderr)
+            return SIZELIMIT_EXCEEDED
+        write_entry(out, entry, positional[1:])
+        returned += 1
+    return SUCCESS
+
+
+def iter_ldif_records(text: str):
+    """
+    Yield the records of an LDIF change stream as lists of (name, value) pairs
+    """
+    for block in re.split(r'\n\s*\n', text):
+        lines = [line for line in block.splitlines() if line.strip() and not line.startswith('#')]
+        if lines:
+            yield [(name.strip(), value.strip()) for name, _, value in (line.partition(':') for line in lines)]
+
+
+def apply_record(entries: dict, record: list, rejected: set) -> int:
+    """
+    Apply one "changetype: modify" record with replace operations
+
+    Returns:
+        int: LDAP result code
+    """
+    dn = record[0][1]
+    entry = entries.get(dn.lower())
+    if entry is None:
+        return NO_SUCH_OBJECT
+    if entry['attrs'].get('uid', [''])[0] in rejected:
+        return INSUFFICIENT_ACCESS
+    changes = {}
+    attribute = None
+    for name, value in record[1:]:
+        if name.lower() == 'replace':
+            attribute = value
+            changes[attribute] = []
+        elif name == '-':
+            attribute = None
+        elif attribute is not None and name.lower() == attribute.lower():
+            changes[attribute].append(value)
+    for attribute, values in changes.items():
+        entry['attrs'][attribute] = values
+    entry['attrs']['modifyTimestamp'] = [time.strftime('%Y%m%d%H%M%SZ', time.gmtime())]
+    return SUCCESS
+
+
+def ldapmodify_main(args) -> int:
+    time.sleep(float(os.environ.get('FAKE_LDAP_LATENCY', '0')))
+    options, _ = parse_arguments(args, 'SHYDyf', 'cQx')
+    status = check_bind(options)
+    if status != SUCCESS:
+        return status
+    rejected = {login for login in os.environ.get('FAKE_LDAP_REJECT', '').split(',') if login}
+    records = list(iter_ldif_records(sys.stdin.read()))
+
+    path = os.environ.get('FAKE_LDAP_DIRECTORY')
+    lock = open(f"{path}.lock", 'w') if path else None
+    try:
+        if lock is not None:
+            # Read-modify-write of the directory file, one ldapmodify at a time
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        directory = load_directory()
+        entries = {entry['dn'].lower(): entry for entry in directory}
+        reject_file = open(options['S'], 'a') if 'S' in options else None
+        result = SUCCESS
+        try:
+            for record in records:
+                dn = record[0][1]
+                print(f'modifying entry "{dn}"')
+                code = apply_record(entries, record, rejected)
+                if code != SUCCESS:
+                    result = code
+                    print(f"ldap_modify: {MESSAGES[code]} ({code})", file=sys.stderr)
+                    if reject_file is not None:
+                        reject_file.write(f"# Error: {MESSAGES[code]} ({code})\n")
+                        reject_file.write("\n".join(f"{name}: {value}" if name != '-' else '-'
+                                                    for name, value in record) + "\n\n")
+                    if 'c' not in options:
+                        break
+                print()
+        finally:
+            if reject_file is not None:
+                reject_file.close()
+        if path:
+            save_directory(path, directory)
+        return result
+    finally:
+        if lock is not None:
+            lock.close()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Synthetic FreeIPA directory generator
+
+Emits `ipa user-find --all --raw` or `ipa user-find --all` style output for
+an arbitrary number of users. The output is deterministic for a given seed,
+and every `heavy_every`-th user is a member of `heavy_groups` groups to model
+service and admin accounts with hundreds of memberOf values. Every
+DISABLED_EVERY-th account is disabled (nsAccountLock).
+"""
+
+import sys
+import random
+import argparse
+from datetime import datetime, timedelta
+
+BASE_DN = "dc=example,dc=com"
+FIRST_NAMES = ["Alice", "Bob", "Carol", "David", "Erin", "Frank", "Grace", "Heidi",
+               "Ivan", "Judy", "Mallory", "Niaj", "Olivia", "Peggy", "Rupert", "Sybil"]
+LAST_NAMES = ["Smith", "Jones", "Chen", "Wang", "Garcia", "Muller", "Tanaka", "Kim",
+              "Novak", "Silva", "Rossi", "Dubois", "Ivanova", "Cohen", "Hughes", "Lopez"]
+EPOCH = datetime(2024, 1, 1, 12, 0, 0)
+DISABLED_EVERY = 50
+
+
+def group_names(count: int):
+    """
+    Pool of group names the generated users are members of
+    """
+    return ["ipausers"] + [f"group{index:04d}" for index in range(1, count)]
+
+
+def iter_users(count: int, heavy_every: int = 100, heavy_groups: int = 300, seed: int = 1):
+    """
+    Yield synthetic user dicts
+    
+    Args:
+        count: Number of users to generate
+        heavy_every: Every n-th user gets `heavy_groups` memberships (0 disables)
+        heavy_groups: Number of memberships of the heavy users
+        seed: Random seed, so runs are reproducible
+    
+    Returns:
+        generator: dicts with login, first_name, last_name, uid, email, expiration, groups, disabled
+    """
+    rng = random.Random(seed)
+    groups = group_names(max(heavy_groups, 32))
+    for index in range(count):
+        first = FIRST_NAMES[index % len(FIRST_NAMES)]
+        last = LAST_NAMES[(index // len(FIRST_NAMES)) % len(LAST_NAMES)]
+        login = f"user{index:07d}"
+        if heavy_every and index % heavy_every == heavy_every - 1:
+            member_of = groups[:heavy_groups]
+        else:
+            member_of = ["ipausers"] + rng.sample(groups[1:32], rng.randint(0, 4))
+        expiration = EPOCH + timedelta(days=rng.randint(-365, 730), seconds=rng.randint(0, 86399))
+        yield {
+            'login': login,
+            'first_name': first,
+            'last_name': last,
+            'uid': 100000 + index,
+            'email': f"{login}@example.com",
+            'expiration': expiration.strftime('%Y%m%d%H%M%SZ'),
+            'groups': member_of,
+            'disabled': index % DISABLED_EVERY == DISABLED_EVERY - 1,
+        }
+
+
+def iter_groups(count: int, heavy_every: int = 100, heavy_groups: int = 300, seed: int = 1):
+    """
+    Yield the groups of the directory of iter_users, with their direct members
+    
+    group0001..group0031 are nested as a binary tree: group0002 and group0003
+    are members of group0001, group0004 and group0005 of group0002, and so on.
+    
+    Returns:
+        generator: dicts with name, users (logins) and subgroups (names)
+    """
+    members = {}
+    for user in iter_users(count, heavy_every, heavy_groups, seed):
+        for group in user['groups']:
+            members.setdefault(group, []).append(user['login'])
+    names = group_names(max(heavy_groups, 32))
+    for index, name in enumerate(names):
+        subgroups = [names[child] for child in (2 * index, 2 * index + 1) if index and child < 32]
+        yield {'name': name, 'users': members.get(name, []), 'subgroups': subgroups}
+
+
+def iter_group_lines(count: int, **options):
+    """
+    Yield complete `ipa group-find --all --raw` output lines (without newlines)
+    """
+    groups = list(iter_groups(count, **options))
+    banner = "-" * 16
+    yield banner
+    yield f"{len(groups)} groups matched"
+    yield banner
+    for group in groups:
+        yield f"  dn: cn={group['name']},cn=groups,cn=accounts,{BASE_DN}"
+        yield f"  cn: {group['name']}"
+        for login in group['users']:
+            yield f"  member: uid={login},cn=users,cn=accounts,{BASE_DN}"
+        for subgroup in group['subgroups']:
+            yield f"  member: cn={subgroup},cn=groups,cn=accounts,{BASE_DN}"
+        yield ""
+    yield "-" * 28
+    yield f"Number of entries returned {len(groups)}"
+    yield "-" * 28
+
+
+def iter_raw_lines(users):
+    """
+    Yield `ipa user-find --all --raw` output lines (without newlines)
+    """
+    for user in users:
+        yield f"  dn: uid={user['login']},cn=users,cn=accounts,{BASE_DN}"
+        yield f"  uid: {user['login']}"
+        yield f"  givenName: {user['first_name']}"
+        yield f"  sn: {user['last_name']}"
+        yield f"  cn: {user['first_name']} {user['last_name']}"
+        yield f"  uidNumber: {user['uid']}"
+        yield f"  gidNumber: {user['uid']}"
+        yield f"  mail: {user['email']}"
+        yield f"  homeDirectory: /home/{user['login']}"
+        yield "  loginShell: /bin/bash"
+        yield f"  krbPrincipalName: {user['login']}@EXAMPLE.COM"
+        yield f"  krbPasswordExpiration: {user['expiration']}"
+        for group in user['groups']:
+            yield f"  memberOf: cn={group},cn=groups,cn=accounts,{BASE_DN}"
+        yield f"  modifyTimestamp: {user['expiration']}"
+        yield ""
+
+
+def iter_standard_lines(users):
+    """
+    Yield `ipa user-find --all` (non --raw) output lines (without newlines)
+    """
+    for user in users:
+        yield f"  dn: uid={user['login']},cn=users,cn=accounts,{BASE_DN}"
+        yield f"  User login: {user['login']}"
+        yield f"  First name: {user['first_name']}"
+        yield f"  Last name: {user['last_name']}"
+        yield f"  Full name: {user['first_name']} {user['last_name']}"
+        yield f"  Home directory: /home/{user['login']}"
+        yield "  Login shell: /bin/bash"
+        yield f"  Principal name: {user['login']}@EXAMPLE.COM"
+        yield f"  Email address: {user['email']}"
+        yield f"  UID: {user['uid']}"
+        yield f"  GID: {user['uid']}"
+        yield f"  User password expiration: {user['expiration']}"
+        yield f"  Account disabled: {user['disabled']}"
+        yield f"  Member of groups: {', '.join(user['groups'])}"
+        yield ""
+
+
+def iter_output_lines(count: int, output_format: str = 'raw', **options):
+    """
+    Yield complete user-find output, including the header and footer lines
+    
+    Args:
+        count: Number of users
+        output_format: 'raw' or 'standard'
+        **options: Passed on to iter_users
+    
+    Returns:
+        generator: output lines (without newlines)
+    """
+    users = iter_users(count, **options)
+    banner = "-" * 15
+    yield banner
+    yield f"{count} users matched"
+    yield banner
+    if output_format == 'raw':
+        yield from iter_raw_lines(users)
+    else:
+        yield from iter_standard_lines(users)
+    yield "-" * 28
+    yield f"Number of entries returned {count}"
+    yield "-" * 28
+
+
+def generate(count: int, output_format: str = 'raw', **options) -> str:
+    """
+    Return complete user-find output for `count` users as one string
+    """
+    return '\n'.join(iter_output_lines(count, output_format, **options)) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic ipa user-find output')
+    parser.add_argument('count', type=int, help='Number of users')
+    parser.add_argument('--format', choices=['raw', 'standard'], default='raw',
+                        help='Output format (default: raw)')
+    parser.add_argument('--heavy-every', type=int, default=100,
+                        help='Every n-th user gets --heavy-groups memberships (default: 100, 0 disables)')
+    parser.add_argument('--heavy-groups', type=int, default=300,
+                        help='Memberships of the heavy users (default: 300)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed (default: 1)')
+    parser.add_argument('--output', '-o', help='Write to this file instead of stdout')
+    args = parser.parse_args()
+    
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for line in iter_output_lines(args.count, args.format, heavy_every=args.heavy_every,
+                                      heavy_groups=args.heavy_groups, seed=args.seed):
+            out.write(line + '\n')
+    except BrokenPipeError:
+        pass
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
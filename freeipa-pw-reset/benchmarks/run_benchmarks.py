@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for freeipa_password_reset.py
+
+Measures:
+    parse       Throughput and peak memory of parse_structured_output (--raw)
+                and parse_standard_output on synthetic directories
+    enumerate   End-to-end --list-only against the fake ipa binary
+    batch       End-to-end batch modification users/sec against the fake ipa
+                binary, sequential, with a worker pool and with failures/retries
+    replicas    JSON-RPC batch modification users/sec against one stand-in
+                server, and spread over three stand-in replicas
+    ldap        End-to-end --list-only and batch modification over the ldap
+                backend against the fake ldapsearch/ldapmodify binaries
+
+Results are compared with the stored baselines (baselines.json next to this
+file); a metric that is worse than its baseline by more than the tolerance
+is reported as a regression and makes the run exit with status 1.
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+import subprocess
+import tracemalloc
+from typing import Dict, List, NamedTuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+TOOL_DIR = os.path.dirname(BENCH_DIR)
+TOOL = os.path.join(TOOL_DIR, 'freeipa_password_reset.py')
+FAKE_IPA = os.path.join(BENCH_DIR, 'fake_ipa')
+FAKE_LDAP_TOOLS = ('ldapsearch', 'ldapmodify')
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baselines.json')
+
+sys.path.insert(0, TOOL_DIR)
+sys.path.insert(0, BENCH_DIR)
+from freeipa_password_reset import FreeIPAPasswordReset, UserTable
+from generate_users import generate
+from fake_ipa_server import start_servers
+
+
+class Metric(NamedTuple):
+    """
+    One measured value; higher_is_better decides the direction of a regression
+    """
+    benchmark: str
+    name: str
+    value: float
+    unit: str
+    higher_is_better: bool = True
+
+
+def parse_benchmark(output_format: str, count: int, repeat: int) -> List[Metric]:
+    """
+    Time and memory-profile one parser on a synthetic directory of `count` users
+    """
+    data = generate(count, output_format)
+    tool = FreeIPAPasswordReset()
+    parse = tool.parse_structured_output if output_format == 'raw' else tool.parse_standard_output
+    
+    best = float('inf')
+    for _ in range(repeat):
+        tool.users_data = UserTable()
+        gc.collect()
+        started = time.perf_counter()
+        parse(data)
+        best = min(best, time.perf_counter() - started)
+    parsed = len(tool.users_data)
+    if parsed != count:
+        print(f"Warning: {output_format} parser returned {parsed} of {count} users")
+    
+    # Separate run: tracemalloc slows allocation down considerably
+    tool.users_data = UserTable()
+    gc.collect()
+    tracemalloc.start()
+    parse(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    tool.users_data = UserTable()
+    
+    name = f"parse_{output_format}[{count}]"
+    return [
+        Metric(name, 'users_per_sec', count / best, 'users/s'),
+        Metric(name, 'mb_per_sec', len(data) / best / 1e6, 'MB/s'),
+        Metric(name, 'peak_mb', peak / 1e6, 'MB', higher_is_better=False),
+    ]
+
+
+def fake_ipa_path() -> str:
+    """
+    Create a directory containing the fake binaries as `ipa`, `ldapsearch` and `ldapmodify`, to prepend to PATH
+    """
+    directory = tempfile.mkdtemp(prefix='fake-ipa-')
+    os.symlink(FAKE_IPA, os.path.join(directory, 'ipa'))
+    for tool in FAKE_LDAP_TOOLS:
+        os.symlink(os.path.join(BENCH_DIR, f"fake_{tool}"), os.path.join(directory, tool))
+    return directory
+
+
+def run_tool(arguments: List[str], env: Dict[str, str]) -> float:
+    """
+    Run the tool with output discarded and return the wall-clock time
+    """
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, TOOL] + arguments, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(arguments)} exited with {result.returncode}: {result.stderr.strip()}")
+    return elapsed
+
+
+def enumerate_benchmark(count: int, fake_bin: str, repeat: int) -> List[Metric]:
+    """
+    End-to-end --list-only of `count` users from the fake ipa binary
+    """
+    env = dict(os.environ, PATH=fake_bin + os.pathsep + os.environ.get('PATH', ''),
+               FAKE_IPA_USERS=str(count))
+    best = min(run_tool(['--list-only', '--no-cache'], env) for _ in range(repeat))
+    return [Metric(f"enumerate[{count}]", 'users_per_sec', count / best, 'users/s')]
+
+
+BATCH_SCENARIOS = [
+    # name, tool arguments, fake ipa environment
+    ('sequential', ['--workers', '1'], {}),
+    ('workers8', ['--workers', '8'], {}),
+    ('adaptive16-busy5', ['--workers', '16', '--adaptive', '--retry-backoff', '0.05'],
+     {'FAKE_IPA_BUSY_RATE': '0.05'}),
+]
+
+
+def batch_benchmark(count: int, latency: float, fake_bin: str) -> List[Metric]:
+    """
+    End-to-end batch modification of `count` users for every scenario
+    """
+    metrics = []
+    for scenario, arguments, extra_env in BATCH_SCENARIOS:
+        env = dict(os.environ, PATH=fake_bin + os.pathsep + os.environ.get('PATH', ''),
+                   FAKE_IPA_USERS=str(count), FAKE_IPA_LATENCY=str(latency), **extra_env)
+        elapsed = run_tool(['--users', 'user*', '--expiration', '2030-12-31T12:00:00Z',
+                            '--no-cache'] + arguments, env)
+        metrics.append(Metric(f"batch_{scenario}[{count}]", 'users_per_sec', count / elapsed, 'users/s'))
+    return metrics
+
+
+def replicas_benchmark(count: int, latency: float) -> List[Metric]:
+    """
+    JSON-RPC writes to a single stand-in server versus three stand-in replicas
+    
+    Each scenario gets a directory of its own: preflight drops users that
+    already expire at the target date, so a second run on the same data
+    would have nothing left to write.
+    """
+    env = dict(os.environ, IPA_PASSWORD='benchmark')
+    metrics = []
+    for scenario, replicas in (('single', 1), ('three', 3)):
+        servers = start_servers([0] * replicas, users=count, latency=latency, call_latency=latency / 20)
+        try:
+            urls = [server.url for server in servers]
+            elapsed = run_tool(['--backend', 'jsonrpc', '--server', urls[0], '--batch-size', '10', '--workers', '12',
+                                '--users', 'user*', '--expiration', '2030-12-31T12:00:00Z', '--no-cache',
+                                '--replicas', ','.join(urls), '--replica-concurrency', '4'], env)
+        finally:
+            for server in servers:
+                server.shutdown()
+                server.server_close()
+        metrics.append(Metric(f"replicas_{scenario}[{count}]", 'users_per_sec', count / elapsed, 'users/s'))
+    return metrics
+
+
+def ldap_benchmark(count: int, batch_users: int, fake_bin: str, repeat: int) -> List[Metric]:
+    """
+    End-to-end --list-only of `count` users and batch modification of `batch_users` over the ldap backend
+    """
+    directory = tempfile.mkdtemp(prefix='fake-ldap-')
+    try:
+        env = dict(os.environ, PATH=fake_bin + os.pathsep + os.environ.get('PATH', ''),
+                   FAKE_LDAP_USERS=str(count), FAKE_LDAP_DIRECTORY=os.path.join(directory, 'directory.json'))
+        common = ['--backend', 'ldap', '--ldap-uri', 'ldap://fake', '--base-dn', 'dc=example,dc=com', '--no-cache']
+        # The first call writes the directory file; keep that out of the timings
+        run_tool(common + ['--list-only', '--users', 'user0000000'], env)
+        listing = min(run_tool(common + ['--list-only'], env) for _ in range(repeat))
+        logins = ','.join(f"user{index:07d}" for index in range(min(batch_users, count)))
+        batch = run_tool(common + ['--users', logins, '--expiration', '2030-12-31T12:00:00Z', '--workers', '4',
+                                   '--batch-size', '50'], env)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return [
+        Metric(f"ldap_enumerate[{count}]", 'users_per_sec', count / listing, 'users/s'),
+        Metric(f"ldap_batch[{count}]", 'users_per_sec', min(batch_users, count) / batch, 'users/s'),
+    ]
+
+
+def load_baselines(path: str) -> Dict[str, Dict[str, float]]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f).get('results', {})
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(path: str, metrics: List[Metric]):
+    """
+    Merge the results into the baseline file, keeping benchmarks not run this time
+    """
+    results = load_baselines(path)
+    for metric in metrics:
+        results.setdefault(metric.benchmark, {})[metric.name] = round(metric.value, 3)
+    document = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'recorded': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'results': results,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def report(metrics: List[Metric], baselines: Dict[str, Dict[str, float]], tolerance: float) -> int:
+    """
+    Print the results next to their baselines
+    
+    Returns:
+        int: Number of regressions beyond the tolerance
+    """
+    regressions = 0
+    print(f"{'Benchmark':<32} {'Metric':<14} {'Value':>12} {'Baseline':>12} {'Change':>8}")
+    print("-" * 82)
+    for metric in metrics:
+        baseline = baselines.get(metric.benchmark, {}).get(metric.name)
+        line = f"{metric.benchmark:<32} {metric.name:<14} {metric.value:>12.1f}"
+        if baseline:
+            change = metric.value / baseline - 1
+            worse = -change if metric.higher_is_better else change
+            flag = ""
+            if worse > tolerance:
+                flag = "  REGRESSION"
+                regressions += 1
+            line += f" {baseline:>12.1f} {change:>+7.0%}{flag}"
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark freeipa_password_reset.py')
+    parser.add_argument('--only', choices=['parse', 'enumerate', 'batch', 'replicas', 'ldap'], action='append',
+                        help='Run only these benchmark groups (repeatable)')
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='Comma separated directory sizes for parse/enumerate/ldap (default: 1000,10000,100000; '
+                             'add 1000000 for the large run)')
+    parser.add_argument('--batch-users', type=int, default=200,
+                        help='Users modified per batch scenario (default: 200)')
+    parser.add_argument('--latency', type=float, default=0.1,
+                        help='Simulated ipa latency per call in seconds for batch runs (default: 0.1)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Repetitions per timing, best is kept (default: 3)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='Baseline file (default: benchmarks/baselines.json)')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed relative slowdown before a regression is reported (default: 0.25)')
+    args = parser.parse_args()
+    
+    groups = args.only or ['parse', 'enumerate', 'batch', 'replicas', 'ldap']
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    metrics: List[Metric] = []
+    
+    fake_bin = fake_ipa_path()
+    try:
+        if 'parse' in groups:
+            for count in sizes:
+                for output_format in ('raw', 'standard'):
+                    print(f"parse {output_format} {count} users...", file=sys.stderr)
+                    metrics.extend(parse_benchmark(output_format, count, args.repeat))
+        if 'enumerate' in groups:
+            for count in sizes:
+                print(f"enumerate {count} users...", file=sys.stderr)
+                metrics.extend(enumerate_benchmark(count, fake_bin, args.repeat))
+        if 'batch' in groups:
+            print(f"batch {args.batch_users} users...", file=sys.stderr)
+            metrics.extend(batch_benchmark(args.batch_users, args.latency, fake_bin))
+        if 'replicas' in groups:
+            print(f"replicas {args.batch_users * 5} users...", file=sys.stderr)
+            metrics.extend(replicas_benchmark(args.batch_users * 5, args.latency))
+        if 'ldap' in groups:
+            for count in sizes:
+                print(f"ldap {count} users...", file=sys.stderr)
+                metrics.extend(ldap_benchmark(count, args.batch_users, fake_bin, args.repeat))
+    finally:
+        shutil.rmtree(fake_bin, ignore_errors=True)
+    
+    regressions = report(metrics, load_baselines(args.baseline), args.tolerance)
+    
+    if args.save_baseline:
+        save_baselines(args.baseline, metrics)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif regressions:
+        print(f"\n{regressions} regression(s) beyond {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
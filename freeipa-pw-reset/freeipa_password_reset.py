@@ -5,19 +5,3469 @@ FreeIPA User Password Expiration Reset Tool
 CLI tool for automated management of FreeIPA user password expiration times
 """
 
-import subprocess
 import sys
+import asyncio
+import concurrent.futures
+import atexit
+import base64
+import tempfile
 import re
 import os
+import stat
 import shutil
+import random
+import math
+import calendar
+import bisect
+import fnmatch
+import itertools
+import operator
+import hashlib
+import mmap
+import multiprocessing
+import sqlite3
+import threading
+import time
+import json
+import ssl
+import queue
+import getpass
+import configparser
+import signal
+import socket
+import socketserver
+import contextlib
+import csv
+import io
+import http.client
+import http.cookies
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from array import array
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, NamedTuple, Tuple, Union
 import argparse
 
+try:
+    import curses
+except ImportError:
+    # Not built into every Python (e.g. some minimal or frozen builds); the browser falls back to line mode
+    curses = None
+
+
+class ModifyResult(NamedTuple):
+    """
+    Outcome of a single password expiration modification
+    """
+    username: str
+    expiration: str
+    success: bool
+    error: str
+    latency: float
+    attempts: int = 1
+
+
+TRANSIENT_ERROR_PATTERN = re.compile(
+    r'timeout|timed out|busy|connection (?:reset|aborted|refused)|broken pipe|'
+    r'temporarily unavailable|try again|service unavailable|\b50[234]\b|'
+    r"can't contact ldap server|\((?:51|52)\)|network error",
+    re.IGNORECASE)
+
+
+def is_transient_error(message: str) -> bool:
+    """
+    True if a failure looks like server overload or a network glitch that is worth retrying
+    """
+    return bool(message) and TRANSIENT_ERROR_PATTERN.search(message) is not None
+
+
+def classify_error(message: str) -> str:
+    """
+    Coarse error class for metrics (transient, timeout, not_found, permission, cancelled, other)
+    """
+    lowered = (message or "").lower()
+    if 'cancelled' in lowered:
+        return 'cancelled'
+    if 'timeout' in lowered or 'timed out' in lowered:
+        return 'timeout'
+    if is_transient_error(message):
+        return 'transient'
+    if 'not found' in lowered or 'no such' in lowered:
+        return 'not_found'
+    if 'insufficient' in lowered or 'denied' in lowered or 'unauthorized' in lowered or 'credentials' in lowered:
+        return 'permission'
+    return 'other'
+
+
+def abbreviate_list(names: List[str], limit: int = 10) -> str:
+    """
+    Comma separated names, cut off after `limit` with a count of the rest
+    """
+    text = ', '.join(names[:limit])
+    if len(names) > limit:
+        text += f" ... and {len(names) - limit} more"
+    return text
+
+
+def command_label(argv: List[str]) -> str:
+    """
+    Short metrics label for a command line, e.g. "ipa user-mod" or "ldapmodify"
+    """
+    program = os.path.basename(argv[0]) if argv else ""
+    if program == 'ipa' and len(argv) > 1:
+        return f"ipa {argv[1]}"
+    return program
+
+
+class Histogram:
+    """
+    Latency histogram with fixed Prometheus-style buckets (seconds)
+    """
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+    
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+    
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+    
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile by linear interpolation inside its bucket
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.BUCKETS[index - 1] if index > 0 else 0.0
+                upper = self.BUCKETS[index] if index < len(self.BUCKETS) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / bucket_count)
+            seen += bucket_count
+        return self.max
+    
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else 0.0,
+            'p50': round(self.quantile(0.5), 6),
+            'p95': round(self.quantile(0.95), 6),
+            'p99': round(self.quantile(0.99), 6),
+            'max': round(self.max, 6),
+        }
+
+
+class Metrics:
+    """
+    Thread-safe per-phase timings, counters and byte counts for one run
+    
+    Phases are timed into histograms keyed by (phase, label), e.g.
+    ("command", "ipa user-mod") or ("parse", "structured"). Counters are keyed
+    by (name, label). The result can be written as a JSON summary (--stats)
+    or a Prometheus textfile-collector file (--prometheus-textfile).
+    """
+    PREFIX = 'freeipa_pw_reset'
+    
+    # Prometheus label name used for the label of each counter
+    COUNTER_LABELS = {
+        'errors': 'class',
+        'bytes_read': 'source',
+        'modifications': 'result',
+        'users': 'source',
+        'retries': 'backend',
+        'replica_users': 'replica',
+        'parse_problems': 'source',
+        'preflight_skipped': 'reason',
+    }
+    
+    def __init__(self):
+        self.started = time.time()
+        self._clock = time.monotonic()
+        self._lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.counters: Dict[Tuple[str, str], float] = {}
+    
+    def observe(self, phase: str, seconds: float, label: str = ""):
+        """
+        Record one duration of a phase
+        """
+        with self._lock:
+            histogram = self.histograms.get((phase, label))
+            if histogram is None:
+                histogram = self.histograms[(phase, label)] = Histogram()
+            histogram.observe(seconds)
+    
+    def count(self, name: str, value: float = 1, label: str = ""):
+        """
+        Add to a counter
+        """
+        with self._lock:
+            self.counters[(name, label)] = self.counters.get((name, label), 0) + value
+    
+    def error(self, message: str):
+        """
+        Count one error (every failed attempt, including retried ones) under its class
+        """
+        self.count('errors', label=classify_error(message))
+    
+    def timed(self, phase: str, label: str = ""):
+        """
+        Context manager timing the enclosed block as one observation of a phase
+        """
+        metrics = self
+        
+        class Timer:
+            def __enter__(self):
+                self.started = time.perf_counter()
+                return self
+            
+            def __exit__(self, *exc_info):
+                metrics.observe(phase, time.perf_counter() - self.started, label)
+                return False
+        
+        return Timer()
+    
+    def to_dict(self) -> dict:
+        """
+        JSON-serialisable summary of everything recorded so far
+        """
+        with self._lock:
+            phases: Dict[str, dict] = {}
+            for (phase, label), histogram in sorted(self.histograms.items()):
+                phases.setdefault(phase, {})[label or 'all'] = histogram.summary()
+            counters: Dict[str, dict] = {}
+            for (name, label), value in sorted(self.counters.items()):
+                counters.setdefault(name, {})[label or 'all'] = value
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.started)),
+            'duration': round(time.monotonic() - self._clock, 6),
+            'phases': phases,
+            'counters': counters,
+        }
+    
+    def write_json(self, path: str):
+        """
+        Write the JSON summary to a file, or to stderr when path is "-"
+        """
+        document = json.dumps(self.to_dict(), indent=2, sort_keys=True)
+        if path == '-':
+            print(document, file=sys.stderr)
+            return
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(document + '\n')
+    
+    @staticmethod
+    def _escape_label(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    
+    def prometheus_text(self) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format
+        """
+        prefix = self.PREFIX
+        lines = [
+            f"# HELP {prefix}_phase_seconds Time spent per phase of a run",
+            f"# TYPE {prefix}_phase_seconds histogram",
+        ]
+        with self._lock:
+            for (phase, label), histogram in sorted(self.histograms.items()):
+                labels = f'phase="{self._escape_label(phase)}",kind="{self._escape_label(label)}"'
+                cumulative = 0
+                for bound, bucket_count in zip(Histogram.BUCKETS, histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{prefix}_phase_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_phase_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f'{prefix}_phase_seconds_sum{{{labels}}} {histogram.sum:.6f}')
+                lines.append(f'{prefix}_phase_seconds_count{{{labels}}} {histogram.count}')
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                label_name = self.COUNTER_LABELS.get(name, 'kind')
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                for (counter, label), value in sorted(self.counters.items()):
+                    if counter == name:
+                        lines.append(f'{prefix}_{name}_total{{{label_name}="{self._escape_label(label)}"}} {value:g}')
+        lines.append(f"# TYPE {prefix}_last_run_timestamp_seconds gauge")
+        lines.append(f"{prefix}_last_run_timestamp_seconds {self.started:.0f}")
+        lines.append(f"# TYPE {prefix}_last_run_duration_seconds gauge")
+        lines.append(f"{prefix}_last_run_duration_seconds {time.monotonic() - self._clock:.6f}")
+        return '\n'.join(lines) + '\n'
+    
+    def write_prometheus(self, path: str):
+        """
+        Atomically replace a node exporter textfile-collector file
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temporary = tempfile.mkstemp(prefix='.freeipa-pw-reset-', suffix='.prom.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(self.prometheus_text())
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            try:
+                os.unlink(temporary)
+            except OSError:
+                pass
+            raise
+
+
+class AdaptiveLimiter:
+    """
+    AIMD limit on the number of operations in flight
+    
+    Each success whose latency stays within `tolerance` times the best latency
+    seen grows the limit by 1/limit (about +1 per round of operations); a
+    transient error or a latency spike halves it, at most once per round.
+    The limit stays between `minimum` and `maximum`.
+    """
+    
+    def __init__(self, maximum: int, initial: Optional[int] = None, minimum: int = 1,
+                 tolerance: float = 3.0):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.limit = float(initial if initial is not None else min(self.maximum, 4))
+        self.limit = min(max(self.limit, self.minimum), self.maximum)
+        self.tolerance = tolerance
+        self.in_flight = 0
+        self.best_latency = math.inf
+        self.lowest_limit = self.limit
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._closed = False
+        self._condition = threading.Condition()
+    
+    def acquire(self) -> bool:
+        """
+        Wait for a free slot; returns False if the limiter was closed
+        """
+        with self._condition:
+            while not self._closed and self.in_flight >= int(self.limit):
+                self._condition.wait()
+            if self._closed:
+                return False
+            self.in_flight += 1
+            return True
+    
+    def release(self, latency: float, overloaded: bool) -> Optional[int]:
+        """
+        Return a slot and adapt the limit
+        
+        Args:
+            latency: Duration of the operation
+            overloaded: True if it failed with a transient (server/network) error
+            
+        Returns:
+            int: The new limit if it was decreased, else None
+        """
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            decreased = None
+            spike = self.best_latency < math.inf and latency > self.best_latency * self.tolerance
+            if not overloaded:
+                self.best_latency = min(self.best_latency, latency)
+            
+            if overloaded or spike:
+                # One decrease per round trip, so a burst of failures counts once
+                if now - self._last_decrease > latency:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self.lowest_limit = min(self.lowest_limit, self.limit)
+                    self.decreases += 1
+                    self._last_decrease = now
+                    decreased = int(self.limit)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+            return decreased
+    
+    def close(self):
+        """
+        Wake up and reject all waiters (used when the run is interrupted)
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+def read_ipa_default_conf(path: str = "/etc/ipa/default.conf") -> Dict[str, str]:
+    """
+    Read the [global] section of the local IPA client configuration
+    
+    Returns:
+        dict: Configuration values (empty if the file is missing or unreadable)
+    """
+    parser = configparser.ConfigParser(interpolation=None)
+    try:
+        parser.read(path)
+    except configparser.Error:
+        return {}
+    if not parser.has_section('global'):
+        return {}
+    return dict(parser.items('global'))
+
+
+class StreamBuffer:
+    """
+    Lines handed from the executor's event loop to the thread iterating a CommandStream
+    
+    At most `size` lines wait in the buffer. When it is full, put() waits on
+    the loop for the consumer; the pipe is then read only until the stream
+    reader's own buffer is full, and the command blocks on its full pipe
+    instead of its output piling up in memory. The wait is cancellable like
+    any other await, so killing the command never leaves a thread blocked on
+    the buffer.
+    """
+    
+    def __init__(self, loop: asyncio.AbstractEventLoop, size: int):
+        self._loop = loop
+        self._size = max(1, size)
+        self._lines: queue.Queue = queue.Queue()
+        # Lines put and not yet reported as taken (event loop side)
+        self._pending = 0
+        self._space = None
+        # Lines taken and not yet reported; reported in batches to keep wakeups of the loop rare
+        self._taken = 0
+        self._report_every = max(1, self._size // 4)
+    
+    async def put(self, line: str):
+        """
+        Add a line, waiting while the buffer is full (event loop side)
+        """
+        while self._pending >= self._size:
+            if self._space is None:
+                # Created here so that it belongs to the executor's loop
+                self._space = asyncio.Event()
+            self._space.clear()
+            await self._space.wait()
+        self._pending += 1
+        self._lines.put(line)
+    
+    def close(self):
+        """
+        Mark the end of the output (event loop side, never waits)
+        """
+        self._lines.put(None)
+    
+    def _free(self, count: int):
+        self._pending -= count
+        if self._space is not None:
+            self._space.set()
+    
+    def get(self) -> Optional[str]:
+        """
+        Next line, or None at the end of the output (consumer side)
+        """
+        line = self._lines.get()
+        if line is not None:
+            self._taken += 1
+            if self._taken >= self._report_every:
+                self._loop.call_soon_threadsafe(self._free, self._taken)
+                self._taken = 0
+        return line
+
+
+class AsyncCommandExecutor:
+    """
+    Run external commands on an asyncio event loop in a background thread
+    
+    Commands are argv lists launched directly (no shell). A semaphore bounds
+    how many run at once, every call has its own timeout, stdout can be
+    streamed line by line, and cancel_all() kills everything in flight (used
+    on Ctrl-C). The synchronous API can be called from any thread.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+    
+    # Longest single output line accepted (certificates in --all output are long)
+    LINE_LIMIT = 16 * 1024 * 1024
+    
+    def __init__(self, max_concurrency: int = 8):
+        self.max_concurrency = max(1, max_concurrency)
+        self._loop = None
+        self._semaphore = None
+        self._tasks = {}
+        self._start_lock = threading.Lock()
+        self.metrics: Optional[Metrics] = None
+    
+    @classmethod
+    def shared(cls) -> 'AsyncCommandExecutor':
+        """
+        Process-wide default executor for callers that were not given one
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+    
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+                
+                def run():
+                    asyncio.set_event_loop(loop)
+                    self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+                
+                threading.Thread(target=run, name='command-executor', daemon=True).start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+    
+    def _submit(self, coroutine) -> concurrent.futures.Future:
+        key = object()
+        
+        async def tracked():
+            self._tasks[key] = asyncio.current_task()
+            try:
+                return await coroutine
+            finally:
+                del self._tasks[key]
+        future = asyncio.run_coroutine_threadsafe(tracked(), self._ensure_loop())
+        future.key = key
+        return future
+    
+    def _cancel(self, future: concurrent.futures.Future, wait: float = 5.0):
+        """
+        Cancel one submitted command and wait (up to `wait` seconds) for its process to be killed
+        
+        Cancelling the future alone returns at once, before the process is killed and reaped.
+        """
+        async def cancel():
+            task = self._tasks.get(future.key)
+            if task is None:
+                # Not started yet (or already finished): nothing to kill
+                future.cancel()
+                return
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        
+        try:
+            asyncio.run_coroutine_threadsafe(cancel(), self._loop).result(wait)
+        except (concurrent.futures.TimeoutError, concurrent.futures.CancelledError):
+            pass
+    
+    @staticmethod
+    async def _terminate(process):
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+    
+    def _observe(self, argv: List[str], queued: float, started: float, spawned: float, read: int):
+        if self.metrics is not None:
+            label = command_label(argv)
+            self.metrics.observe('command_queue', started - queued, label)
+            self.metrics.observe('command_spawn', spawned - started, label)
+            self.metrics.observe('command', time.perf_counter() - spawned, label)
+            self.metrics.count('bytes_read', read, 'command')
+    
+    async def _run(self, argv: List[str], input_data: Optional[str], timeout: Optional[float]) -> tuple:
+        queued = time.perf_counter()
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *argv,
+                    stdin=asyncio.subprocess.PIPE if input_data is not None else asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE)
+            except OSError as e:
+                return 1, "", str(e)
+            spawned = time.perf_counter()
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    process.communicate(input_data.encode() if input_data is not None else None), timeout)
+            except asyncio.TimeoutError:
+                await self._terminate(process)
+                return 1, "", "Command execution timeout"
+            except asyncio.CancelledError:
+                await self._terminate(process)
+                raise
+            self._observe(argv, queued, started, spawned, len(stdout) + len(stderr))
+            return (process.returncode, stdout.decode('utf-8', errors='replace'),
+                    stderr.decode('utf-8', errors='replace'))
+    
+    async def _stream(self, argv: List[str], sink: StreamBuffer, timeout: Optional[float]) -> tuple:
+        queued = time.perf_counter()
+        read = 0
+        try:
+            async with self._semaphore:
+                started = time.perf_counter()
+                try:
+                    process = await asyncio.create_subprocess_exec(
+                        *argv, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+                        stderr=asyncio.subprocess.PIPE, limit=self.LINE_LIMIT)
+                except OSError as e:
+                    return 1, str(e)
+                spawned = time.perf_counter()
+                stderr_task = asyncio.ensure_future(process.stderr.read())
+                
+                async def pump():
+                    nonlocal read
+                    while True:
+                        line = await process.stdout.readline()
+                        if not line:
+                            break
+                        read += len(line)
+                        await sink.put(line.decode('utf-8', errors='replace'))
+                    return await process.wait()
+                
+                try:
+                    return_code = await asyncio.wait_for(pump(), timeout)
+                except asyncio.TimeoutError:
+                    await self._terminate(process)
+                    stderr_task.cancel()
+                    return 1, "Command execution timeout"
+                except (asyncio.CancelledError, ValueError):
+                    # ValueError: line longer than LINE_LIMIT
+                    await self._terminate(process)
+                    stderr_task.cancel()
+                    raise
+                stderr = await stderr_task
+                self._observe(argv, queued, started, spawned, read + len(stderr))
+                return return_code, stderr.decode('utf-8', errors='replace')
+        finally:
+            sink.close()
+    
+    def run(self, argv: List[str], input: Optional[str] = None, timeout: Optional[float] = None) -> tuple:
+        """
+        Run a command to completion
+        
+        Returns:
+            tuple: (return_code, stdout, stderr)
+        """
+        try:
+            return self._submit(self._run(list(argv), input, timeout)).result()
+        except concurrent.futures.CancelledError:
+            return 1, "", "Command cancelled"
+    
+    def stream(self, argv: List[str], timeout: Optional[float] = None) -> 'CommandStream':
+        """
+        Start a command whose stdout will be iterated line by line
+        """
+        return CommandStream(argv, executor=self, timeout=timeout)
+    
+    def cancel_all(self, wait: float = 5.0):
+        """
+        Cancel every command in flight and wait (up to `wait` seconds) for the processes to be killed
+        """
+        if self._loop is None:
+            return
+        
+        async def cancel():
+            tasks = [task for task in self._tasks.values() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        try:
+            asyncio.run_coroutine_threadsafe(cancel(), self._loop).result(wait)
+        except (concurrent.futures.TimeoutError, concurrent.futures.CancelledError):
+            pass
+
+
+class CommandStream:
+    """
+    Iterate over the stdout of a command line by line as it arrives
+    
+    The command runs on an AsyncCommandExecutor; return_code and stderr are
+    available once iteration is done. Stopping iteration early kills the
+    command. Output that the consumer has not read yet is buffered up to
+    BUFFER_LINES lines; beyond that the command waits for the consumer.
+    """
+    BUFFER_LINES = 4096
+    
+    def __init__(self, argv: List[str], executor: Optional[AsyncCommandExecutor] = None,
+                 timeout: Optional[float] = None):
+        self.argv = list(argv)
+        self.executor = executor or AsyncCommandExecutor.shared()
+        self.timeout = timeout
+        self.return_code = None
+        self.stderr = ""
+    
+    def __iter__(self):
+        sink = StreamBuffer(self.executor._ensure_loop(), self.BUFFER_LINES)
+        future = self.executor._submit(self.executor._stream(self.argv, sink, self.timeout))
+        finished = False
+        try:
+            while True:
+                line = sink.get()
+                if line is None:
+                    finished = True
+                    break
+                yield line
+        finally:
+            if not finished and not future.done():
+                # Consumer stopped early: do not leave the command running
+                # (after the end of output the command is only being reaped)
+                self.executor._cancel(future)
+            try:
+                self.return_code, self.stderr = future.result()
+            except concurrent.futures.CancelledError:
+                self.return_code, self.stderr = 1, "Command cancelled"
+            except ValueError as e:
+                self.return_code, self.stderr = 1, str(e)
+
+
+def rdn_value(dn: str) -> str:
+    """
+    Return the value of the first RDN of a DN (e.g. 'admins' for 'cn=admins,cn=groups,...')
+    """
+    first = dn.split(',', 1)[0]
+    return first.split('=', 1)[1].strip() if '=' in first else first.strip()
+
+
+def user_from_entry(entry: Dict[str, list]) -> Dict[str, str]:
+    """
+    Convert a raw IPA/LDAP entry (attribute -> list of values) into a user record
+    """
+    attrs = {key.lower(): value for key, value in entry.items()}
+    
+    def first(name):
+        value = attrs.get(name)
+        if isinstance(value, (list, tuple)):
+            value = value[0] if value else None
+        if isinstance(value, dict):
+            # Non-raw JSON-RPC output wraps timestamps as {"__datetime__": "..."}
+            value = next(iter(value.values()), None)
+        return None if value is None else str(value)
+    
+    user = {}
+    for field, attr in (('login', 'uid'), ('first_name', 'givenname'), ('last_name', 'sn'),
+                        ('uid', 'uidnumber'), ('email', 'mail'),
+                        ('password_expiration', 'krbpasswordexpiration'),
+                        ('modify_timestamp', 'modifytimestamp')):
+        value = first(attr)
+        if value is not None:
+            user[field] = value
+    
+    groups = attrs.get('memberof') or []
+    if isinstance(groups, str):
+        groups = [groups]
+    group_names = tuple(rdn_value(dn) for dn in groups
+                        if dn.lower().startswith('cn=') and ',cn=groups,' in dn.lower())
+    if group_names:
+        user['groups'] = group_names
+    return user
+
+
+def split_groups(value) -> tuple:
+    """
+    Group names of a user record, whether kept as a tuple or as an "a, b" string
+    """
+    if not value:
+        return ()
+    if isinstance(value, str):
+        return tuple(group for group in (name.strip() for name in value.split(',')) if group)
+    return tuple(value)
+
+
+class JsonRpcError(Exception):
+    """
+    Error returned by the IPA JSON-RPC API or raised while talking to it
+    """
+
+
+class UserRecord:
+    """
+    Lightweight view of one row of a UserTable
+    
+    Supports the dict-style access the rest of the tool uses (user['login'],
+    user.get('email', 'N/A')) without materializing a dict per user.
+    """
+    __slots__ = ('table', 'index')
+    
+    def __init__(self, table: 'UserTable', index: int):
+        self.table = table
+        self.index = index
+    
+    def get(self, field: str, default=None):
+        value = self.table.value(self.index, field)
+        return default if value is None else value
+    
+    def __getitem__(self, field: str):
+        value = self.table.value(self.index, field)
+        if value is None:
+            raise KeyError(field)
+        return value
+    
+    def __contains__(self, field: str) -> bool:
+        return self.table.value(self.index, field) is not None
+    
+    @property
+    def group_names(self) -> tuple:
+        return self.table.groups[self.index]
+    
+    def to_dict(self) -> Dict[str, str]:
+        values = ((field, self.table.value(self.index, field)) for field in UserTable.FIELDS)
+        return {field: value for field, value in values if value is not None}
+    
+    def __repr__(self):
+        return f"UserRecord({self.to_dict()!r})"
+
+
+class UserTable:
+    """
+    Columnar store for enumerated users
+    
+    Each field is kept in its own column instead of one dict per user:
+    UIDs in an int64 array, low-cardinality strings (names, expirations,
+    group names) interned, and group memberships as shared interned tuples.
+    Rows are addressable in O(1) by index and by login.
+    """
+    FIELDS = ('login', 'first_name', 'last_name', 'uid', 'email', 'password_expiration', 'groups')
+    NO_UID = -1
+    
+    def __init__(self, users=None):
+        self.logins: List[str] = []
+        self.first_names: List[Optional[str]] = []
+        self.last_names: List[Optional[str]] = []
+        self.uids = array('q')
+        self.emails: List[Optional[str]] = []
+        self.expirations: List[Optional[str]] = []
+        self.groups: List[tuple] = []
+        self._login_index: Dict[str, int] = {}
+        self._group_index: Optional[Dict[str, List[int]]] = None
+        self._expiration_epochs: Optional[array] = None
+        self._group_sets: Dict[tuple, tuple] = {}
+        self._odd_uids: Dict[int, str] = {}
+        if users is not None:
+            self.extend(users)
+    
+    def __len__(self) -> int:
+        return len(self.logins)
+    
+    def __bool__(self) -> bool:
+        return bool(self.logins)
+    
+    def __getitem__(self, index: int) -> UserRecord:
+        if index < 0:
+            index += len(self.logins)
+        if not 0 <= index < len(self.logins):
+            raise IndexError("user index out of range")
+        return UserRecord(self, index)
+    
+    def __iter__(self):
+        for index in range(len(self.logins)):
+            yield UserRecord(self, index)
+    
+    def __contains__(self, login: str) -> bool:
+        return login in self._login_index
+    
+    def index_of(self, login: str) -> Optional[int]:
+        """
+        Row index of a login, or None if unknown
+        """
+        return self._login_index.get(login)
+    
+    def get_by_login(self, login: str) -> Optional[UserRecord]:
+        index = self._login_index.get(login)
+        return None if index is None else UserRecord(self, index)
+    
+    def members_of(self, group: str) -> List[int]:
+        """
+        Row indexes of the direct members of a group
+        """
+        if self._group_index is None:
+            # Built lazily, once per table; rows sharing a group tuple share the lookups
+            index: Dict[str, List[int]] = {}
+            for row, groups in enumerate(self.groups):
+                for name in groups:
+                    index.setdefault(name, []).append(row)
+            self._group_index = index
+        return self._group_index.get(group, [])
+    
+    def expiration_epochs(self) -> array:
+        """
+        Password expirations of all rows as one array of UTC epoch seconds (NaN when unset)
+        
+        Computed once per table. Expiration strings are interned and highly
+        repetitive, so each distinct value is parsed only once.
+        """
+        if self._expiration_epochs is None:
+            parsed: Dict[Optional[str], float] = {}
+            epochs = array('d', bytes(8 * len(self.expirations)))
+            for row, value in enumerate(self.expirations):
+                epoch = parsed.get(value)
+                if epoch is None:
+                    epoch = parsed[value] = parse_expiration_timestamp(value)
+                epochs[row] = epoch
+            self._expiration_epochs = epochs
+        return self._expiration_epochs
+    
+    def set_expiration(self, login: str, expiration: str) -> bool:
+        """
+        Update the password expiration of one user in place
+        
+        Returns:
+            bool: False if the login is not in the table
+        """
+        index = self._login_index.get(login)
+        if index is None:
+            return False
+        self.expirations[index] = sys.intern(expiration)
+        if self._expiration_epochs is not None:
+            self._expiration_epochs[index] = parse_expiration_timestamp(expiration)
+        return True
+    
+    def select_by_expiration(self, window: 'ExpirationWindow', now: Optional[float] = None) -> List[int]:
+        """
+        Rows matching an expiration window, soonest expiration first
+        
+        One pass over the epoch array; rows without an expiration never match.
+        """
+        now = time.time() if now is None else now
+        # Collapse the conditions into at most two half-open intervals on the epoch axis
+        upper = -math.inf
+        if window.expired:
+            upper = now
+        if window.before is not None:
+            upper = max(upper, window.before)
+        within_end = now + window.within_days * 86400 if window.within_days is not None else -math.inf
+        
+        epochs = self.expiration_epochs()
+        rows = [row for row, epoch in enumerate(epochs)
+                if epoch < upper or now <= epoch <= within_end]
+        rows.sort(key=epochs.__getitem__)
+        return rows
+    
+    def intern_groups(self, names) -> tuple:
+        """
+        Return a shared tuple of interned group names
+        """
+        if type(names) is tuple:
+            # Parsers hand over group tuples; most combinations have been seen before
+            shared = self._group_sets.get(names)
+            if shared is not None:
+                return shared
+        key = tuple(sys.intern(name) for name in names if name)
+        return self._group_sets.setdefault(key, key)
+    
+    def add(self, login: str, first_name: Optional[str] = None, last_name: Optional[str] = None,
+            uid: Optional[str] = None, email: Optional[str] = None,
+            password_expiration: Optional[str] = None, groups=()) -> int:
+        """
+        Append one user and return its row index
+        """
+        index = len(self.logins)
+        self.logins.append(login)
+        self.first_names.append(sys.intern(first_name) if first_name is not None else None)
+        self.last_names.append(sys.intern(last_name) if last_name is not None else None)
+        if uid is None:
+            self.uids.append(self.NO_UID)
+        elif uid.isdigit():
+            self.uids.append(int(uid))
+        else:
+            self.uids.append(self.NO_UID)
+            self._odd_uids[index] = uid
+        self.emails.append(email)
+        self.expirations.append(sys.intern(password_expiration) if password_expiration is not None else None)
+        if isinstance(groups, str):
+            groups = split_groups(groups)
+        self.groups.append(self.intern_groups(groups))
+        self._login_index.setdefault(login, index)
+        self._group_index = None
+        self._expiration_epochs = None
+        return index
+    
+    def append(self, user: Dict[str, str]) -> int:
+        """
+        Append a parsed user record (dict with the FIELDS keys)
+        """
+        return self.add(user.get('login', f"user{len(self.logins) + 1}"), user.get('first_name'),
+                        user.get('last_name'), user.get('uid'), user.get('email'),
+                        user.get('password_expiration'), user.get('groups', ()))
+    
+    def extend(self, users):
+        for user in users:
+            self.append(user)
+    
+    def value(self, index: int, field: str):
+        """
+        Value of one field in one row, None when missing
+        """
+        if field == 'login':
+            return self.logins[index]
+        if field == 'first_name':
+            return self.first_names[index]
+        if field == 'last_name':
+            return self.last_names[index]
+        if field == 'uid':
+            uid = self.uids[index]
+            return str(uid) if uid != self.NO_UID else self._odd_uids.get(index)
+        if field == 'email':
+            return self.emails[index]
+        if field == 'password_expiration':
+            return self.expirations[index]
+        if field == 'groups':
+            groups = self.groups[index]
+            return ", ".join(groups) if groups else None
+        return None
+
+
+class GroupGraph:
+    """
+    Nested group membership, resolved in memory from one bulk group query
+    
+    Edges come from the member DNs of each group entry (users and member
+    groups) and from its memberOf DNs (parent groups). Groups nested in each
+    other form one strongly connected component, found with Tarjan's
+    algorithm; the cycle is recorded in `cycles` instead of being followed
+    forever. Only the components and the edges between them are kept, so
+    memory stays linear in the size of the graph; the transitive closure of
+    a group - the group itself and every group nested in it at any depth -
+    is walked from them on each query, in time linear in its size.
+    """
+    
+    def __init__(self):
+        # Group -> groups that are direct members of it
+        self.subgroups: Dict[str, set] = {}
+        # Group -> logins of its direct user members
+        self.users: Dict[str, set] = {}
+        # Groups nested in each other, one sorted tuple per cycle
+        self.cycles: List[Tuple[str, ...]] = []
+        # Resolved group -> its component; per component, its groups and the components nested in it
+        self._component: Dict[str, int] = {}
+        self._component_groups: List[Tuple[str, ...]] = []
+        self._component_children: List[Tuple[int, ...]] = []
+    
+    def __len__(self) -> int:
+        return len(self.users)
+    
+    def __contains__(self, group: str) -> bool:
+        return group in self.users
+    
+    def add_entry(self, entry: Dict[str, list]):
+        """
+        Add a raw group entry (attribute -> list of values, as returned by
+        group_find/ldapsearch) with its cn, member and memberOf values
+        """
+        attrs = {key.lower(): value for key, value in entry.items()}
+        names = attrs.get('cn') or attrs.get('dn') or []
+        if isinstance(names, str):
+            names = [names]
+        if not names:
+            return
+        name = rdn_value(names[0]) if '=' in names[0] else names[0]
+        self.users.setdefault(name, set())
+        self.subgroups.setdefault(name, set())
+        
+        for attribute in ('member', 'memberof'):
+            dns = attrs.get(attribute) or []
+            if isinstance(dns, str):
+                dns = [dns]
+            for dn in dns:
+                lowered = dn.lower()
+                if attribute == 'member' and lowered.startswith('uid='):
+                    self.users[name].add(rdn_value(dn))
+                elif lowered.startswith('cn=') and ',cn=groups,' in lowered:
+                    if attribute == 'member':
+                        self.subgroups[name].add(rdn_value(dn))
+                    else:
+                        parent = rdn_value(dn)
+                        self.users.setdefault(parent, set())
+                        self.subgroups.setdefault(parent, set()).add(name)
+        self._component.clear()
+        self._component_groups.clear()
+        self._component_children.clear()
+        self.cycles.clear()
+    
+    def closure(self, group: str) -> frozenset:
+        """
+        The group and every group nested in it, at any depth
+        """
+        if group not in self._component:
+            self._resolve(group)
+        start = self._component[group]
+        seen = {start}
+        pending = [start]
+        closure = []
+        while pending:
+            component = pending.pop()
+            closure.extend(self._component_groups[component])
+            for child in self._component_children[component]:
+                if child not in seen:
+                    seen.add(child)
+                    pending.append(child)
+        return frozenset(closure)
+    
+    def members(self, group: str) -> frozenset:
+        """
+        Logins of the direct and nested user members of a group
+        """
+        return frozenset().union(*(self.users.get(name, ()) for name in self.closure(group)))
+    
+    def _resolve(self, root: str):
+        """
+        Assign a component to every group reachable from root that has none yet
+        (iterative Tarjan, so deep nesting does not hit the recursion limit)
+        """
+        resolved = self._component
+        index = {root: 0}
+        low = {root: 0}
+        stack = [root]
+        on_stack = {root}
+        work = [(root, iter(self.subgroups.get(root, ())))]
+        
+        while work:
+            group, children = work[-1]
+            for child in children:
+                if child in resolved:
+                    continue
+                if child not in index:
+                    index[child] = low[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(self.subgroups.get(child, ()))))
+                    break
+                if child in on_stack:
+                    low[group] = min(low[group], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[group])
+                if low[group] != index[group]:
+                    continue
+                
+                # group is the root of a component: pop it; everything nested in it is resolved already
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == group:
+                        break
+                number = len(self._component_groups)
+                for member in component:
+                    resolved[member] = number
+                nested = {resolved[child] for member in component for child in self.subgroups.get(member, ())}
+                nested.discard(number)
+                self._component_groups.append(tuple(component))
+                self._component_children.append(tuple(nested))
+                if len(component) > 1 or group in self.subgroups.get(group, ()):
+                    self.cycles.append(tuple(sorted(component)))
+
+
+class UserSelector:
+    """
+    Resolve selection expressions against a UserTable
+    
+    An expression is a comma separated list of terms:
+        all           every user
+        3, 1-5        row numbers as shown by display_users
+        alice         exact login
+        dev-*         glob on login (prefix globs use a sorted index)
+        re:^svc_      regular expression searched in the login
+        @groupname    members of a group (including nested groups with a GroupGraph)
+        !term         exclude whatever term selects
+    Exact logins and groups are resolved through hash indexes; the result keeps
+    the order in which users were first selected.
+    """
+    GLOB_CHARS = set('*?[')
+    
+    def __init__(self, table: 'UserTable', graph: Optional[GroupGraph] = None):
+        self.table = table
+        self.graph = graph
+        self._sorted_logins = None
+    
+    @classmethod
+    def needs_directory(cls, expression: str) -> bool:
+        """
+        True if the expression uses anything beyond plain logins
+        """
+        for term in expression.split(','):
+            term = term.strip()
+            if (term.lower() == 'all' or term.startswith(('!', '@', 're:'))
+                    or re.match(r'^\d+(-\d+)?$', term) or cls.GLOB_CHARS & set(term)):
+                return True
+        return False
+    
+    def select(self, expression: str) -> Tuple[List[str], List[str]]:
+        """
+        Evaluate an expression
+        
+        Returns:
+            tuple: (selected logins, warnings)
+            
+        Raises:
+            ValueError: If a term is malformed (bad range or regular expression)
+        """
+        included: Dict[int, None] = {}
+        excluded = set()
+        warnings = []
+        has_include = False
+        
+        for term in expression.split(','):
+            term = term.strip()
+            if not term:
+                continue
+            exclude = term.startswith('!')
+            if exclude:
+                term = term[1:].strip()
+            rows = self.resolve_term(term, warnings)
+            if exclude:
+                excluded.update(rows)
+            else:
+                has_include = True
+                for row in rows:
+                    included.setdefault(row, None)
+        
+        if not has_include and excluded:
+            # Only exclusions given: start from everyone
+            included = dict.fromkeys(range(len(self.table)))
+        logins = self.table.logins
+        return [logins[row] for row in included if row not in excluded], warnings
+    
+    def resolve_term(self, term: str, warnings: List[str]) -> List[int]:
+        """
+        Row indexes selected by a single term
+        """
+        table = self.table
+        if term.lower() == 'all':
+            return list(range(len(table)))
+        
+        match = re.match(r'^(\d+)(?:-(\d+))?$', term)
+        if match:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else start
+            if start > end:
+                raise ValueError(f"Invalid range '{term}'")
+            rows = list(range(max(start, 1) - 1, min(end, len(table))))
+            if not rows:
+                warnings.append(f"Warning: Number '{term}' is out of range (1-{len(table)})")
+            return rows
+        
+        if term.startswith('@'):
+            rows = self.group_rows(term[1:], warnings)
+            if not rows:
+                warnings.append(f"Warning: Group '{term[1:]}' has no members in the user list")
+            return rows
+        
+        if term.startswith('re:'):
+            try:
+                pattern = re.compile(term[3:])
+            except re.error as e:
+                raise ValueError(f"Invalid regular expression '{term[3:]}': {e}")
+            rows = [row for row, login in enumerate(table.logins) if pattern.search(login)]
+        elif self.GLOB_CHARS & set(term):
+            rows = self.glob_rows(term)
+        else:
+            row = table.index_of(term)
+            if row is None:
+                warnings.append(f"Warning: User '{term}' does not exist")
+                return []
+            return [row]
+        
+        if not rows:
+            warnings.append(f"Warning: Pattern '{term}' matched no users")
+        return rows
+    
+    def group_rows(self, group: str, warnings: List[str]) -> List[int]:
+        """
+        Row indexes of the members of a group; with a group graph, members of
+        nested groups are included
+        """
+        table = self.table
+        graph = self.graph
+        if graph is None:
+            return table.members_of(group)
+        
+        known_cycles = len(graph.cycles)
+        rows = set()
+        for name in graph.closure(group):
+            rows.update(table.members_of(name))
+        for login in graph.members(group):
+            row = table.index_of(login)
+            if row is not None:
+                rows.add(row)
+        for cycle in graph.cycles[known_cycles:]:
+            warnings.append(f"Warning: Groups {', '.join(cycle)} are nested in each other; "
+                            f"their members are counted once")
+        return sorted(rows)
+    
+    def glob_rows(self, pattern: str) -> List[int]:
+        prefix = pattern.rstrip('*')
+        if prefix and not self.GLOB_CHARS & set(prefix) and pattern.endswith('*'):
+            # Plain 'prefix*': binary search in the sorted logins
+            if self._sorted_logins is None:
+                self._sorted_logins = sorted((login, row) for row, login in enumerate(self.table.logins))
+            start = bisect.bisect_left(self._sorted_logins, (prefix,))
+            rows = []
+            for login, row in itertools.islice(self._sorted_logins, start, None):
+                if not login.startswith(prefix):
+                    break
+                rows.append(row)
+            return sorted(rows)
+        return [row for row, login in enumerate(self.table.logins) if fnmatch.fnmatchcase(login, pattern)]
+
+
+class UserExporter:
+    """
+    Write user records one at a time as a table, NDJSON, CSV or a JSON array
+    
+    Records are written as soon as they are passed in, so a listing streams
+    while the directory is still being enumerated and is never held in full.
+    Only the table format truncates long values; the machine-readable formats
+    emit every value in full, with groups as a list in NDJSON/JSON.
+    """
+    FORMATS = ('table', 'ndjson', 'csv', 'json')
+    
+    # Table layout: header, width and truncation length per column
+    TABLE_COLUMNS = {
+        'login': ('用户名', 15, None),
+        'first_name': ('名', 12, None),
+        'last_name': ('姓', 12, None),
+        'uid': ('UID', 8, None),
+        'email': ('邮箱', 25, 24),
+        'password_expiration': ('密码过期时间', 20, None),
+        'groups': ('用户组', 20, 19),
+    }
+    
+    def __init__(self, stream=None, output_format: str = 'table', columns: Optional[List[str]] = None):
+        if output_format not in self.FORMATS:
+            raise ValueError(f"Unsupported output format '{output_format}'")
+        self.stream = stream or sys.stdout
+        self.output_format = output_format
+        self.columns = list(columns or UserTable.FIELDS)
+        self.count = 0
+        self._csv = None
+        # Flush every table row on a terminal; anything else is left to the stream buffer
+        self._flush_rows = output_format == 'table' and self.stream.isatty()
+    
+    @staticmethod
+    def parse_columns(spec: str) -> List[str]:
+        """
+        Parse a --columns list, e.g. "login,email,password_expiration"
+        
+        Raises:
+            ValueError: On unknown column names
+        """
+        columns = [column.strip() for column in spec.split(',') if column.strip()]
+        unknown = [column for column in columns if column not in UserTable.FIELDS]
+        if unknown or not columns:
+            raise ValueError(f"Unknown column(s): {', '.join(unknown) or '(none)'} "
+                             f"- available: {', '.join(UserTable.FIELDS)}")
+        return columns
+    
+    def begin(self):
+        if self.output_format == 'table':
+            header = f"{'序号':<4} " + " ".join(f"{self.TABLE_COLUMNS[column][0]:<{self.TABLE_COLUMNS[column][1]}}"
+                                                for column in self.columns)
+            self.stream.write("\n" + "="*120 + "\n" + header + "\n" + "="*120 + "\n")
+        elif self.output_format == 'csv':
+            self._csv = csv.writer(self.stream, lineterminator='\n')
+            self._csv.writerow(self.columns)
+        elif self.output_format == 'json':
+            self.stream.write("[")
+    
+    def record(self, user) -> dict:
+        """
+        Selected columns of one user as JSON-ready values (uid as int, groups as list)
+        """
+        record = {}
+        for column in self.columns:
+            value = user.get(column)
+            if column == 'groups':
+                names = getattr(user, 'group_names', None)
+                value = list(names if names is not None else split_groups(value))
+            elif column == 'uid' and value is not None and value.isdigit():
+                value = int(value)
+            record[column] = value
+        return record
+    
+    @staticmethod
+    def text(user, column: str, default: str = '') -> str:
+        """
+        One column of a user as display text (groups joined with ", ")
+        """
+        value = user.get(column)
+        if value is None:
+            return default
+        if column == 'groups' and not isinstance(value, str):
+            return ", ".join(value)
+        return value
+    
+    def write(self, index: int, user):
+        """
+        Write one user (a UserRecord or a parsed user dict); index is the 1-based row number
+        """
+        self.count += 1
+        if self.output_format == 'table':
+            cells = []
+            for column in self.columns:
+                _, width, limit = self.TABLE_COLUMNS[column]
+                value = self.text(user, column, 'N/A')
+                if limit is not None and len(value) > limit:
+                    value = value[:limit - 3] + "..."
+                cells.append(f"{value:<{width}}")
+            self.stream.write(f"{index:<4} " + " ".join(cells) + "\n")
+            if self._flush_rows:
+                self.stream.flush()
+        elif self.output_format == 'ndjson':
+            self.stream.write(json.dumps(self.record(user), ensure_ascii=False) + "\n")
+        elif self.output_format == 'csv':
+            self._csv.writerow([self.text(user, column) for column in self.columns])
+        else:
+            separator = "\n" if self.count == 1 else ",\n"
+            self.stream.write(separator + json.dumps(self.record(user), ensure_ascii=False))
+    
+    def end(self):
+        if self.output_format == 'table':
+            self.stream.write("="*120 + "\n")
+        elif self.output_format == 'json':
+            self.stream.write("\n]\n" if self.count else "]\n")
+        self.stream.flush()
+
+
+class UserBrowser:
+    """
+    Paged, searchable view of a user list that may still be growing
+    
+    Rows are indexed as the enumeration delivers them, so browsing starts
+    with the first page instead of after the whole directory has arrived.
+    Only the visible page is rendered. Typing filters the list: every
+    whitespace separated term must occur in the login, name or email. A
+    query that extends the previous one only re-checks the rows that matched
+    before, and deleting characters again restores the earlier result.
+    
+    The full-screen view needs curses and a terminal; otherwise (or with
+    full_screen=False) the same list is paged on plain lines.
+    """
+    PAGE_SIZE = 20
+    
+    def __init__(self, select=None):
+        """
+        Args:
+            select: Optional callable(expression) -> (logins, warnings) used by the
+                    line mode for selection expressions (numbers, patterns, @groups)
+        """
+        self.select = select
+        self.table: Optional[UserTable] = None
+        self.keys: List[str] = []
+        self.query = ''
+        self.matches: List[int] = []
+        self.marked = set()
+        self.complete = False
+        self.failed = False
+        # Shown in the status line, e.g. the age of a cached user list
+        self.note = ''
+        self._history: List[Tuple[str, List[int], int]] = []
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+    
+    @staticmethod
+    def search_key(user) -> str:
+        return "\n".join(user.get(field) or '' for field in ('login', 'first_name', 'last_name', 'email')).lower()
+    
+    @staticmethod
+    def _matches(key: str, terms: List[str]) -> bool:
+        return all(term in key for term in terms)
+    
+    def add(self, count: int, user: UserRecord):
+        """
+        Index one enumerated user; usable as the on_user callback of get_users_list
+        """
+        key = self.search_key(user)
+        with self._lock:
+            self.table = user.table
+            self.keys.append(key)
+            if self._matches(key, self.query.lower().split()):
+                self.matches.append(user.index)
+            self._changed.notify_all()
+    
+    def finish(self, success: bool = True):
+        """
+        Mark the enumeration as done (or failed)
+        """
+        with self._lock:
+            self.complete = True
+            self.failed = not success
+            self._changed.notify_all()
+    
+    def wait(self, rows: int = 0, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until at least `rows` users match (or the enumeration has finished when rows is 0)
+        
+        Returns:
+            bool: True if the condition was met before the timeout
+        """
+        with self._lock:
+            return self._changed.wait_for(lambda: self.complete or (rows and len(self.matches) >= rows), timeout)
+    
+    def filter(self, query: str):
+        """
+        Show only the rows matching `query`
+        """
+        with self._lock:
+            if query == self.query:
+                return
+            terms = query.lower().split()
+            if self._history and self._history[-1][0] == query:
+                # Deleting characters: reuse the earlier result plus the rows added since
+                _, matches, seen = self._history.pop()
+                matches = matches + [row for row in range(seen, len(self.keys))
+                                     if self._matches(self.keys[row], terms)]
+            elif query.startswith(self.query):
+                self._history.append((self.query, self.matches, len(self.keys)))
+                matches = [row for row in self.matches if self._matches(self.keys[row], terms)]
+            else:
+                self._history = []
+                matches = [row for row, key in enumerate(self.keys) if self._matches(key, terms)]
+            self.query = query
+            self.matches = matches
+    
+    def page(self, offset: int, size: int) -> List[int]:
+        with self._lock:
+            return self.matches[offset:offset + size]
+    
+    def toggle(self, row: int):
+        if row in self.marked:
+            self.marked.discard(row)
+        else:
+            self.marked.add(row)
+    
+    def mark_matches(self):
+        """
+        Mark every row of the current filter; unmark them if they all are already marked
+        """
+        with self._lock:
+            rows = set(self.matches)
+        if rows <= self.marked:
+            self.marked -= rows
+        else:
+            self.marked |= rows
+    
+    def marked_logins(self) -> List[str]:
+        return [self.table.logins[row] for row in sorted(self.marked)]
+    
+    def status(self) -> str:
+        with self._lock:
+            total, shown = len(self.keys), len(self.matches)
+            state = "enumeration failed" if self.failed else ("" if self.complete else "loading...")
+        parts = [f"{shown} of {total} users" if self.query else f"{total} users"]
+        if state:
+            parts.append(state)
+        if self.note:
+            parts.append(self.note)
+        parts.append(f"{len(self.marked)} marked")
+        return ", ".join(parts)
+    
+    def row_text(self, row: int, width: int) -> str:
+        table = self.table
+        name = " ".join(part for part in (table.first_names[row], table.last_names[row]) if part)
+        text = (f"{'*' if row in self.marked else ' '} {row + 1:<6} {table.logins[row]:<20} {name:<24} "
+                f"{table.expirations[row] or 'N/A':<20} {table.emails[row] or ''}")
+        return text[:width]
+    
+    def header_text(self, width: int) -> str:
+        return f"  {'No.':<6} {'Login':<20} {'Name':<24} {'Expiration':<20} Email"[:width]
+    
+    def browse(self, full_screen: bool = True) -> Optional[List[str]]:
+        """
+        Let the user pick users
+        
+        Returns:
+            list: Selected logins, or None when the user cancelled
+        """
+        if (full_screen and curses is not None and sys.stdin.isatty() and sys.stdout.isatty()
+                and os.environ.get('TERM', 'dumb') != 'dumb'):
+            os.environ.setdefault('ESCDELAY', '25')
+            # Anything printed meanwhile (enumeration progress, warnings) is shown afterwards
+            captured = io.StringIO()
+            try:
+                with contextlib.redirect_stdout(captured):
+                    selection = curses.wrapper(self._run_screen)
+            finally:
+                sys.stdout.write(captured.getvalue())
+            return selection
+        return self.browse_lines()
+    
+    def _run_screen(self, screen) -> Optional[List[str]]:
+        curses.curs_set(0)
+        # Redraw a few times a second so rows arriving from the enumeration show up
+        screen.timeout(200)
+        cursor = top = 0
+        # True while the last keys edited the filter: Space then types a space (terms are space separated)
+        typing = False
+        while not (self.failed and not self.keys):
+            height, width = screen.getmaxyx()
+            rows_per_page = max(1, height - 4)
+            with self._lock:
+                shown = len(self.matches)
+            cursor = max(0, min(cursor, shown - 1))
+            top = max(0, min(top, cursor), cursor - rows_per_page + 1)
+            
+            screen.erase()
+            self._draw(screen, 0, self.status(), width, curses.A_BOLD)
+            self._draw(screen, 1, self.header_text(width), width, curses.A_UNDERLINE)
+            for line, row in enumerate(self.page(top, rows_per_page)):
+                attributes = curses.A_REVERSE if top + line == cursor else curses.A_NORMAL
+                self._draw(screen, 2 + line, self.row_text(row, width), width, attributes)
+            self._draw(screen, height - 2, f"Filter: {self.query}", width, curses.A_NORMAL)
+            self._draw(screen, height - 1, "Type to filter  Up/Down PgUp/PgDn  Space mark (after moving)  "
+                                           "^A mark all shown  Enter select  Esc clear/cancel", width, curses.A_DIM)
+            screen.refresh()
+            
+            try:
+                key = screen.get_wch()
+            except curses.error:
+                continue
+            editing = typing
+            typing = False
+            if key in (curses.KEY_DOWN, '\x0e'):
+                cursor += 1
+            elif key in (curses.KEY_UP, '\x10'):
+                cursor -= 1
+            elif key == curses.KEY_NPAGE:
+                cursor += rows_per_page
+                top += rows_per_page
+            elif key == curses.KEY_PPAGE:
+                cursor -= rows_per_page
+                top -= rows_per_page
+            elif key == curses.KEY_HOME:
+                cursor = 0
+            elif key == curses.KEY_END:
+                cursor = shown - 1
+            elif key == ' ' and not editing:
+                row = self.page(cursor, 1)
+                if row:
+                    self.toggle(row[0])
+                    cursor += 1
+            elif key == '\x01':
+                self.mark_matches()
+            elif key in ('\n', '\r', curses.KEY_ENTER):
+                if self.marked:
+                    return self.marked_logins()
+                row = self.page(cursor, 1)
+                if row:
+                    return [self.table.logins[row[0]]]
+            elif key == '\x1b':
+                if not self.query:
+                    return None
+                self.filter('')
+                cursor = 0
+            elif key in (curses.KEY_BACKSPACE, '\x7f', '\b'):
+                self.filter(self.query[:-1])
+                typing = bool(self.query)
+            elif key == '\x15':
+                self.filter('')
+                cursor = 0
+            elif isinstance(key, str) and key.isprintable():
+                self.filter(self.query + key)
+                cursor = 0
+                typing = True
+        return None
+    
+    @staticmethod
+    def _draw(screen, line: int, text: str, width: int, attributes: int):
+        try:
+            screen.addnstr(line, 0, text, max(0, width - 1), attributes)
+        except curses.error:
+            # Terminal too small for this line
+            pass
+    
+    def browse_lines(self) -> Optional[List[str]]:
+        """
+        Page through the list on plain lines (no curses, or not a terminal)
+        """
+        offset = 0
+        while True:
+            self.wait(offset + self.PAGE_SIZE, timeout=2)
+            if self.failed and not self.keys:
+                return None
+            rows = self.page(offset, self.PAGE_SIZE)
+            print(f"\n{self.status()}" + (f", filter '{self.query}'" if self.query else ""))
+            print(self.header_text(120))
+            for row in rows:
+                print(self.row_text(row, 120))
+            if not rows:
+                print("  (no matching users)")
+            
+            print("\nEnter: next page, p: previous page, /TEXT: filter (/ clears), +: mark shown users, "
+                  "+TERMS / -TERMS: mark / unmark, done: use marked users, q: cancel")
+            print("Or select directly: numbers (1,3,5 or 1-5), usernames, 'all', dev-* (glob), re:^svc_ (regex), "
+                  "@group, with ! to exclude")
+            command = input("Please enter your selection: ").strip()
+            
+            if not command:
+                offset += self.PAGE_SIZE if len(rows) == self.PAGE_SIZE else 0
+            elif command == 'p':
+                offset = max(0, offset - self.PAGE_SIZE)
+            elif command.startswith('/'):
+                self.filter(command[1:].strip())
+                offset = 0
+            elif command == 'q':
+                return None
+            elif command == 'done':
+                if self.marked:
+                    return self.marked_logins()
+                print("No users marked yet")
+            elif command == '+':
+                self.mark_matches()
+            else:
+                mark = command[0] in '+-'
+                logins = self.select_expression(command[1:] if mark else command)
+                if logins is None:
+                    continue
+                if not mark:
+                    if not logins and not self.marked:
+                        print("No valid users selected, please try again")
+                        continue
+                    return self.marked_logins() + [login for login in logins
+                                                   if self.table.index_of(login) not in self.marked]
+                rows = {self.table.index_of(login) for login in logins} - {None}
+                if command[0] == '+':
+                    self.marked |= rows
+                else:
+                    self.marked -= rows
+    
+    def select_expression(self, expression: str) -> Optional[List[str]]:
+        """
+        Evaluate a selection expression against the complete list
+        
+        Returns:
+            list: Selected logins, or None when the expression is invalid
+        """
+        if not self.complete:
+            print("Waiting for the user list to finish loading...")
+            self.wait()
+        if self.select is None or self.table is None:
+            print("No user data found")
+            return None
+        try:
+            logins, warnings = self.select(expression)
+        except ValueError as e:
+            print(f"{e}, please try again")
+            return None
+        for warning in warnings:
+            print(warning)
+        return logins
+
+
+class UserQuery(NamedTuple):
+    """
+    Server-side restrictions applied to user enumeration
+    
+    login_prefix and group are pushed into the directory query; sizelimit and
+    timelimit of 0 mean unlimited.
+    """
+    login_prefix: Optional[str] = None
+    group: Optional[str] = None
+    sizelimit: int = 0
+    timelimit: int = 0
+    
+    def matches(self, user: Dict[str, str]) -> bool:
+        """
+        Client-side check, for sources that cannot filter exactly on the server
+        """
+        if self.login_prefix and not user.get('login', '').startswith(self.login_prefix):
+            return False
+        if self.group:
+            if self.group not in split_groups(user.get('groups')):
+                return False
+        return True
+
+
+def escape_filter_value(value: str) -> str:
+    """
+    Escape a string for use inside an LDAP search filter (RFC 4515)
+    """
+    return ''.join(f"\\{ord(char):02x}" if char in '*()\\\0' else char for char in value)
+
+
+class EnumerationError(Exception):
+    """
+    Error raised when the user list cannot be retrieved through the ipa CLI
+    """
+
+
+class LdapError(Exception):
+    """
+    Error raised by the LDAP backend
+    """
+
+
+class JsonRpcBackend:
+    """
+    FreeIPA JSON-RPC backend
+    
+    Logs into /ipa/session/json once, keeps persistent HTTP(S) connections in a
+    small pool and sends user_mod calls grouped into the server's batch command.
+    """
+    name = 'jsonrpc'
+    
+    # user_show calls per lookup batch (reads, independent of the write batch size)
+    LOOKUP_CHUNK = 200
+    
+    def __init__(self, server: str, username: str, password: str, batch_size: int = 100,
+                 pool_size: int = 1, ca_file: Optional[str] = None, verify: bool = True,
+                 timeout: float = 30):
+        if '://' not in server:
+            server = f"https://{server}"
+        url = urllib.parse.urlsplit(server)
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port
+        self.base_url = f"{url.scheme}://{url.netloc}"
+        self.username = username
+        self.password = password
+        self.batch_size = max(1, batch_size)
+        self.timeout = timeout
+        self.session_cookie = None
+        self._login_lock = threading.Lock()
+        self._pool = queue.LifoQueue()
+        self._pool_size = max(1, pool_size)
+        self._created = 0
+        self._created_lock = threading.Lock()
+        self.metrics: Optional[Metrics] = None
+        
+        self.ssl_context = None
+        if self.scheme == 'https':
+            self.ssl_context = ssl.create_default_context(cafile=ca_file)
+            if not verify:
+                self.ssl_context.check_hostname = False
+                self.ssl_context.verify_mode = ssl.CERT_NONE
+    
+    def _new_connection(self):
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout,
+                                               context=self.ssl_context)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+    
+    def _acquire_connection(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._created_lock:
+            if self._created < self._pool_size:
+                self._created += 1
+                return self._new_connection()
+        return self._pool.get()
+    
+    def _release_connection(self, conn):
+        self._pool.put(conn)
+    
+    def _request(self, path: str, body: bytes, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        headers = dict(headers)
+        headers['Referer'] = f"{self.base_url}/ipa"
+        if self.session_cookie:
+            headers['Cookie'] = f"ipa_session={self.session_cookie}"
+        
+        conn = self._acquire_connection()
+        try:
+            for attempt in (1, 2):
+                try:
+                    started = time.perf_counter()
+                    conn.request('POST', path, body=body, headers=headers)
+                    response = conn.getresponse()
+                    data = response.read()
+                    if self.metrics is not None:
+                        self.metrics.observe('http', time.perf_counter() - started, path.rsplit('/', 1)[-1])
+                        self.metrics.count('bytes_read', len(data), 'http')
+                    return response.status, {k.lower(): v for k, v in response.getheaders()}, data
+                except (http.client.HTTPException, ConnectionError, OSError) as e:
+                    # Stale keep-alive connection: reconnect once before giving up
+                    conn.close()
+                    conn = self._new_connection()
+                    if attempt == 2:
+                        raise JsonRpcError(f"Connection to {self.base_url} failed: {e}")
+        finally:
+            self._release_connection(conn)
+    
+    def login(self):
+        """
+        Obtain an ipa_session cookie with username/password authentication
+        """
+        body = urllib.parse.urlencode({'user': self.username, 'password': self.password}).encode()
+        status, headers, data = self._request('/ipa/session/login_password', body, {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Accept': 'text/plain',
+        })
+        if status != 200:
+            reason = headers.get('x-ipa-rejection-reason', data.decode(errors='replace').strip())
+            raise JsonRpcError(f"Login as {self.username} failed (HTTP {status}): {reason}")
+        
+        cookie = http.cookies.SimpleCookie()
+        cookie.load(headers.get('set-cookie', ''))
+        if 'ipa_session' not in cookie:
+            raise JsonRpcError("Login succeeded but no ipa_session cookie was returned")
+        self.session_cookie = cookie['ipa_session'].value
+    
+    def call(self, method: str, args: Optional[list] = None, options: Optional[dict] = None):
+        """
+        Call a single IPA API command and return its 'result' member
+        """
+        payload = json.dumps({'method': method, 'params': [args or [], options or {}], 'id': 0}).encode()
+        headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        
+        if self.session_cookie is None:
+            with self._login_lock:
+                if self.session_cookie is None:
+                    self.login()
+        
+        stale_cookie = self.session_cookie
+        status, _, data = self._request('/ipa/session/json', payload, headers)
+        if status == 401:
+            # Session expired: log in again once and retry
+            with self._login_lock:
+                if self.session_cookie == stale_cookie:
+                    self.login()
+            status, _, data = self._request('/ipa/session/json', payload, headers)
+        if status != 200:
+            raise JsonRpcError(f"HTTP {status} from {self.base_url}/ipa/session/json")
+        
+        try:
+            reply = json.loads(data)
+        except ValueError:
+            raise JsonRpcError("Invalid JSON response from server")
+        if reply.get('error'):
+            error = reply['error']
+            message = error.get('message', str(error)) if isinstance(error, dict) else str(error)
+            raise JsonRpcError(message)
+        return reply.get('result')
+    
+    def batch(self, calls: List[Tuple[str, list, dict]]) -> List[Tuple[bool, str]]:
+        """
+        Send several commands in one server-side batch
+        
+        Returns:
+            list: (success, error_message) for each call, in order
+        """
+        result = self.call('batch', [
+            {'method': method, 'params': [args, options]} for method, args, options in calls
+        ])
+        outcomes = []
+        replies = (result or {}).get('results', [])
+        for index in range(len(calls)):
+            reply = replies[index] if index < len(replies) else None
+            if reply is None:
+                outcomes.append((False, "No result returned for batched call"))
+            elif reply.get('error'):
+                error = reply['error']
+                outcomes.append((False, error.get('message', str(error)) if isinstance(error, dict) else str(error)))
+            else:
+                outcomes.append((True, ""))
+        return outcomes
+    
+    def modify_expirations(self, assignments: List[Tuple[str, str]]) -> List[Tuple[bool, str]]:
+        """
+        Set krbPasswordExpiration for each (username, expiration) pair using batch calls
+        """
+        outcomes = []
+        for start in range(0, len(assignments), self.batch_size):
+            chunk = assignments[start:start + self.batch_size]
+            calls = [('user_mod', [username], {'setattr': f"krbpasswordexpiration={expiration}"})
+                     for username, expiration in chunk]
+            try:
+                outcomes.extend(self.batch(calls))
+            except JsonRpcError as e:
+                outcomes.extend((False, str(e)) for _ in chunk)
+        return outcomes
+    
+    def iter_users(self, query: UserQuery = UserQuery()):
+        """
+        Enumerate users with a single user_find call
+        
+        krbPasswordExpiration is not a default user_find attribute, so 'all' is
+        still required here; the group restriction and limits are server-side.
+        """
+        options = {'all': True, 'raw': True, 'sizelimit': query.sizelimit}
+        if query.timelimit:
+            options['timelimit'] = query.timelimit
+        if query.group:
+            options['in_group'] = [query.group]
+        result = self.call('user_find', [query.login_prefix or ''], options) or {}
+        if result.get('truncated'):
+            print("Warning: Search result has been truncated by the server size/time limit")
+        for entry in result.get('result', []):
+            user = user_from_entry(entry)
+            # The criteria argument is a substring match; keep only true prefixes
+            if not query.login_prefix or user.get('login', '').startswith(query.login_prefix):
+                yield user
+    
+    def lookup_users(self, logins: List[str]):
+        """
+        Fetch only the given users, as server-side batches of user_show calls
+        
+        Logins the server does not know are left out; any other error is raised.
+        """
+        for start in range(0, len(logins), self.LOOKUP_CHUNK):
+            chunk = logins[start:start + self.LOOKUP_CHUNK]
+            result = self.call('batch', [{'method': 'user_show', 'params': [[login], {'all': True, 'raw': True}]}
+                                         for login in chunk]) or {}
+            for reply in result.get('results', []):
+                if not reply:
+                    continue
+                if reply.get('error'):
+                    if reply.get('error_name') == 'NotFound' or reply.get('error_code') == 4001:
+                        continue
+                    error = reply['error']
+                    raise JsonRpcError(error.get('message', str(error)) if isinstance(error, dict) else str(error))
+                if reply.get('result'):
+                    yield user_from_entry(reply['result'])
+    
+    def iter_disabled_logins(self):
+        """
+        Logins of disabled (nsAccountLock) accounts, filtered on the server in a single user_find call
+        """
+        result = self.call('user_find', [''], {'nsaccountlock': True, 'pkey_only': True, 'sizelimit': 0}) or {}
+        for entry in result.get('result', []):
+            login = user_from_entry(entry).get('login')
+            if login:
+                yield login
+    
+    def iter_groups(self):
+        """
+        Raw entries of every group, with their member and memberOf DNs, from a single group_find call
+        """
+        result = self.call('group_find', [''], {'all': True, 'raw': True, 'sizelimit': 0}) or {}
+        if result.get('truncated'):
+            print("Warning: Group list has been truncated by the server size/time limit")
+        yield from result.get('result', [])
+
+
+def to_generalized_time(value: str) -> str:
+    """
+    Convert an expiration such as '2030-12-31T12:00:00Z' to LDAP GeneralizedTime ('20301231120000Z')
+    """
+    if re.match(r'^\d{14}Z$', value):
+        return value
+    for fmt in ('%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d', '%Y%m%d'):
+        try:
+            return datetime.strptime(value, fmt).strftime('%Y%m%d%H%M%SZ')
+        except ValueError:
+            continue
+    raise ValueError(f"Unsupported expiration format: {value}")
+
+
+def parse_expiration_timestamp(value: Optional[str]) -> float:
+    """
+    Convert a krbPasswordExpiration value to a UTC epoch timestamp
+    
+    Accepts GeneralizedTime ('20301231120000Z') and the ISO forms used on the
+    command line; returns NaN for missing or unparseable values.
+    """
+    if not value:
+        return math.nan
+    if len(value) == 15 and value[14] == 'Z' and value[:14].isdigit():
+        # Fast path for raw LDAP values, avoids strptime
+        try:
+            return float(calendar.timegm((int(value[0:4]), int(value[4:6]), int(value[6:8]),
+                                          int(value[8:10]), int(value[10:12]), int(value[12:14]))))
+        except (ValueError, OverflowError):
+            return math.nan
+    try:
+        return parse_expiration_timestamp(to_generalized_time(value))
+    except ValueError:
+        return math.nan
+
+
+class ExpirationWindow(NamedTuple):
+    """
+    Expiration-based user query; a user matches if any given condition holds
+    """
+    expired: bool = False
+    within_days: Optional[float] = None
+    before: Optional[float] = None
+    
+    def __bool__(self) -> bool:
+        return self.expired or self.within_days is not None or self.before is not None
+    
+    def describe(self) -> str:
+        parts = []
+        if self.expired:
+            parts.append("already expired")
+        if self.within_days is not None:
+            parts.append(f"expiring within {self.within_days:g} days")
+        if self.before is not None:
+            parts.append(f"expiring before {time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.before))}")
+        return " or ".join(parts)
+
+
+def escape_dn_value(value: str) -> str:
+    """
+    Escape a string for use as an RDN value (RFC 4514)
+    """
+    escaped = re.sub(r'([,+"\\<>;=])', r'\\\1', value)
+    if escaped.startswith((' ', '#')):
+        escaped = '\\' + escaped
+    if escaped.endswith(' ') and not escaped.endswith('\\ '):
+        escaped = escaped[:-1] + '\\ '
+    return escaped
+
+
+def iter_ldif_entries(lines):
+    """
+    Yield (dn, attributes) for each entry of an LDIF stream
+    
+    Handles folded continuation lines, base64 ('::') values and comments.
+    Attribute names keep their original case; values are lists.
+    """
+    dn = None
+    attrs: Dict[str, list] = {}
+    logical = None
+    
+    def flush_line(text):
+        nonlocal dn
+        if ':' not in text:
+            return
+        key, value = text.split(':', 1)
+        if value.startswith(':'):
+            value = base64.b64decode(value[1:].strip()).decode('utf-8', errors='replace')
+        else:
+            value = value.strip()
+        if key.lower() == 'dn':
+            dn = value
+        else:
+            attrs.setdefault(key, []).append(value)
+    
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line.startswith(' ') and logical is not None:
+            logical += line[1:]
+            continue
+        if logical is not None:
+            flush_line(logical)
+            logical = None
+        if not line:
+            if dn is not None:
+                yield dn, attrs
+            dn, attrs = None, {}
+            continue
+        if line.startswith('#'):
+            continue
+        logical = line
+    if logical is not None:
+        flush_line(logical)
+    if dn is not None:
+        yield dn, attrs
+
+
+# What to do with each attribute of `ipa user-find --all --raw` output; anything else is skipped
+STRUCTURED_ACTIONS = {
+    'dn': 'dn',
+    'uid': 'login',
+    'givenname': 'first_name',
+    'sn': 'last_name',
+    'uidnumber': 'uid',
+    'mail': 'email',
+    'krbpasswordexpiration': 'password_expiration',
+    'modifytimestamp': 'modify_timestamp',
+    'memberof': 'groups',
+}
+ATTRIBUTE_NAME_PATTERN = re.compile(r'[A-Za-z][\w;-]*')
+
+
+class StructuredOutputParser:
+    """
+    Parser for `ipa user-find --all --raw` output and LDIF dumps
+    
+    A single pass over the lines. Lines indented deeper than the attribute
+    lines continue the previous value, '::' values are base64 encoded, '#'
+    lines are comments, and blank lines or a second dn line end a record.
+    The action of each attribute name is looked up once and then cached
+    under the raw name (indentation included), so an ordinary line costs a
+    partition and a dict lookup. memberOf values are collected in a list and
+    turned into a tuple of group names once per record.
+    
+    Malformed lines and records are described in `problems` and skipped; the
+    rest of the output is still parsed. Line numbers start at `line`, so a
+    piece of a larger file can be parsed on its own.
+    """
+    
+    def __init__(self):
+        # Raw attribute name (indentation included) -> action, for names at the usual indentation
+        self.actions: Dict[str, str] = {}
+        self.indent: Optional[int] = None
+        self.group_suffix: Optional[str] = None
+        self.line = 1
+        # (line number, description) of everything skipped
+        self.problems: List[Tuple[int, str]] = []
+    
+    def parse(self, data: str):
+        """
+        Yield the user records of complete output
+        """
+        if '\r' in data:
+            data = data.replace('\r\n', '\n')
+        # One entry's lines at a time: the lines of a whole dump would double the peak memory
+        return self.iter_records(itertools.chain.from_iterable(
+            block.split('\n') + [''] for block in data.split('\n\n')))
+    
+    def parse_lines(self, lines):
+        """
+        Yield user records from an iterable of lines (with or without line
+        endings), as soon as each entry is complete
+        """
+        return self.iter_records(line.rstrip('\r\n') for line in lines)
+    
+    def learn(self, key: str, name: str, indent: int) -> str:
+        """
+        Action for an attribute line, cached when the line is at the usual indentation
+        """
+        action = STRUCTURED_ACTIONS.get(name.lower(), 'skip')
+        if indent == self.indent:
+            self.actions[key] = action
+        return action
+    
+    def group_names(self, dns: List[str]) -> tuple:
+        """
+        Names of the groups among memberOf DNs (roles, HBAC and sudo rules are dropped)
+        """
+        suffix = self.group_suffix
+        if (suffix is not None and all(map(str.endswith, dns, itertools.repeat(suffix)))
+                and all(map(str.startswith, dns, itertools.repeat('cn=')))):
+            # All plain groups of the same directory: cut the names out without a Python loop
+            return tuple(map(operator.getitem, dns, itertools.repeat(slice(3, -len(suffix)))))
+        names = []
+        for dn in dns:
+            lowered = dn.lower()
+            if lowered.startswith('cn=') and ',cn=groups,' in lowered:
+                names.append(rdn_value(dn))
+                if suffix is None and ',cn=groups,' in dn:
+                    suffix = self.group_suffix = dn[dn.index(',cn=groups,'):]
+        return tuple(names)
+    
+    def iter_records(self, lines):
+        """
+        Yield the user records of an iterable of lines without line endings
+        """
+        actions = self.actions
+        record = {}
+        dns = []
+        has_dn = False
+        first = number = self.line - 1
+        # Action and raw value of the previous attribute line; None outside of records
+        last = last_value = None
+        
+        for number, line in enumerate(lines, self.line):
+            key, separator, value = line.partition(':')
+            action = actions.get(key)
+            if action is None:
+                if line[:1] == '#':
+                    continue
+                name = key.strip()
+                indent = len(key) - len(key.lstrip())
+                if not name and not separator:
+                    action = 'end'
+                elif last is not None and self.indent is not None and indent > self.indent:
+                    # Folded line: re-apply the previous attribute with the value extended
+                    if last == 'skip':
+                        continue
+                    action = last
+                    value = last_value + line[self.indent + 1:]
+                    if action == 'groups':
+                        dns.pop()
+                    elif action == 'dn':
+                        has_dn = False
+                elif not separator or ATTRIBUTE_NAME_PATTERN.fullmatch(name) is None:
+                    if last is not None:
+                        self.problems.append((number, f"not an attribute, ignored: {line.strip()[:60]!r}"))
+                        last = 'skip'
+                    continue
+                else:
+                    if self.indent is None:
+                        self.indent = indent
+                    action = self.learn(key, name, indent)
+            
+            if action == 'end' or (action == 'dn' and has_dn):
+                if last is not None:
+                    user = self.finish_record(record, dns, has_dn, first)
+                    if user is not None:
+                        yield user
+                record = {}
+                dns = []
+                has_dn = False
+                last = None
+                if action == 'end':
+                    continue
+            if last is None:
+                first = number
+            if action == 'skip':
+                last = action
+                continue
+            
+            last = action
+            last_value = value
+            if value[:1] == ':':
+                try:
+                    value = base64.b64decode(value[1:].strip(), validate=True).decode('utf-8').strip()
+                except ValueError:
+                    self.problems.append((number, f"invalid base64 value of {key.strip()} ignored"))
+                    last = 'skip'
+                    continue
+            else:
+                value = value.strip()
+            
+            if action == 'groups':
+                dns.append(value)
+            elif action == 'dn':
+                has_dn = True
+                if value[:4].lower() == 'uid=':
+                    record['login'] = rdn_value(value)
+            elif action == 'login':
+                record.setdefault('login', value)
+            else:
+                record[action] = value
+        
+        self.line = number + 1
+        if last is not None:
+            user = self.finish_record(record, dns, has_dn, first)
+            if user is not None:
+                yield user
+    
+    def finish_record(self, record: Dict[str, str], dns: List[str], has_dn: bool,
+                      number: int) -> Optional[Dict[str, str]]:
+        """
+        Complete a record, or report it when it looks like a user but has no
+        dn or login (entries without user attributes, like the LDIF version
+        line or the search result trailer, are skipped quietly)
+        """
+        if not has_dn or 'login' not in record:
+            if record or dns:
+                self.problems.append((number, f"record without {'login' if has_dn else 'dn'} skipped"))
+            return None
+        groups = self.group_names(dns)
+        if groups:
+            record['groups'] = groups
+        return record
+
+
+def report_parse_problems(problems: List[Tuple[int, str]], metrics: Metrics):
+    """
+    Warn about malformed parts of user-find output that were skipped
+    
+    Args:
+        problems: (line number, description) pairs of StructuredOutputParser
+        metrics: Metrics receiving the parse_problems count
+    """
+    if not problems:
+        return
+    metrics.count('parse_problems', len(problems), 'structured')
+    print(f"Warning: Skipped {len(problems)} malformed line(s)/record(s) in user-find output:")
+    for number, problem in problems[:5]:
+        print(f"  line {number}: {problem}")
+    if len(problems) > 5:
+        print(f"  ... and {len(problems) - 5} more")
+
+
+class LdapBackend:
+    """
+    Direct LDAP backend built on the OpenLDAP client tools
+    
+    Every unit of work is streamed as LDIF into one ldapmodify process, i.e.
+    one bind (GSSAPI or simple bind DN) and one connection for the whole unit;
+    with several workers, several such connections are in flight at once.
+    Enumeration uses a paged ldapsearch over the same bind settings.
+    """
+    name = 'ldap'
+    
+    USER_ATTRIBUTES = ['uid', 'givenName', 'sn', 'uidNumber', 'mail', 'krbPasswordExpiration', 'memberOf',
+                       'modifyTimestamp']
+    
+    # Enumeration can be restricted to entries modified after a given time
+    supports_delta = True
+    
+    # Logins per uid lookup filter
+    LOOKUP_CHUNK = 200
+    
+    def __init__(self, uri: str, base_dn: str, bind_dn: Optional[str] = None,
+                 password: Optional[str] = None, batch_size: int = 100, page_size: int = 500,
+                 ldapsearch: str = 'ldapsearch', ldapmodify: str = 'ldapmodify', timeout: float = 300,
+                 executor: Optional[AsyncCommandExecutor] = None):
+        self.uri = uri
+        self.base_dn = base_dn
+        self.bind_dn = bind_dn
+        self.batch_size = max(1, batch_size)
+        self.page_size = max(1, page_size)
+        self.ldapsearch = ldapsearch
+        self.ldapmodify = ldapmodify
+        self.timeout = timeout
+        self.executor = executor or AsyncCommandExecutor.shared()
+        self.users_base = f"cn=users,cn=accounts,{base_dn}"
+        self.groups_base = f"cn=groups,cn=accounts,{base_dn}"
+        self._password_file = None
+        
+        if bind_dn is not None:
+            # ldap tools read the password from a file so it never shows up in `ps`
+            fd, self._password_file = tempfile.mkstemp(prefix='freeipa-pw-reset-')
+            with os.fdopen(fd, 'w') as f:
+                f.write(password or '')
+            atexit.register(self.close)
+    
+    def close(self):
+        """
+        Remove the temporary password file, if any
+        """
+        if self._password_file and os.path.exists(self._password_file):
+            os.unlink(self._password_file)
+        self._password_file = None
+    
+    def _bind_args(self) -> List[str]:
+        if self.bind_dn is None:
+            return ['-H', self.uri, '-Y', 'GSSAPI', '-Q']
+        return ['-H', self.uri, '-x', '-D', self.bind_dn, '-y', self._password_file]
+    
+    def user_dn(self, username: str) -> str:
+        return f"uid={escape_dn_value(username)},{self.users_base}"
+    
+    def modify_expirations(self, assignments: List[Tuple[str, str]]) -> List[Tuple[bool, str]]:
+        """
+        Set krbPasswordExpiration for each (username, expiration) pair over one ldapmodify connection
+        """
+        ldif = []
+        dns = []
+        outcomes: List[Optional[Tuple[bool, str]]] = [None] * len(assignments)
+        for index, (username, expiration) in enumerate(assignments):
+            try:
+                value = to_generalized_time(expiration)
+            except ValueError as e:
+                outcomes[index] = (False, str(e))
+                dns.append(None)
+                continue
+            dn = self.user_dn(username)
+            dns.append(dn)
+            ldif.append(f"dn: {dn}\nchangetype: modify\nreplace: krbPasswordExpiration\n"
+                        f"krbPasswordExpiration: {value}\n-\n")
+        if not ldif:
+            return outcomes
+        
+        fd, reject_file = tempfile.mkstemp(prefix='freeipa-pw-reset-rej-')
+        os.close(fd)
+        try:
+            argv = [self.ldapmodify, '-c', '-S', reject_file] + self._bind_args()
+            ret_code, stdout, stderr = self.executor.run(argv, input="\n".join(ldif), timeout=self.timeout)
+            
+            with open(reject_file) as f:
+                rejected = self._parse_rejects(f)
+        finally:
+            os.unlink(reject_file)
+        
+        attempted = {match.lower() for match in re.findall(r'^modifying entry "(.*)"$', stdout, re.MULTILINE)}
+        failure = stderr.strip().splitlines()[-1] if stderr.strip() else "ldapmodify did not process the entry"
+        for index, dn in enumerate(dns):
+            if dn is None:
+                continue
+            if dn.lower() in rejected:
+                outcomes[index] = (False, rejected[dn.lower()])
+            elif dn.lower() in attempted:
+                outcomes[index] = (True, "")
+            else:
+                outcomes[index] = (False, failure)
+        return outcomes
+    
+    @staticmethod
+    def _parse_rejects(lines) -> Dict[str, str]:
+        """
+        Map lower-cased DN -> server error from an ldapmodify -S reject file
+        """
+        rejected = {}
+        error = None
+        for line in lines:
+            if line.startswith('# Error: '):
+                error = line[len('# Error: '):].strip()
+            elif line.lower().startswith('dn:') and error is not None:
+                rejected[line.split(':', 1)[1].strip().lower()] = error
+                error = None
+        return rejected
+    
+    # ldapsearch exit codes for partial results
+    SIZELIMIT_EXCEEDED = 4
+    TIMELIMIT_EXCEEDED = 3
+    
+    def search_args(self, ldap_filter: str, attributes: List[str], sizelimit: int = 0,
+                    timelimit: int = 0, base: Optional[str] = None) -> List[str]:
+        argv = [self.ldapsearch, '-LLL', '-o', 'ldif-wrap=no', '-E', f"pr={self.page_size}/noprompt"]
+        if sizelimit:
+            argv += ['-z', str(sizelimit)]
+        if timelimit:
+            argv += ['-l', str(timelimit)]
+        return argv + self._bind_args() + ['-b', base or self.users_base, ldap_filter] + attributes
+    
+    def user_filter(self, query: UserQuery, modified_since: Optional[str] = None) -> str:
+        """
+        Build the search filter for a user query
+        """
+        parts = ['(objectClass=posixAccount)']
+        if modified_since:
+            parts.append(f"(modifyTimestamp>={escape_filter_value(modified_since)})")
+        if query.login_prefix:
+            parts.append(f"(uid={escape_filter_value(query.login_prefix)}*)")
+        if query.group:
+            group_dn = f"cn={escape_dn_value(query.group)},cn=groups,cn=accounts,{self.base_dn}"
+            parts.append(f"(memberOf={escape_filter_value(group_dn)})")
+        return parts[0] if len(parts) == 1 else f"(&{''.join(parts)})"
+    
+    def iter_users(self, query: UserQuery = UserQuery(), modified_since: Optional[str] = None):
+        """
+        Enumerate users with a paged, attribute-projected search, yielding each user as soon as it is received
+        
+        Args:
+            query: Server-side filters and limits
+            modified_since: Only return entries with modifyTimestamp >= this GeneralizedTime
+        """
+        stream = self.executor.stream(self.search_args(self.user_filter(query, modified_since),
+                                                       self.USER_ATTRIBUTES, query.sizelimit, query.timelimit))
+        for dn, attrs in iter_ldif_entries(stream):
+            if attrs.get('uid'):
+                yield user_from_entry(attrs)
+        if stream.return_code in (self.SIZELIMIT_EXCEEDED, self.TIMELIMIT_EXCEEDED):
+            print("Warning: Search result has been truncated by the size/time limit")
+        elif stream.return_code != 0:
+            raise LdapError(stream.stderr.strip() or f"ldapsearch exited with code {stream.return_code}")
+    
+    def lookup_users(self, logins: List[str]):
+        """
+        Fetch only the given users, with searches filtered on their uid
+        """
+        for start in range(0, len(logins), self.LOOKUP_CHUNK):
+            terms = ''.join(f"(uid={escape_filter_value(login)})" for login in logins[start:start + self.LOOKUP_CHUNK])
+            stream = self.executor.stream(self.search_args(f"(&(objectClass=posixAccount)(|{terms}))",
+                                                           self.USER_ATTRIBUTES))
+            for dn, attrs in iter_ldif_entries(stream):
+                if attrs.get('uid'):
+                    yield user_from_entry(attrs)
+            if stream.return_code != 0:
+                raise LdapError(stream.stderr.strip() or f"ldapsearch exited with code {stream.return_code}")
+    
+    def iter_disabled_logins(self):
+        """
+        Logins of disabled (nsAccountLock) accounts, from one paged search projected to uid
+        """
+        stream = self.executor.stream(self.search_args('(&(objectClass=posixAccount)(nsAccountLock=TRUE))', ['uid']))
+        for dn, attrs in iter_ldif_entries(stream):
+            if attrs.get('uid'):
+                yield attrs['uid'][0]
+        if stream.return_code != 0 and stream.return_code not in (self.SIZELIMIT_EXCEEDED, self.TIMELIMIT_EXCEEDED):
+            raise LdapError(stream.stderr.strip() or f"ldapsearch exited with code {stream.return_code}")
+    
+    def iter_groups(self):
+        """
+        Raw entries of every user group with cn, member and memberOf, from one paged search
+        """
+        stream = self.executor.stream(self.search_args('(objectClass=ipausergroup)', ['cn', 'member', 'memberOf'],
+                                                       base=self.groups_base))
+        for dn, attrs in iter_ldif_entries(stream):
+            attrs.setdefault('cn', [rdn_value(dn)])
+            yield attrs
+        if stream.return_code in (self.SIZELIMIT_EXCEEDED, self.TIMELIMIT_EXCEEDED):
+            print("Warning: Group list has been truncated by the size/time limit")
+        elif stream.return_code != 0:
+            raise LdapError(stream.stderr.strip() or f"ldapsearch exited with code {stream.return_code}")
+
+
+class IpaCliBackend:
+    """
+    Write path through the ipa command line client, pinned to one server
+    
+    `ipa -e xmlrpc_uri=...` overrides the server from /etc/ipa/default.conf
+    for a single invocation, so several of these can target different
+    replicas with the same Kerberos ticket.
+    """
+    name = 'cli'
+    batch_size = 1
+    
+    def __init__(self, server: str, executor: AsyncCommandExecutor, timeout: float = 30):
+        if '://' not in server:
+            server = f"https://{server}"
+        url = urllib.parse.urlsplit(server)
+        self.base_url = f"{url.scheme}://{url.netloc}"
+        self.executor = executor
+        self.timeout = timeout
+    
+    def modify_expirations(self, assignments: List[Tuple[str, str]]) -> List[Tuple[bool, str]]:
+        outcomes = []
+        for username, expiration in assignments:
+            return_code, _, stderr = self.executor.run(
+                ['ipa', '-e', f"xmlrpc_uri={self.base_url}/ipa/xml", 'user-mod', username,
+                 f"--setattr=krbPasswordExpiration={expiration}"], timeout=self.timeout)
+            outcomes.append((return_code == 0, stderr.strip() if return_code != 0 else ""))
+        return outcomes
+
+
+def parse_snapshot_chunk(path: str, start: int, end: int):
+    """
+    Parse bytes start..end of a snapshot file (runs in the parse worker processes)
+    
+    Returns:
+        tuple: (records, problems, line breaks in the chunk); the line numbers
+               of the problems count from the start of the chunk
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode('utf-8', errors='replace')
+    parser = StructuredOutputParser()
+    records = list(parser.parse(text))
+    # Share equal group tuples, so each distinct membership list is pickled once per chunk
+    shared = {}
+    for record in records:
+        groups = record.get('groups')
+        if groups is not None:
+            record['groups'] = shared.setdefault(groups, groups)
+    return records, parser.problems, text.count('\n')
+
+
+class SnapshotFile:
+    """
+    Read-only source for a saved `ipa user-find --all --raw` output or ldapsearch LDIF dump
+    
+    The file is memory-mapped and cut into chunks at blank lines, i.e. between
+    entries; the chunks are parsed in a pool of worker processes and the users
+    come back in file order. A file without structured entries is read as
+    standard `ipa user-find --all` output instead.
+    """
+    name = 'file'
+    batch_size = 1
+    
+    # Bytes per chunk: large enough to amortize pickling the results back,
+    # small enough that every worker gets several chunks
+    MIN_CHUNK_SIZE = 4 * 1024 * 1024
+    MAX_CHUNK_SIZE = 64 * 1024 * 1024
+    # Standard output has dn lines too; its "User login:" lines tell it apart
+    STANDARD_OUTPUT_PATTERN = re.compile(rb'^[ \t]*User login: ', re.MULTILINE)
+    
+    def __init__(self, path: str, workers: Optional[int] = None):
+        """
+        Raises:
+            OSError: The file cannot be read or is not a regular file
+        """
+        self.path = path
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        status = os.stat(path)
+        if not stat.S_ISREG(status.st_mode):
+            raise OSError("not a regular file (pipes cannot be memory-mapped)")
+        self.size = status.st_size
+        self.metrics = Metrics()
+    
+    def chunks(self) -> List[Tuple[int, int]]:
+        """
+        Byte ranges covering the file, each ending after a blank line or at the end of the file
+        """
+        if self.size == 0:
+            return []
+        chunk_size = min(max(self.size // (self.workers * 4), self.MIN_CHUNK_SIZE), self.MAX_CHUNK_SIZE)
+        bounds = []
+        start = 0
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            while start < self.size:
+                end = start + chunk_size
+                if end < self.size:
+                    cuts = [cut + len(separator) for separator in (b'\n\n', b'\n\r\n')
+                            for cut in (mm.find(separator, end),) if cut >= 0]
+                    end = min(cuts) if cuts else self.size
+                else:
+                    end = self.size
+                bounds.append((start, end))
+                start = end
+        return bounds
+    
+    def iter_chunk_results(self, chunks: List[Tuple[int, int]]):
+        """
+        Yield parse_snapshot_chunk results in chunk order, parsing ahead in worker processes
+        """
+        if self.workers == 1 or len(chunks) <= 1:
+            for start, end in chunks:
+                yield parse_snapshot_chunk(self.path, start, end)
+            return
+        pool = ProcessPoolExecutor(max_workers=min(self.workers, len(chunks)))
+        try:
+            # Only a few chunks per worker in flight, so a slow consumer does not pile up parsed results
+            pending = []
+            for start, end in chunks:
+                pending.append(pool.submit(parse_snapshot_chunk, self.path, start, end))
+                if len(pending) > 2 * self.workers:
+                    yield pending.pop(0).result()
+            for future in pending:
+                yield future.result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+    
+    def iter_users(self, query: UserQuery = UserQuery(), modified_since: Optional[str] = None):
+        """
+        Yield the users of the file matching the query, in file order
+        
+        Args:
+            query: Filters and size limit, applied client-side
+            modified_since: Unused; a snapshot has no delta query
+        """
+        returned = 0
+        for user in self.iter_records():
+            if not query.matches(user):
+                continue
+            if query.sizelimit and returned >= query.sizelimit:
+                print("Warning: Search result has been truncated by the size limit")
+                return
+            returned += 1
+            yield user
+    
+    def iter_records(self):
+        """
+        Yield every user record of the file
+        """
+        if self.size == 0:
+            return
+        self.metrics.count('bytes_read', self.size, self.name)
+        with open(self.path, 'rb') as f:
+            head = f.read(64 * 1024)
+        if self.STANDARD_OUTPUT_PATTERN.search(head):
+            with open(self.path, encoding='utf-8', errors='replace') as f:
+                yield from FreeIPAPasswordReset.standard_output_records(f.read())
+            return
+        
+        problems = []
+        line_offset = 0
+        for records, chunk_problems, newlines in self.iter_chunk_results(self.chunks()):
+            problems.extend((number + line_offset, problem) for number, problem in chunk_problems)
+            line_offset += newlines
+            yield from records
+        report_parse_problems(problems, self.metrics)
+    
+    def modify_expirations(self, assignments: List[Tuple[str, str]]) -> List[Tuple[bool, str]]:
+        return [(False, f"{self.path} is a read-only snapshot") for _ in assignments]
+
+
+class Replica:
+    """
+    One write target of a ReplicaSet, with its concurrency slots, health and statistics
+    """
+    
+    def __init__(self, name: str, backend, limit: int):
+        self.name = name
+        self.backend = backend
+        self.limit = max(1, limit)
+        self.in_flight = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.requests = 0
+        self.users = 0
+        self.succeeded = 0
+        self.busy = 0.0
+    
+    def healthy(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+
+class ReplicaSet:
+    """
+    Spread modifications over several IPA replicas
+    
+    Every replica has its own backend (and so its own connection pool) and
+    at most `limit` units in flight. Each unit goes to the healthy replica
+    with the lowest load relative to its limit. A replica whose requests fail
+    `EJECT_AFTER` times in a row (connection errors, or every change in the
+    unit failing transiently) is ejected for EJECT_SECONDS, doubling on each
+    repeated ejection. The unit that hit the failure is sent to the next
+    healthy replica straight away, since nothing in it was applied.
+    """
+    EJECT_AFTER = 3
+    EJECT_SECONDS = 30.0
+    EJECT_MAX_SECONDS = 300.0
+    
+    def __init__(self, replicas: List[Replica], metrics: Optional[Metrics] = None):
+        if not replicas:
+            raise ValueError("At least one replica is required")
+        self.replicas = replicas
+        self.name = replicas[0].backend.name
+        self.batch_size = min(replica.backend.batch_size for replica in replicas)
+        self.metrics = metrics
+        self._condition = threading.Condition()
+        self._next = 0
+        self._closed = False
+    
+    def _pick(self, exclude: set) -> Optional[Replica]:
+        now = time.monotonic()
+        candidates = [replica for replica in self.replicas
+                      if replica not in exclude and replica.in_flight < replica.limit]
+        healthy = [replica for replica in candidates if replica.healthy(now)]
+        if not healthy:
+            if any(replica.healthy(now) for replica in self.replicas if replica not in exclude):
+                return None
+            # Every replica is ejected: probe the one whose ejection ends first
+            healthy = sorted(candidates, key=lambda replica: replica.ejected_until)[:1]
+            if not healthy:
+                return None
+        # Least loaded relative to its limit; rotate the start so ties are spread evenly
+        self._next = (self._next + 1) % len(self.replicas)
+        order = {id(replica): (index - self._next) % len(self.replicas)
+                 for index, replica in enumerate(self.replicas)}
+        return min(healthy, key=lambda replica: (replica.in_flight / replica.limit, order[id(replica)]))
+    
+    def acquire(self, exclude: set) -> Optional[Replica]:
+        """
+        Reserve a slot on the best replica, waiting while all usable ones are full
+        
+        Returns:
+            Replica, or None when the set was closed or every replica is excluded
+        """
+        with self._condition:
+            while not self._closed:
+                if all(replica in exclude for replica in self.replicas):
+                    return None
+                replica = self._pick(exclude)
+                if replica is not None:
+                    replica.in_flight += 1
+                    return replica
+                self._condition.wait(1.0)
+            return None
+    
+    def release(self, replica: Replica, latency: float, outcomes: List[Tuple[bool, str]], failed: bool):
+        """
+        Free a slot and update the replica's statistics and health
+        """
+        with self._condition:
+            replica.in_flight -= 1
+            replica.requests += 1
+            replica.users += len(outcomes)
+            replica.succeeded += sum(1 for success, _ in outcomes if success)
+            replica.busy += latency
+            if failed:
+                replica.failures += 1
+                if replica.failures >= self.EJECT_AFTER:
+                    cooldown = min(self.EJECT_MAX_SECONDS, self.EJECT_SECONDS * 2 ** replica.ejections)
+                    replica.ejected_until = time.monotonic() + cooldown
+                    replica.ejections += 1
+                    replica.failures = 0
+                    print(f"Replica {replica.name} ejected for {cooldown:.0f}s after repeated failures")
+            else:
+                replica.failures = 0
+            self._condition.notify_all()
+        if self.metrics is not None:
+            self.metrics.observe('replica', latency, replica.name)
+            self.metrics.count('replica_users', len(outcomes), replica.name)
+    
+    def modify_expirations(self, assignments: List[Tuple[str, str]]) -> List[Tuple[bool, str]]:
+        """
+        Apply one unit on a replica, failing over to the next one when the replica is unhealthy
+        """
+        tried = set()
+        outcomes = [(False, "No replica available")] * len(assignments)
+        while True:
+            replica = self.acquire(tried)
+            if replica is None:
+                return outcomes
+            started = time.monotonic()
+            try:
+                outcomes = replica.backend.modify_expirations(assignments)
+            except Exception as e:
+                outcomes = [(False, str(e))] * len(assignments)
+            failed = all(not success and is_transient_error(error) for success, error in outcomes)
+            self.release(replica, time.monotonic() - started, outcomes, failed)
+            outcomes = [(success, f"{replica.name}: {error}" if error else error) for success, error in outcomes]
+            if not failed:
+                return outcomes
+            tried.add(replica)
+    
+    def close(self):
+        """
+        Wake up and fail everything waiting for a slot (used on Ctrl-C)
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+    
+    def report(self, elapsed: float):
+        """
+        Print per-replica throughput and health
+        """
+        for replica in self.replicas:
+            rate = replica.users / elapsed if elapsed > 0 else 0.0
+            average = replica.busy / replica.requests if replica.requests else 0.0
+            line = (f"  {replica.name}: {replica.users} users ({replica.succeeded} ok), {rate:.1f} users/s, "
+                    f"{replica.requests} requests, avg {average:.3f}s/request")
+            if replica.ejections:
+                line += f", ejected {replica.ejections}x"
+            print(line)
+
+
+class PolicyRule(NamedTuple):
+    """
+    One rule of an expiration policy
+    
+    Either a fixed expiration, or a relative one: users whose password
+    expires less than min_remaining_days from now (or is unset) are moved to
+    now + days.
+    """
+    select: str
+    expiration: Optional[str] = None
+    days: Optional[int] = None
+    min_remaining_days: int = 0
+    
+    def describe(self) -> str:
+        if self.expiration is not None:
+            return f"{self.select} = {self.expiration}"
+        return f"{self.select} = now+{self.days}d (if < now+{self.min_remaining_days}d)"
+
+
+def load_policy(path: str) -> List[PolicyRule]:
+    """
+    Load an expiration policy file
+    
+    Format (JSON), rules are evaluated in order and the first rule selecting a
+    user wins:
+        {"rules": [
+            {"select": "@contractors", "days": 90, "min_remaining_days": 14},
+            {"select": "svc_*,!svc_legacy", "expiration": "2030-12-31T12:00:00Z"}
+        ]}
+    
+    Raises:
+        ValueError: If the file is not a valid policy
+    """
+    try:
+        with open(path) as f:
+            document = json.load(f)
+    except OSError as e:
+        raise ValueError(f"Cannot read policy file - {e}")
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON in policy file - {e}")
+    
+    entries = document.get('rules') if isinstance(document, dict) else None
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("Policy file must contain a non-empty 'rules' list")
+    
+    rules = []
+    for number, entry in enumerate(entries, 1):
+        if not isinstance(entry, dict) or not isinstance(entry.get('select'), str):
+            raise ValueError(f"Rule {number}: 'select' is required")
+        if ('expiration' in entry) == ('days' in entry):
+            raise ValueError(f"Rule {number}: exactly one of 'expiration' or 'days' is required")
+        if 'expiration' in entry:
+            if math.isnan(parse_expiration_timestamp(str(entry['expiration']))):
+                raise ValueError(f"Rule {number}: unsupported expiration '{entry['expiration']}'")
+            rules.append(PolicyRule(entry['select'], expiration=str(entry['expiration'])))
+        else:
+            try:
+                days = int(entry['days'])
+                min_remaining = int(entry.get('min_remaining_days', 0))
+            except (TypeError, ValueError):
+                raise ValueError(f"Rule {number}: 'days' and 'min_remaining_days' must be integers")
+            if days <= 0 or min_remaining < 0 or min_remaining > days:
+                raise ValueError(f"Rule {number}: need days > 0 and 0 <= min_remaining_days <= days")
+            rules.append(PolicyRule(entry['select'], days=days, min_remaining_days=min_remaining))
+    return rules
+
+
+class PolicyChange(NamedTuple):
+    """
+    A modification required to bring one user in line with the policy
+    """
+    login: str
+    current: Optional[str]
+    target: str
+    rule: int
+
+
+class ExpirationSpread:
+    """
+    Deterministic spreading of password expirations over a window of days
+    
+    Every login hashes to a preferred day of the window and a second of that
+    day, so re-running the same spread gives every user the same expiration
+    again. With a daily cap, users whose preferred day is full move on to the
+    next day with room (wrapping around at the end of the window). Rebalancing
+    keeps users whose current expiration already lies in the window on a day
+    under the cap (by default an even share, ceil(users / days)) and only
+    moves the rest.
+    """
+    
+    def __init__(self, first_day: int, days: int, daily_cap: Optional[int] = None, rebalance: bool = False):
+        """
+        Args:
+            first_day: First day of the window, in days since the epoch (UTC)
+            days: Length of the window in days, END included
+            daily_cap: Most expirations on any single day (None: no cap)
+            rebalance: Keep current expirations that already fit the window
+        """
+        self.first_day = first_day
+        self.days = days
+        self.daily_cap = daily_cap
+        self.rebalance = rebalance
+    
+    @classmethod
+    def parse(cls, spec: str, daily_cap: Optional[int] = None, rebalance: bool = False) -> 'ExpirationSpread':
+        """
+        Build a spread from "START..END" (dates in any format --expiration accepts)
+        
+        Raises:
+            ValueError: If the range is malformed or END is before START
+        """
+        start, separator, end = spec.partition('..')
+        if not separator:
+            raise ValueError(f"'{spec}' is not a START..END range")
+        bounds = []
+        for value in (start.strip(), end.strip()):
+            epoch = parse_expiration_timestamp(value)
+            if math.isnan(epoch):
+                raise ValueError(f"unsupported date '{value}'")
+            bounds.append(int(epoch // 86400))
+        if bounds[1] < bounds[0]:
+            raise ValueError(f"'{spec}' ends before it starts")
+        return cls(bounds[0], bounds[1] - bounds[0] + 1, daily_cap, rebalance)
+    
+    def describe(self) -> str:
+        text = f"{self.day_label(0)}..{self.day_label(self.days - 1)} ({self.days} day(s)"
+        if self.daily_cap is not None:
+            text += f", at most {self.daily_cap} per day"
+        return text + (", rebalancing)" if self.rebalance else ")")
+    
+    def day_label(self, day: int) -> str:
+        return time.strftime('%Y-%m-%d', time.gmtime((self.first_day + day) * 86400))
+    
+    def day_of(self, epoch: float) -> Optional[int]:
+        """
+        Day of the window an expiration falls on, None when outside (or unset)
+        """
+        if math.isnan(epoch):
+            return None
+        day = int(epoch // 86400) - self.first_day
+        return day if 0 <= day < self.days else None
+    
+    def slot(self, login: str) -> Tuple[int, int]:
+        """
+        Preferred (day, second of day) of a login; stable across runs and machines
+        """
+        value = int.from_bytes(hashlib.blake2b(login.encode('utf-8'), digest_size=8).digest(), 'big')
+        return value % self.days, (value // self.days) % 86400
+    
+    def timestamp(self, day: int, second: int) -> str:
+        return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime((self.first_day + day) * 86400 + second))
+    
+    def plan(self, users: List[Tuple[str, Optional[str]]]) -> Tuple[List[PolicyChange], List[int], List[int]]:
+        """
+        Assign an expiration in the window to every user
+        
+        Args:
+            users: (login, current krbPasswordExpiration or None) pairs
+        
+        Returns:
+            tuple: (changes for users whose expiration moves, planned
+                    expirations per day, current expirations per day)
+        
+        Raises:
+            ValueError: If the users do not fit in the window under the daily cap
+        """
+        cap = self.daily_cap
+        if cap is None and self.rebalance:
+            cap = -(-len(users) // self.days)
+        if cap is not None and cap * self.days < len(users):
+            raise ValueError(f"{len(users)} users do not fit in {self.days} days at {cap} per day")
+        
+        # Users claim days in hash order, so which of them move does not depend on the input order
+        slots = {login: self.slot(login) for login, _ in users}
+        ordered = sorted(users, key=lambda user: (slots[user[0]], user[0]))
+        planned = [0] * self.days
+        current = [0] * self.days
+        moving = []
+        for login, value in ordered:
+            epoch = parse_expiration_timestamp(value)
+            day = self.day_of(epoch)
+            if day is not None:
+                current[day] += 1
+            if self.rebalance and day is not None and planned[day] < cap:
+                planned[day] += 1
+            else:
+                moving.append((login, value, epoch))
+        
+        # Next day that may have room, per day; full days are skipped with path halving
+        following = [(day + 1) % self.days if cap is not None and planned[day] >= cap else day
+                     for day in range(self.days)]
+        
+        def free_day(day):
+            while following[day] != day:
+                following[day] = following[following[day]]
+                day = following[day]
+            return day
+        
+        changes = []
+        for login, value, epoch in moving:
+            day, second = slots[login]
+            if cap is not None:
+                day = free_day(day)
+            planned[day] += 1
+            if cap is not None and planned[day] >= cap:
+                following[day] = (day + 1) % self.days
+            target = self.timestamp(day, second)
+            if math.isnan(epoch) or abs(epoch - parse_expiration_timestamp(target)) >= 1:
+                changes.append(PolicyChange(login, value, target, 0))
+        return changes, planned, current
+    
+    def histogram(self, planned: List[int], current: Optional[List[int]] = None, width: int = 40) -> List[str]:
+        """
+        Lines of a per-day load chart; long windows are shown a few days per
+        line, with the busiest day of each line
+        """
+        span = max(1, -(-self.days // 62))
+        lines = []
+        rows = []
+        for start in range(0, self.days, span):
+            end = min(start + span, self.days)
+            label = self.day_label(start) if span == 1 else f"{self.day_label(start)}..{self.day_label(end - 1)[5:]}"
+            rows.append((label, max(planned[start:end]), max(current[start:end]) if current else None))
+        peak = max([row[1] for row in rows] + [1])
+        header = "per day" if span == 1 else f"busiest day of each {span} days"
+        lines.append(f"Expirations {header}:" + ("   current -> planned" if current else ""))
+        for label, load, before in rows:
+            bar = '#' * round(load * width / peak)
+            if current:
+                lines.append(f"  {label:<17} {before:>7} -> {load:<7} {bar}".rstrip())
+            else:
+                lines.append(f"  {label:<17} {load:>7} {bar}".rstrip())
+        return lines
+
+
+class ModificationJournal:
+    """
+    Append-only, fsync'd JSON-lines journal of planned and completed modifications
+    
+    The plan is written and synced before any change is made. Outcomes are
+    queued by the workers and written by a background thread that syncs once
+    per group of records, so journaling never blocks the modification path.
+    A journal can be replayed with --resume: users whose last outcome was a
+    success are skipped, failed and unfinished ones are retried.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'a+', encoding='utf-8')
+        if self._file.tell() > 0:
+            # Terminate a line torn by a crash so new records start cleanly
+            self._file.seek(self._file.tell() - 1)
+            if self._file.read(1) != '\n':
+                self._file.write('\n')
+        self._queue: queue.Queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name='journal-writer', daemon=True)
+        self._writer.start()
+    
+    def _write(self, records: List[dict]):
+        self._file.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+    
+    def _write_loop(self):
+        stop = False
+        while not stop:
+            items = [self._queue.get()]
+            # Group commit: one fsync for everything queued meanwhile
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [item for item in items if isinstance(item, dict)]
+            if records:
+                self._write(records)
+            for item in items:
+                if isinstance(item, threading.Event):
+                    item.set()
+                elif item is None:
+                    stop = True
+    
+    def sync(self):
+        """
+        Block until everything queued so far is on disk
+        """
+        synced = threading.Event()
+        self._queue.put(synced)
+        synced.wait()
+    
+    def plan(self, assignments: List[Tuple[str, str]]):
+        """
+        Durably record the planned (username, expiration) pairs before starting
+        """
+        self._queue.put({'type': 'run', 'time': time.time(), 'planned': len(assignments)})
+        for username, expiration in assignments:
+            self._queue.put({'type': 'plan', 'user': username, 'expiration': expiration})
+        self.sync()
+    
+    def record(self, result: ModifyResult):
+        """
+        Queue the outcome of one modification (non-blocking)
+        """
+        self._queue.put({'type': 'done', 'user': result.username, 'expiration': result.expiration,
+                         'success': result.success, 'error': result.error, 'attempts': result.attempts,
+                         'time': time.time()})
+    
+    def close(self):
+        """
+        Write everything still queued and close the file
+        """
+        if self._file.closed:
+            return
+        self._queue.put(None)
+        self._writer.join()
+        self._file.close()
+    
+    @staticmethod
+    def pending(path: str) -> Tuple[List[Tuple[str, str]], int]:
+        """
+        Read a journal and return the assignments that still need to be applied
+        
+        Returns:
+            tuple: (pending (username, expiration) pairs in plan order, completed count)
+        
+        Raises:
+            OSError: If the journal cannot be read
+        """
+        planned: Dict[str, str] = {}
+        completed: Dict[str, str] = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn last line after a crash
+                    continue
+                if record.get('type') == 'plan':
+                    planned[record['user']] = record['expiration']
+                elif record.get('type') == 'done':
+                    if record.get('success'):
+                        completed[record['user']] = record['expiration']
+                    else:
+                        completed.pop(record['user'], None)
+        pending = [(user, expiration) for user, expiration in planned.items()
+                   if completed.get(user) != expiration]
+        return pending, len(planned) - len(pending)
+
+
+def default_cache_path() -> str:
+    """
+    Location of the user cache database (honours $XDG_CACHE_HOME)
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'freeipa-password-reset', 'users.sqlite')
+
+
+class UserCache:
+    """
+    SQLite cache of parsed user records, one set of rows per enumeration source
+    
+    A source is the backend/server/query combination the users came from. The
+    cache remembers when the source was last fully enumerated and the newest
+    modifyTimestamp seen, so backends that can search by modifyTimestamp only
+    have to fetch the entries changed since then. Deleted users are only
+    dropped on a full refresh (--refresh or after the TTL).
+    
+    One connection is shared by all threads (background enumeration, daemon
+    refreshes and write-through of modifications) and every access holds
+    the lock. No transaction stays open while a generator is suspended: a
+    full sync is staged in a temporary table and swapped in at the end.
+    """
+    SCHEMA_VERSION = 1
+    COLUMNS = ('login', 'first_name', 'last_name', 'uid', 'email', 'password_expiration', 'groups')
+    WRITE_CHUNK = 1000
+    
+    def __init__(self, path: str, source: str, ttl: float = 900, refresh: bool = False):
+        self.path = path
+        self.source = source
+        self.ttl = ttl
+        self.refresh = refresh
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != self.SCHEMA_VERSION:
+            self.db.executescript(f"""
+                DROP TABLE IF EXISTS users;
+                DROP TABLE IF EXISTS sync;
+                CREATE TABLE sync (
+                    source TEXT PRIMARY KEY,
+                    last_full REAL NOT NULL,
+                    last_sync REAL NOT NULL,
+                    max_modify TEXT
+                );
+                CREATE TABLE users (
+                    source TEXT NOT NULL,
+                    login TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    first_name TEXT, last_name TEXT, uid TEXT, email TEXT,
+                    password_expiration TEXT, groups TEXT, modify_timestamp TEXT,
+                    PRIMARY KEY (source, login)
+                );
+                CREATE INDEX users_position ON users (source, position);
+                PRAGMA user_version = {self.SCHEMA_VERSION};
+            """)
+        self.db.execute('CREATE TEMP TABLE staging AS SELECT * FROM users WHERE 0')
+    
+    def state(self) -> Optional[Tuple[float, float, Optional[str]]]:
+        """
+        (last_full, last_sync, max_modify) for this source, or None if never synced
+        """
+        with self.lock:
+            return self.db.execute('SELECT last_full, last_sync, max_modify FROM sync WHERE source = ?',
+                                   (self.source,)).fetchone()
+    
+    def needs_full_sync(self) -> bool:
+        state = self.state()
+        return self.refresh or state is None or time.time() - state[0] > self.ttl
+    
+    def _row(self, user: Dict[str, str], position: int) -> tuple:
+        groups = user.get('groups')
+        if groups is not None and not isinstance(groups, str):
+            groups = ", ".join(groups)
+        return ((self.source, user['login'], position)
+                + tuple(user.get(column) for column in self.COLUMNS[1:-1]) + (groups,)
+                + (user.get('modify_timestamp'),))
+    
+    def full_sync(self, users):
+        """
+        Replace the cached users of this source, yielding each user as it is stored
+        
+        Nothing replaces the cached users unless the whole enumeration completes.
+        """
+        max_modify = None
+        position = 0
+        rows = []
+        try:
+            with self.lock:
+                self.db.execute('DELETE FROM temp.staging')
+                self.db.commit()
+            for user in users:
+                if 'login' in user:
+                    rows.append(self._row(user, position))
+                    position += 1
+                    max_modify = max(max_modify or '', user.get('modify_timestamp') or '') or None
+                    if len(rows) >= self.WRITE_CHUNK:
+                        self._stage(rows)
+                        rows = []
+                yield user
+            self._stage(rows)
+            with self.lock:
+                now = time.time()
+                self.db.execute('DELETE FROM users WHERE source = ?', (self.source,))
+                self.db.execute('INSERT OR REPLACE INTO users SELECT * FROM temp.staging ORDER BY rowid')
+                self.db.execute('DELETE FROM temp.staging')
+                self.db.execute('INSERT OR REPLACE INTO sync VALUES (?, ?, ?, ?)',
+                                (self.source, now, now, max_modify))
+                self.db.commit()
+        except BaseException:
+            with self.lock:
+                self.db.rollback()
+                self.db.execute('DELETE FROM temp.staging')
+                self.db.commit()
+            raise
+    
+    def _stage(self, rows: List[tuple]):
+        with self.lock:
+            self.db.executemany('INSERT INTO temp.staging VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self.db.commit()
+    
+    def apply_delta(self, users) -> int:
+        """
+        Upsert users changed since the last sync, keeping their list position
+        
+        The changed entries are fetched first and written in one transaction.
+        
+        Returns:
+            int: Number of users updated or added
+        """
+        changed = [user for user in users if 'login' in user]
+        with self.lock:
+            max_modify = self.state()[2]
+            position = self.db.execute('SELECT COALESCE(MAX(position) + 1, 0) FROM users WHERE source = ?',
+                                       (self.source,)).fetchone()[0]
+            try:
+                for user in changed:
+                    existing = self.db.execute('SELECT position FROM users WHERE source = ? AND login = ?',
+                                               (self.source, user['login'])).fetchone()
+                    if existing is None:
+                        row_position = position
+                        position += 1
+                    else:
+                        row_position = existing[0]
+                    self.db.execute('INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                    self._row(user, row_position))
+                    max_modify = max(max_modify or '', user.get('modify_timestamp') or '') or None
+                self.db.execute('UPDATE sync SET last_sync = ?, max_modify = ? WHERE source = ?',
+                                (time.time(), max_modify, self.source))
+                self.db.commit()
+            except BaseException:
+                self.db.rollback()
+                raise
+        return len(changed)
+    
+    def iter_users(self):
+        """
+        Yield the cached users of this source in their original enumeration order
+        """
+        position = -1
+        while True:
+            # Read in chunks so the lock is not held while the caller processes the users
+            with self.lock:
+                rows = self.db.execute(f"SELECT position, {', '.join(self.COLUMNS)} FROM users "
+                                       "WHERE source = ? AND position > ? ORDER BY position LIMIT ?",
+                                       (self.source, position, self.WRITE_CHUNK)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield {column: value for column, value in zip(self.COLUMNS, row[1:]) if value is not None}
+            position = rows[-1][0]
+    
+    def update_expirations(self, changes: List[Tuple[str, str]]):
+        """
+        Write successful modifications through to the cache
+        """
+        rows = []
+        for login, expiration in changes:
+            try:
+                expiration = to_generalized_time(expiration)
+            except ValueError:
+                pass
+            rows.append((expiration, self.source, login))
+        with self.lock:
+            self.db.executemany('UPDATE users SET password_expiration = ? WHERE source = ? AND login = ?', rows)
+            self.db.commit()
+
+
 class FreeIPAPasswordReset:
-    def __init__(self, demo_mode=False):
-        self.users_data = []
+    # Up to this many users are looked up with one `ipa user-show` each; more re-enumerate the directory
+    CLI_LOOKUP_LIMIT = 25
+    
+    def __init__(self, demo_mode=False, workers=1, backend=None, query=None, cache=None,
+                 executor=None, command_timeout=30, adaptive=False, max_retries=3, retry_backoff=1.0,
+                 metrics=None):
+        self.users_data = UserTable()
+        # True while users_data came from a cache that only --cache-ttl keeps current
+        self.users_stale = False
+        # Seconds since that cache was filled, while users_stale
+        self.users_age: Optional[int] = None
         self.demo_mode = demo_mode
+        self.workers = max(1, workers)
+        self.adaptive = adaptive
+        self.limiter: Optional[AdaptiveLimiter] = None
+        self.journal: Optional[ModificationJournal] = None
+        self.replicas: Optional[ReplicaSet] = None
+        self.max_retries = max(0, max_retries)
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = 60.0
+        self._cancelled = threading.Event()
+        self.executor = executor or AsyncCommandExecutor(max_concurrency=self.workers)
+        self.metrics = metrics or Metrics()
+        if self.executor.metrics is None:
+            self.executor.metrics = self.metrics
+        self.command_timeout = command_timeout
+        self.backend = backend
+        self.query = query or UserQuery()
+        self.cache = cache
+        # Loaded by load_group_graph(); @group selections then include nested groups
+        self.group_graph: Optional[GroupGraph] = None
+        self.output_format = 'table'
+        self.columns: Optional[List[str]] = None
+        self.output = None
+        self._output_lock = threading.Lock()
     
     def install_to_system(self) -> bool:
         """
@@ -70,7 +3520,7 @@ class FreeIPAPasswordReset:
                 print("Usage examples:")
                 print(f"  {executable_name} --help")
                 print(f"  {executable_name} --demo --list-only")
-                print(f"  {executable_name} --demo --users user1,user2 --expiration 2030-12-31T12:00:00Z")
+                print(f"  {executable_name} --demo --users testuser1,testuser2 --expiration 2030-12-31T12:00:00Z")
                 return True
             else:
                 print("❌ Installation failed!")
@@ -83,28 +3533,22 @@ class FreeIPAPasswordReset:
             print(f"❌ Error during installation: {e}")
             return False
     
-    def execute_command(self, command: str) -> tuple:
+    def execute_command(self, command: List[str], timeout: Optional[float] = None) -> tuple:
         """
         Execute command directly on the system
         
+        The command is an argv list run without a shell on the async executor,
+        so calls from several worker threads run concurrently.
+        
         Args:
-            command: Command to execute
+            command: Command to execute (argv list)
+            timeout: Seconds before the command is killed (default: command_timeout)
             
         Returns:
             tuple: (return_code, stdout, stderr)
         """
         try:
-            result = subprocess.run(
-                command,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                timeout=30
-            )
-            return result.returncode, result.stdout, result.stderr
-        except subprocess.TimeoutExpired:
-            return 1, "", "Command execution timeout"
+            return self.executor.run(command, timeout=self.command_timeout if timeout is None else timeout)
         except Exception as e:
             return 1, "", str(e)
     
@@ -112,133 +3556,224 @@ class FreeIPAPasswordReset:
     
 
     
-    def get_users_list(self) -> bool:
+    def get_users_list(self, on_user=None, keep: bool = True, fresh: bool = False) -> bool:
         """
         Get user list information
+        
+        Args:
+            on_user: Optional callback(index, user) invoked for every user as soon
+                     as it has been parsed, while enumeration is still running
+            keep: Store the users in users_data; when False they are only passed
+                  to on_user (as parsed dicts) and users_data stays empty
+            fresh: Do not use a cached list that no delta refresh keeps current
         """
         print("Getting user list...")
+        self.users_data = UserTable()
+        self.users_stale = False
+        self.users_age = None
+        started = time.perf_counter()
+        count = 0
+        
+        try:
+            for user in self.iter_users(fresh):
+                count += 1
+                if keep:
+                    user = self.users_data[self.users_data.append(user)]
+                if on_user is not None:
+                    on_user(count, user)
+        except (EnumerationError, JsonRpcError, LdapError) as e:
+            self.metrics.error(str(e))
+            print(f"Error: Failed to get user list - {e}")
+            if isinstance(e, EnumerationError):
+                print("\nHint: If FreeIPA is not installed, try running with --demo flag for testing")
+            return False
+        
+        self.metrics.observe('enumerate', time.perf_counter() - started, self.backend_label)
+        self.metrics.count('users', count, self.backend_label)
+        return True
+    
+    def iter_users(self, fresh: bool = False):
+        """
+        Yield user records, from the local cache when it is fresh enough
+        
+        Args:
+            fresh: Re-enumerate instead of serving a cache that is only
+                   refreshed after --cache-ttl (delta refreshes are still used)
+        """
+        # Truncated enumerations must never end up in the cache
+        if self.cache is None or self.demo_mode or self.query.sizelimit:
+            yield from self.iter_source_users()
+            return
+        
+        supports_delta = getattr(self.backend, 'supports_delta', False)
+        if self.cache.needs_full_sync() or (fresh and not supports_delta):
+            print("Refreshing user cache...")
+            yield from self.cache.full_sync(self.iter_source_users())
+            return
         
+        last_full, last_sync, max_modify = self.cache.state()
+        if supports_delta:
+            since = max_modify or time.strftime('%Y%m%d%H%M%SZ', time.gmtime(last_sync - 600))
+            changed = self.cache.apply_delta(self.backend.iter_users(self.query, modified_since=since))
+            print(f"Using cached user list ({changed} users changed since last sync)")
+        else:
+            age = int(time.time() - last_full)
+            print(f"Using cached user list from {age // 60} minutes ago (use --refresh to re-enumerate)")
+            self.users_stale = True
+            self.users_age = age
+        yield from self.cache.iter_users()
+    
+    def iter_source_users(self):
+        """
+        Yield user records from the configured source as they are parsed
+        """
         # Demo mode - use mock data
         if self.demo_mode:
             print("Running in demo mode with mock data...")
             mock_data = """
-  User login: testuser1
-  First name: Test
-  Last name: User1
-  UID: 1001
-  Email address: testuser1@example.com
-  User password expiration: 2024-03-15T12:00:00Z
-  Member of groups: users, developers
-
-  User login: testuser2
-  First name: Test
-  Last name: User2
-  UID: 1002
-  Email address: testuser2@example.com
-  User password expiration: 2024-04-20T12:00:00Z
-  Member of groups: users
-
-  User login: admin
-  First name: Administrator
-  Last name: 
-  UID: 1000
-  Email address: admin@example.com
-  User password expiration: 2030-12-31T12:00:00Z
-  Member of groups: admins, users
+  dn: uid=testuser1,cn=users,cn=accounts,dc=example,dc=com
+  uid: testuser1
+  givenName: Test
+  sn: User1
+  uidNumber: 1001
+  mail: testuser1@example.com
+  krbPasswordExpiration: 2024-03-15T12:00:00Z
+  memberOf: cn=users,cn=groups,cn=accounts,dc=example,dc=com
+  memberOf: cn=developers,cn=groups,cn=accounts,dc=example,dc=com
+
+  dn: uid=testuser2,cn=users,cn=accounts,dc=example,dc=com
+  uid: testuser2
+  givenName: Test
+  sn: User2
+  uidNumber: 1002
+  mail: testuser2@example.com
+  krbPasswordExpiration: 2024-04-20T12:00:00Z
+  memberOf: cn=users,cn=groups,cn=accounts,dc=example,dc=com
+
+  dn: uid=admin,cn=users,cn=accounts,dc=example,dc=com
+  uid: admin
+  uidNumber: 1000
+  mail: admin@example.com
+  krbPasswordExpiration: 2030-12-31T12:00:00Z
+  memberOf: cn=admins,cn=groups,cn=accounts,dc=example,dc=com
+  memberOf: cn=users,cn=groups,cn=accounts,dc=example,dc=com
             """
-            self.parse_users_data(mock_data)
-            print(f"Demo mode - Loaded {len(self.users_data)} mock users")
-            return True
+            users = [user for user in StructuredOutputParser().parse(mock_data) if self.query.matches(user)]
+            # Before the first user, so it never lands inside a listing that is written as users arrive
+            print(f"Demo mode - Loaded {len(users)} mock users")
+            yield from users
+            return
         
-        # Use ipa user-find with structured output
-        command = 'ipa user-find --all --raw'
-        ret_code, stdout, stderr = self.execute_command(command)
+        if self.backend is not None:
+            yield from self.backend.iter_users(self.query)
+            return
         
-        # If the structured command fails, try the basic command
-        if ret_code != 0:
-            print("Structured command failed, trying basic command...")
-            command = 'ipa user-find --all'
-            ret_code, stdout, stderr = self.execute_command(command)
-            
-            if ret_code != 0:
-                print(f"Error: Failed to get user list - {stderr}")
-                print("\nHint: If FreeIPA is not installed, try running with --demo flag for testing")
-                return False
+        for user in self.iter_cli_users():
+            # The criteria argument of user-find is a substring match
+            if not self.query.login_prefix or user.get('login', '').startswith(self.query.login_prefix):
+                yield user
+    
+    def user_find_options(self) -> List[str]:
+        """
+        Build the ipa user-find arguments for the current query
         
-        # Parse user information
-        self.parse_users_data(stdout)
-        return True
+        The CLI has no attribute selection or paging; --all is required to get
+        krbPasswordExpiration and memberOf, so only filters and limits are pushed down.
+        """
+        options = [f"--sizelimit={self.query.sizelimit}"]
+        if self.query.timelimit:
+            options.append(f"--timelimit={self.query.timelimit}")
+        if self.query.group:
+            options.append(f"--in-groups={self.query.group}")
+        if self.query.login_prefix:
+            options.insert(0, self.query.login_prefix)
+        return options
     
-    def parse_users_data(self, raw_data: str):
+    def iter_cli_users(self):
         """
-        Parse user data - Enhanced to handle FreeIPA's actual output format
+        Yield users parsed from ipa user-find output while it streams in
         """
-        self.users_data = []
+        # Use ipa user-find with structured output, parsed while it streams in.
+        # Lines are kept only until the first structured record shows up, in
+        # case the output turns out to be in the standard format instead.
+        stream = self.executor.stream(['ipa', 'user-find', '--all', '--raw'] + self.user_find_options())
+        pending = []
+        structured = False
+        # Parse time is the time spent in here, minus waiting for output and the consumer
+        waited = [0.0]
+        parse_time = 0.0
+        
+        def buffered(lines):
+            iterator = iter(lines)
+            while True:
+                clock = time.perf_counter()
+                line = next(iterator, None)
+                waited[0] += time.perf_counter() - clock
+                if line is None:
+                    return
+                if not structured:
+                    pending.append(line)
+                yield line
+        
+        resumed = time.perf_counter()
+        parser = StructuredOutputParser()
+        for user in parser.parse_lines(buffered(stream)):
+            parse_time += time.perf_counter() - resumed
+            if not structured:
+                structured = True
+                pending = []
+            yield user
+            resumed = time.perf_counter()
+        parse_time += time.perf_counter() - resumed
+        self.metrics.observe('parse', max(0.0, parse_time - waited[0]), 'structured-stream')
         
-        # Try to parse structured output first (--raw format)
-        if self.parse_structured_output(raw_data):
+        if structured:
+            report_parse_problems(parser.problems, self.metrics)
+            if 'truncated' in stream.stderr:
+                print("Warning: Search result has been truncated by the server size/time limit")
+            elif stream.return_code != 0:
+                print(f"Warning: user-find exited with code {stream.return_code} - {stream.stderr.strip()}")
             return
         
-        # Fallback to parsing standard output
-        self.parse_standard_output(raw_data)
+        if stream.return_code == 0:
+            yield from self.standard_output_records(''.join(pending))
+            return
+        
+        # If the structured command fails, try the basic command
+        print("Structured command failed, trying basic command...")
+        command = ['ipa', 'user-find', '--all'] + self.user_find_options()
+        ret_code, stdout, stderr = self.execute_command(command)
+        
+        if ret_code != 0:
+            raise EnumerationError(stderr.strip())
+        
+        yield from self.standard_output_records(stdout)
     
     def parse_structured_output(self, raw_data: str) -> bool:
         """
         Parse structured FreeIPA output (--raw format)
         """
-        try:
-            lines = raw_data.split('\n')
-            current_user = {}
-            
-            for line in lines:
-                line = line.strip()
-                
-                if not line:
-                    if current_user and ('uid' in current_user or 'login' in current_user):
-                        self.users_data.append(current_user)
-                        current_user = {}
-                    continue
-                
-                if line.startswith('dn: uid='):
-                    # Extract username from DN
-                    try:
-                        login = line.split('uid=')[1].split(',')[0]
-                        current_user['login'] = login
-                    except:
-                        pass
-                elif ':' in line:
-                    key, value = line.split(':', 1)
-                    key = key.strip()
-                    value = value.strip()
-                    
-                    if key == 'givenName':
-                        current_user['first_name'] = value
-                    elif key == 'sn':
-                        current_user['last_name'] = value
-                    elif key == 'uidNumber':
-                        current_user['uid'] = value
-                    elif key == 'mail':
-                        current_user['email'] = value
-                    elif key == 'krbPasswordExpiration':
-                        current_user['password_expiration'] = value
-                    elif key == 'memberOf':
-                        if 'groups' in current_user:
-                            current_user['groups'] += f", {value.split(',')[0].split('=')[1]}"
-                        else:
-                            current_user['groups'] = value.split(',')[0].split('=')[1]
-            
-            # Add the last user
-            if current_user and ('uid' in current_user or 'login' in current_user):
-                self.users_data.append(current_user)
-            
-            return len(self.users_data) > 0
-        except:
+        parser = StructuredOutputParser()
+        with self.metrics.timed('parse', 'structured'):
+            self.users_data.extend(parser.parse(raw_data))
+        if not self.users_data:
             return False
+        report_parse_problems(parser.problems, self.metrics)
+        return True
     
     def parse_standard_output(self, raw_data: str):
         """
         Parse standard FreeIPA output format
         """
+        with self.metrics.timed('parse', 'standard'):
+            self.users_data.extend(self.standard_output_records(raw_data))
+    
+    @staticmethod
+    def standard_output_records(raw_data: str) -> List[Dict[str, str]]:
+        """
+        Reconstruct user records from standard (non --raw) FreeIPA output
+        """
+        users = []
         lines = raw_data.split('\n')
         
         # Collect all field data
@@ -281,135 +3816,398 @@ class FreeIPAPasswordReset:
                 if value:
                     field_data['groups'].append(value)
         
-        # Try to reconstruct users from field data
-        max_users = max(len(v) for v in field_data.values() if v)
+        # Try to reconstruct users from field data
+        if not any(field_data.values()):
+            return users
+        max_users = max(len(v) for v in field_data.values() if v)
+        
+        for i in range(max_users):
+            user = {}
+            
+            # Generate a login name if we don't have one
+            if i < len(field_data['first_names']) and i < len(field_data['last_names']):
+                first = field_data['first_names'][i]
+                last = field_data['last_names'][i]
+                user['login'] = f"{first.lower()}.{last.lower()}"
+                user['first_name'] = first
+                user['last_name'] = last
+            elif i < len(field_data['emails']):
+                email = field_data['emails'][i]
+                user['login'] = email.split('@')[0]
+                user['email'] = email
+            else:
+                user['login'] = f"user{i+1}"
+            
+            if i < len(field_data['uids']):
+                user['uid'] = field_data['uids'][i]
+            if i < len(field_data['emails']):
+                user['email'] = field_data['emails'][i]
+            if i < len(field_data['expirations']):
+                user['password_expiration'] = field_data['expirations'][i]
+            if i < len(field_data['groups']):
+                user['groups'] = field_data['groups'][i]
+            
+            users.append(user)
+        return users
+    
+    def create_exporter(self) -> UserExporter:
+        """
+        Exporter for the configured --format / --columns, writing to the data output
+        """
+        return UserExporter(self.output or sys.stdout, self.output_format, self.columns)
+    
+    def display_users(self, rows: Optional[List[int]] = None):
+        """
+        Display user list
+        
+        Args:
+            rows: Only show these row indexes (numbered as in the full list)
+        """
+        if not self.users_data and self.output_format == 'table':
+            print("No user data found")
+            return
+        
+        with self.metrics.timed('display', self.output_format):
+            exporter = self.create_exporter()
+            exporter.begin()
+            if rows is None:
+                for i, user in enumerate(self.users_data, 1):
+                    exporter.write(i, user)
+            else:
+                for row in rows:
+                    exporter.write(row + 1, self.users_data[row])
+            exporter.end()
+    
+    def list_users(self) -> bool:
+        """
+        Write the user list while enumeration is still running, without keeping it in memory
+        """
+        exporter = self.create_exporter()
+        display_time = [0.0]
+        
+        def on_user(index, user):
+            clock = time.perf_counter()
+            if exporter.count == 0:
+                exporter.begin()
+            exporter.write(index, user)
+            display_time[0] += time.perf_counter() - clock
+        
+        if not self.get_users_list(on_user=on_user, keep=False):
+            return False
+        if exporter.count:
+            exporter.end()
+        elif self.output_format == 'table':
+            print("No user data found")
+        else:
+            exporter.begin()
+            exporter.end()
+        self.metrics.observe('display', display_time[0], f"{self.output_format}-stream")
+        return True
+    
+    def list_selected_users(self, expression: str) -> bool:
+        """
+        List only the users selected by a --users/--group expression
+        """
+        if not self.get_users_list():
+            return False
+        try:
+            logins, warnings = self.selector().select(expression)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return False
+        for warning in warnings:
+            print(warning)
+        
+        rows = [self.users_data.index_of(login) for login in logins]
+        print(f"\n{len(rows)} of {len(self.users_data)} users selected")
+        if rows or self.output_format != 'table':
+            self.display_users(rows)
+        return True
+    
+    def resolve_users(self, expression: str) -> Optional[List[str]]:
+        """
+        Resolve a --users expression
+        
+        Plain login lists are used as-is; numbers, patterns, groups and
+        exclusions are evaluated against the enumerated user list.
+        """
+        if not UserSelector.needs_directory(expression):
+            return [u.strip() for u in expression.split(',') if u.strip()]
+        
+        if not self.get_users_list():
+            return None
+        try:
+            users, warnings = self.selector().select(expression)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return None
+        for warning in warnings:
+            print(warning)
+        return users
+    
+    def selector(self) -> UserSelector:
+        """
+        Selector over the enumerated users, resolving nested groups once the group graph is loaded
+        """
+        return UserSelector(self.users_data, self.group_graph)
+    
+    def load_group_graph(self) -> bool:
+        """
+        Fetch every group with its member/memberOf relations in one bulk query
+        and build the nested group graph used by @group selections
+        """
+        print("Getting group list...")
+        graph = GroupGraph()
+        started = time.perf_counter()
+        try:
+            for entry in self.iter_group_entries():
+                graph.add_entry(entry)
+        except (EnumerationError, JsonRpcError, LdapError) as e:
+            self.metrics.error(str(e))
+            print(f"Error: Failed to get group list - {e}")
+            return False
+        self.metrics.observe('enumerate_groups', time.perf_counter() - started, self.backend_label)
+        self.group_graph = graph
+        return True
+    
+    def iter_group_entries(self):
+        """
+        Yield raw group entries (attribute -> list of values) from the configured source
+        """
+        if self.demo_mode:
+            # staff nests developers and admins; admins is nested in developers as well
+            mock_groups = """
+  dn: cn=staff,cn=groups,cn=accounts,dc=example,dc=com
+  cn: staff
+  member: cn=developers,cn=groups,cn=accounts,dc=example,dc=com
+  member: cn=admins,cn=groups,cn=accounts,dc=example,dc=com
+
+  dn: cn=developers,cn=groups,cn=accounts,dc=example,dc=com
+  cn: developers
+  member: uid=test.user1,cn=users,cn=accounts,dc=example,dc=com
+  member: uid=test.user2,cn=users,cn=accounts,dc=example,dc=com
+  member: cn=admins,cn=groups,cn=accounts,dc=example,dc=com
+
+  dn: cn=admins,cn=groups,cn=accounts,dc=example,dc=com
+  cn: admins
+  member: uid=admin,cn=users,cn=accounts,dc=example,dc=com
+
+  dn: cn=users,cn=groups,cn=accounts,dc=example,dc=com
+  cn: users
+  member: uid=test.user1,cn=users,cn=accounts,dc=example,dc=com
+  member: uid=test.user2,cn=users,cn=accounts,dc=example,dc=com
+  member: uid=admin,cn=users,cn=accounts,dc=example,dc=com
+            """
+            yield from self.raw_group_entries(mock_groups)
+            return
+        
+        if self.backend is not None:
+            iter_groups = getattr(self.backend, 'iter_groups', None)
+            if iter_groups is None:
+                print(f"Note: The {self.backend.name} source has no group entries; "
+                      f"nested groups are resolved from the users' memberOf values only")
+                return
+            yield from iter_groups()
+            return
+        
+        ret_code, stdout, stderr = self.execute_command(['ipa', 'group-find', '--all', '--raw', '--sizelimit=0'])
+        if ret_code != 0:
+            raise EnumerationError(stderr.strip() or f"group-find exited with code {ret_code}")
+        if 'truncated' in stderr:
+            print("Warning: Group list has been truncated by the server size/time limit")
+        yield from self.raw_group_entries(stdout)
+    
+    @staticmethod
+    def raw_group_entries(output: str):
+        """
+        Group entries of `ipa group-find --all --raw` output
+        """
+        # The attribute lines are indented and never folded; without the
+        # indentation the output reads as LDIF (banner lines have no ':')
+        for dn, attrs in iter_ldif_entries(line.strip() for line in output.split('\n')):
+            attrs.setdefault('cn', [rdn_value(dn)])
+            yield attrs
+    
+    def load_fresh_users(self) -> bool:
+        """
+        Make sure users_data reflects the server before deciding which writes to skip
+        
+        A cached list that only --cache-ttl keeps current (every backend
+        without modifyTimestamp deltas) can be a day old, so it is enumerated
+        again; lists that are already current are kept.
+        """
+        if self.users_data and not self.users_stale:
+            return True
+        return self.get_users_list(fresh=True)
+    
+    def lookup_users(self, logins: List[str]) -> Optional[UserTable]:
+        """
+        Current directory entries of the given logins, never taken from the cache
+        
+        A user list already enumerated in this run (or brought up to date by a
+        modifyTimestamp delta) is current and used as is. Otherwise backends
+        that can fetch single users (JSON-RPC user_show batches, LDAP uid
+        filters) and the ipa client for up to CLI_LOOKUP_LIMIT users look up
+        just these logins, and the directory is enumerated afresh for the rest.
+        
+        Returns:
+            UserTable: The users found (unknown logins are missing), or None on errors
+        """
+        if self.users_data and not self.users_stale:
+            return self.users_data
+        unique = {}
+        for login in logins:
+            unique.setdefault(login.lower(), login)
+        unique = list(unique.values())
         
-        for i in range(max_users):
-            user = {}
-            
-            # Generate a login name if we don't have one
-            if i < len(field_data['first_names']) and i < len(field_data['last_names']):
-                first = field_data['first_names'][i]
-                last = field_data['last_names'][i]
-                user['login'] = f"{first.lower()}.{last.lower()}"
-                user['first_name'] = first
-                user['last_name'] = last
-            elif i < len(field_data['emails']):
-                email = field_data['emails'][i]
-                user['login'] = email.split('@')[0]
-                user['email'] = email
-            else:
-                user['login'] = f"user{i+1}"
-            
-            if i < len(field_data['uids']):
-                user['uid'] = field_data['uids'][i]
-            if i < len(field_data['emails']):
-                user['email'] = field_data['emails'][i]
-            if i < len(field_data['expirations']):
-                user['password_expiration'] = field_data['expirations'][i]
-            if i < len(field_data['groups']):
-                user['groups'] = field_data['groups'][i]
-            
-            self.users_data.append(user)
+        lookup = getattr(self.backend, 'lookup_users', None) if self.backend is not None else None
+        try:
+            if lookup is not None:
+                return UserTable(lookup(unique))
+            if self.backend is None and not self.demo_mode and len(unique) <= self.CLI_LOOKUP_LIMIT:
+                return UserTable(self.lookup_cli_users(unique))
+        except (EnumerationError, JsonRpcError, LdapError) as e:
+            self.metrics.error(str(e))
+            print(f"Error: Failed to look up users - {e}")
+            return None
+        if not self.load_fresh_users():
+            return None
+        return self.users_data
     
-    def display_users(self):
+    def lookup_cli_users(self, logins: List[str]) -> List[Dict[str, str]]:
         """
-        Display user list
+        One `ipa user-show --all --raw` per login, run with the configured workers
+        
+        Raises:
+            EnumerationError: On any failure other than an unknown user
         """
-        if not self.users_data:
-            print("No user data found")
-            return
-            
-        print("\n" + "="*120)
-        print(f"{'序号':<4} {'用户名':<15} {'名':<12} {'姓':<12} {'UID':<8} {'邮箱':<25} {'密码过期时间':<20} {'用户组':<20}")
-        print("="*120)
+        def show(login):
+            return login, self.execute_command(['ipa', 'user-show', login, '--all', '--raw'])
         
-        for i, user in enumerate(self.users_data, 1):
-            login = user.get('login', 'N/A')
-            first_name = user.get('first_name', 'N/A')
-            last_name = user.get('last_name', 'N/A')
-            uid = user.get('uid', 'N/A')
-            email = user.get('email', 'N/A')
-            expiration = user.get('password_expiration', 'N/A')
-            groups = user.get('groups', 'N/A')
-            
-            # Truncate long fields for display
-            if len(email) > 24:
-                email = email[:21] + "..."
-            if len(groups) > 19:
-                groups = groups[:16] + "..."
-            
-            print(f"{i:<4} {login:<15} {first_name:<12} {last_name:<12} {uid:<8} {email:<25} {expiration:<20} {groups:<20}")
+        users = []
+        if not logins:
+            return users
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(logins))) as pool:
+            for login, (ret_code, stdout, stderr) in pool.map(show, logins):
+                if ret_code == 0:
+                    users.extend(StructuredOutputParser().parse(stdout))
+                elif 'not found' not in stderr:
+                    raise EnumerationError(stderr.strip() or f"user-show {login} exited with code {ret_code}")
+        return users
+    
+    def disabled_logins(self) -> Optional[set]:
+        """
+        Logins of disabled (nsAccountLock) accounts, from one query filtered on the server
+        
+        Returns:
+            set: The disabled logins, or None when the source cannot tell
+        """
+        if self.demo_mode:
+            return set()
+        if self.backend is not None:
+            iter_disabled = getattr(self.backend, 'iter_disabled_logins', None)
+            return set(iter_disabled()) if iter_disabled is not None else None
         
-        print("="*120)
+        ret_code, stdout, stderr = self.execute_command(
+            ['ipa', 'user-find', '--disabled=true', '--pkey-only', '--sizelimit=0'])
+        if ret_code != 0:
+            raise EnumerationError(stderr.strip() or f"user-find exited with code {ret_code}")
+        return set(re.findall(r'^\s*User login:\s*(\S+)', stdout, re.MULTILINE))
     
-    def get_user_selection(self) -> List[str]:
+    def preflight_users(self, users: List[str], expiration_date: Optional[str] = None) -> Optional[List[str]]:
         """
-        Get user selection
+        Check a requested user list against the directory before modifying anything
+        
+        The requested users are looked up on the server (see lookup_users;
+        never from the cache, so no write is skipped on stale data) and
+        checked against the set of disabled accounts (one more query,
+        filtered on the server), instead of finding out through one failing
+        user-mod per user. Unknown and disabled users are reported and
+        dropped, as are users whose expiration already equals
+        expiration_date, and duplicates.
+        
+        Returns:
+            list: Users to modify, in the requested order (logins matched
+                  case-insensitively are replaced by the directory spelling);
+                  None when the directory cannot be read or none of the
+                  users exists
         """
-        while True:
-            print("\nPlease select users to modify:")
-            print("1. Enter user numbers (e.g.: 1,3,5 or 1-5)")
-            print("2. Enter usernames (e.g.: user1,user2)")
-            print("3. Enter 'all' to select all users")
-            
-            selection = input("Please enter your selection: ").strip()
-            
-            if not selection:
-                print("Input cannot be empty, please try again")
+        table = self.lookup_users(users)
+        if table is None:
+            return None
+        try:
+            disabled = self.disabled_logins()
+        except (EnumerationError, JsonRpcError, LdapError) as e:
+            self.metrics.error(str(e))
+            print(f"Warning: Cannot list disabled accounts, not checking them - {e}")
+            disabled = None
+        
+        epochs = table.expiration_epochs() if expiration_date else None
+        target = parse_expiration_timestamp(expiration_date)
+        lowered = None
+        valid, unknown, locked, compliant = [], [], [], []
+        seen = set()
+        for login in users:
+            row = table.index_of(login)
+            if row is None:
+                if lowered is None:
+                    lowered = {name.lower(): row for row, name in enumerate(table.logins)}
+                row = lowered.get(login.lower())
+            if row is None:
+                unknown.append(login)
                 continue
-                
-            if selection.lower() == 'all':
-                return [user['login'] for user in self.users_data]
-            
-            # Try to parse as numbers
-            if re.match(r'^[\d,-]+$', selection):
-                try:
-                    selected_users = []
-                    for part in selection.split(','):
-                        if '-' in part:
-                            start, end = map(int, part.split('-'))
-                            for i in range(start, end + 1):
-                                if 1 <= i <= len(self.users_data):
-                                    selected_users.append(self.users_data[i-1]['login'])
-                        else:
-                            i = int(part)
-                            if 1 <= i <= len(self.users_data):
-                                selected_users.append(self.users_data[i-1]['login'])
-                    return list(set(selected_users))  # Remove duplicates
-                except ValueError:
-                    print("Invalid number format, please try again")
-                    continue
-            
-            # Try to parse as usernames
-            usernames = [name.strip() for name in selection.split(',')]
-            valid_usernames = [user['login'] for user in self.users_data]
-            selected_users = []
-            
-            for username in usernames:
-                if username in valid_usernames:
-                    selected_users.append(username)
-                else:
-                    print(f"Warning: User '{username}' does not exist")
-            
-            if selected_users:
-                return selected_users
+            login = table.logins[row]
+            if login in seen:
+                continue
+            seen.add(login)
+            if disabled is not None and login in disabled:
+                locked.append(login)
+            elif epochs is not None and abs(epochs[row] - target) < 1:
+                compliant.append(login)
             else:
-                print("No valid users selected, please try again")
+                valid.append(login)
+        
+        print(f"\nPreflight: {len(users)} requested, {len(valid)} to modify")
+        for reason, label, logins in (('unknown', 'not found in the directory', unknown),
+                                      ('disabled', 'disabled accounts, skipped', locked),
+                                      ('compliant', f"already expiring at {expiration_date}", compliant)):
+            if logins:
+                self.metrics.count('preflight_skipped', len(logins), reason)
+                print(f"  {len(logins)} {label}: {abbreviate_list(logins)}")
+        duplicates = len(users) - len(valid) - len(unknown) - len(locked) - len(compliant)
+        if duplicates:
+            print(f"  {duplicates} duplicate(s) ignored")
+        if disabled is None:
+            print(f"  (the {self.backend_label} source cannot tell disabled accounts; they were not checked)")
+        if unknown and len(unknown) == len(users):
+            print("Error: None of the requested users exist")
+            return None
+        return valid
     
-    def get_expiration_date(self) -> str:
+    def get_expiration_date(self) -> Union[str, ExpirationSpread]:
         """
-        Get new expiration date
+        Get new expiration date, or a window to spread the expirations over
         """
         while True:
             print("\nPlease select password expiration time setting:")
             print("1. Enter specific date (format: YYYYMMDD, e.g.: 20301231)")
             print("2. Enter number of days (e.g.: 365 means expire after 365 days)")
             print("3. Use default value (June 30, 2030)")
+            print("4. Spread over a date range, a stable day per user (e.g.: 20300601..20300831)")
             
-            choice = input("Please enter your choice (1/2/3): ").strip()
+            choice = input("Please enter your choice (1/2/3/4): ").strip()
             
-            if choice == '3':
+            if choice == '4':
+                range_str = input("Please enter date range (START..END): ").strip()
+                cap_str = input("Maximum expirations per day (empty: no limit): ").strip()
+                try:
+                    daily_cap = int(cap_str) if cap_str else None
+                    if daily_cap is not None and daily_cap < 1:
+                        raise ValueError("the daily maximum must be at least 1")
+                    return ExpirationSpread.parse(range_str, daily_cap)
+                except ValueError as e:
+                    print(f"Invalid range ({e}), please try again")
+            elif choice == '3':
                 return "2030-06-30T12:00:00Z"
             elif choice == '1':
                 date_str = input("Please enter date (YYYYMMDD): ").strip()
@@ -436,46 +4234,309 @@ class FreeIPAPasswordReset:
                 except ValueError:
                     print("Please enter a valid number")
             else:
-                print("Invalid choice, please enter 1, 2, or 3")
+                print("Invalid choice, please enter 1, 2, 3, or 4")
     
-    def modify_user_expiration(self, username: str, expiration_date: str) -> bool:
+    def apply_expiration(self, username: str, expiration_date: str) -> Tuple[bool, str]:
         """
-        Modify user password expiration time
+        Apply a password expiration change without printing anything
+        
+        Args:
+            username: Login of the user to modify
+            expiration_date: New krbPasswordExpiration value
+            
+        Returns:
+            tuple: (success, error_message)
         """
         if self.demo_mode:
-            print(f"✓ [DEMO] Successfully modified user {username} password expiration time to {expiration_date}")
-            return True
+            return True, ""
         
-        command = f"ipa user-mod {username} --setattr=krbPasswordExpiration={expiration_date}"
+        command = ['ipa', 'user-mod', username, f"--setattr=krbPasswordExpiration={expiration_date}"]
         ret_code, stdout, stderr = self.execute_command(command)
         
         if ret_code != 0:
-            print(f"Error: Failed to modify user {username} - {stderr}")
-            return False
+            return False, stderr.strip()
+        return True, ""
+    
+    @property
+    def backend_label(self) -> str:
+        """
+        Name of the write path, used as a metrics label
+        """
+        if self.demo_mode:
+            return 'demo'
+        return self.backend.name if self.backend is not None else 'cli'
+    
+    def record_result(self, result: ModifyResult):
+        """
+        Account for one final modification outcome in the metrics and the journal
+        """
+        self.metrics.observe('modify', result.latency, self.backend_label)
+        self.metrics.count('modifications', label='success' if result.success else 'failure')
+        if result.attempts > 1:
+            self.metrics.count('retries', result.attempts - 1, self.backend_label)
+        if self.journal is not None:
+            self.journal.record(result)
+    
+    def report_modification(self, username: str, expiration_date: str, success: bool,
+                            error: str, progress: str = ""):
+        """
+        Print the outcome of one modification, serialized across worker threads
+        """
+        with self._output_lock:
+            if not success:
+                print(f"{progress}Error: Failed to modify user {username} - {error}")
+            elif self.demo_mode:
+                print(f"{progress}✓ [DEMO] Successfully modified user {username} password expiration time to {expiration_date}")
+            else:
+                print(f"{progress}✓ Successfully modified user {username} password expiration time to {expiration_date}")
+    
+    def apply_expirations(self, assignments: List[Tuple[str, str]]) -> List[Tuple[bool, str]]:
+        """
+        Apply a unit of (username, expiration) changes through the configured backend
         
-        print(f"✓ Successfully modified user {username} password expiration time to {expiration_date}")
-        return True
+        Returns:
+            list: (success, error_message) for each assignment, in order
+        """
+        if self.demo_mode:
+            return [self.apply_expiration(username, expiration) for username, expiration in assignments]
+        if self.replicas is not None:
+            return self.replicas.modify_expirations(assignments)
+        if self.backend is not None:
+            return self.backend.modify_expirations(assignments)
+        return [self.apply_expiration(username, expiration) for username, expiration in assignments]
+    
+    def _timed_apply(self, assignments: List[Tuple[str, str]], limiter: Optional[AdaptiveLimiter] = None) -> List[ModifyResult]:
+        """
+        Apply one unit, retrying transient failures with jittered exponential backoff
+        
+        Only the assignments that failed transiently are retried. When a limiter
+        is given, each attempt holds one of its slots and reports its latency.
+        """
+        results: List[Optional[ModifyResult]] = [None] * len(assignments)
+        pending = list(range(len(assignments)))
+        started = time.monotonic()
+        attempt = 1
+        
+        while True:
+            batch = [assignments[i] for i in pending]
+            if limiter is not None and not limiter.acquire():
+                for i in pending:
+                    results[i] = ModifyResult(*assignments[i], False, "Cancelled", 0.0, attempt)
+                return results
+            
+            attempt_started = time.monotonic()
+            try:
+                outcomes = self.apply_expirations(batch)
+            except Exception as e:
+                outcomes = [(False, str(e))] * len(batch)
+            latency = time.monotonic() - attempt_started
+            self.metrics.observe('modify_attempt', latency, self.backend_label)
+            
+            retry = [i for i, (success, error) in zip(pending, outcomes)
+                     if not success and is_transient_error(error)]
+            if limiter is not None:
+                new_limit = limiter.release(latency, overloaded=bool(retry))
+                if new_limit is not None:
+                    with self._output_lock:
+                        print(f"Server under pressure, reducing concurrency to {new_limit}")
+            
+            for i, (success, error) in zip(pending, outcomes):
+                results[i] = ModifyResult(*assignments[i], success, error, time.monotonic() - started, attempt)
+                if not success:
+                    self.metrics.error(error)
+            
+            if not retry or attempt > self.max_retries or self._cancelled.is_set():
+                return results
+            
+            # Full jitter: sleep a random time up to the exponential backoff cap
+            delay = random.uniform(0, min(self.retry_backoff_max, self.retry_backoff * 2 ** (attempt - 1)))
+            if self._cancelled.wait(delay):
+                return results
+            attempt += 1
+            pending = retry
+    
+    def execute_modifications(self, users: List[str], expiration_date: str) -> List[ModifyResult]:
+        """
+        Modify all given users, in parallel when more than one worker is configured
+        
+        Args:
+            users: Logins to modify
+            expiration_date: New krbPasswordExpiration value
+            
+        Returns:
+            list: One ModifyResult per user, in the same order as users
+        """
+        return self.execute_assignments([(username, expiration_date) for username in users])
+    
+    def execute_assignments(self, assignments: List[Tuple[str, str]]) -> List[ModifyResult]:
+        """
+        Apply (username, expiration) pairs, in parallel when more than one worker is configured
+        
+        Pairs are grouped into units of the backend's batch size (one user per
+        unit for the ipa CLI) and units are spread over the worker pool (and
+        over the replicas, when configured).
+        
+        Returns:
+            list: One ModifyResult per pair, in the same order
+        """
+        total = len(assignments)
+        writer = self.replicas or self.backend
+        batch_size = writer.batch_size if writer is not None and not self.demo_mode else 1
+        units = [assignments[start:start + batch_size] for start in range(0, total, batch_size)]
+        results: List[Optional[ModifyResult]] = [None] * total
+        if self.journal is not None:
+            self.journal.plan(assignments)
+        
+        if self.workers <= 1 or len(units) <= 1:
+            index = 0
+            for unit in units:
+                for result in self._timed_apply(unit):
+                    self.report_modification(result.username, result.expiration, result.success, result.error)
+                    self.record_result(result)
+                    results[index] = result
+                    index += 1
+            return results
+        
+        limiter = None
+        if self.adaptive:
+            limiter = AdaptiveLimiter(maximum=min(self.workers, len(units)))
+            self.limiter = limiter
+            print(f"Running modifications with adaptive concurrency "
+                  f"(start {int(limiter.limit)}, max {limiter.maximum} workers)...")
+        else:
+            print(f"Running modifications with {min(self.workers, len(units))} workers...")
+        done = 0
+        self._cancelled.clear()
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(units))) as pool:
+            futures = {
+                pool.submit(self._timed_apply, unit, limiter): index * batch_size
+                for index, unit in enumerate(units)
+            }
+            try:
+                for future in as_completed(futures):
+                    for offset, result in enumerate(future.result()):
+                        results[futures[future] + offset] = result
+                        self.record_result(result)
+                        done += 1
+                        self.report_modification(result.username, result.expiration, result.success,
+                                                 result.error, progress=f"[{done}/{total}] ")
+            except KeyboardInterrupt:
+                for future in futures:
+                    future.cancel()
+                # Wake up waiting workers and kill the commands still running so the threads can finish
+                self._cancelled.set()
+                if limiter is not None:
+                    limiter.close()
+                if self.replicas is not None:
+                    self.replicas.close()
+                self.executor.cancel_all()
+                raise
+        return results
+    
+    def print_modify_summary(self, results: List[ModifyResult], elapsed: float):
+        """
+        Print the final summary of a modification run
+        """
+        success_count = sum(1 for result in results if result.success)
+        print(f"\nOperation completed: Successfully modified {success_count}/{len(results)} users")
+        
+        if not results:
+            return
+        
+        latencies = sorted(result.latency for result in results)
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        rate = len(results) / elapsed if elapsed > 0 else 0.0
+        print(f"Elapsed: {elapsed:.2f}s, {rate:.1f} users/s, workers: {min(self.workers, len(results))}")
+        print(f"Latency: avg {sum(latencies) / len(latencies):.3f}s, p50 {p50:.3f}s, "
+              f"p95 {p95:.3f}s, max {latencies[-1]:.3f}s")
+        retried = sum(1 for result in results if result.attempts > 1)
+        if retried:
+            print(f"Retried: {retried} users ({sum(result.attempts - 1 for result in results)} retries)")
+        if self.replicas is not None and not self.demo_mode:
+            print("Replicas:")
+            self.replicas.report(elapsed)
+        if self.limiter is not None:
+            print(f"Adaptive concurrency: final {int(self.limiter.limit)}, lowest {int(self.limiter.lowest_limit)}, "
+                  f"max {self.limiter.maximum}, {self.limiter.decreases} decreases")
+        
+        failures = [result for result in results if not result.success]
+        if failures:
+            print(f"\nFailed users ({len(failures)}):")
+            for result in failures:
+                print(f"  {result.username}: {result.error or 'unknown error'}")
+    
+    def record_modifications(self, results: List[ModifyResult]):
+        """
+        Keep the user cache in line with the modifications that succeeded
+        """
+        if self.cache is None or self.demo_mode:
+            return
+        self.cache.update_expirations([(result.username, result.expiration) for result in results if result.success])
+    
+    def browse_users(self, full_screen: bool = True) -> Optional[List[str]]:
+        """
+        Enumerate users in the background while the user browses, filters and marks them
+        
+        Args:
+            full_screen: Use the curses browser when running on a terminal
+        
+        Returns:
+            list: Selected logins, or None when cancelled or the enumeration failed
+        """
+        browser = UserBrowser(select=lambda expression: self.selector().select(expression))
+        outcome = []
+        
+        def add(count, user):
+            # The full-screen browser hides printed messages until it closes
+            if count == 1 and self.users_stale:
+                browser.note = f"cached {self.users_age // 60} min ago, --refresh to re-enumerate"
+            browser.add(count, user)
+        
+        def enumerate_users():
+            success = False
+            try:
+                success = self.get_users_list(on_user=add)
+            finally:
+                outcome.append(success)
+                browser.finish(success)
+        
+        loader = threading.Thread(target=enumerate_users, name='enumerate-users', daemon=True)
+        loader.start()
+        selection = browser.browse(full_screen)
+        if selection is None:
+            if not browser.failed:
+                print("Operation cancelled")
+            return None
+        
+        # Spreading and the cache need the complete list; the selection is kept either way
+        if loader.is_alive():
+            print("Waiting for the user list to finish loading...")
+        loader.join()
+        if not outcome[0]:
+            return None
+        return selection
     
-    def run_interactive(self):
+    def run_interactive(self, full_screen: bool = True):
         """
         Run interactive mode
+        
+        Args:
+            full_screen: Browse users in the curses browser rather than on plain lines
         """
         print("FreeIPA User Password Expiration Reset Tool")
         print("="*50)
         
-        # Get user list
-        if not self.get_users_list():
+        # Get user selection while the user list is still loading
+        selected_users = self.browse_users(full_screen)
+        if not selected_users:
             return False
-        
-        # Display user list
-        self.display_users()
-        
-        # Get user selection
-        selected_users = self.get_user_selection()
-        print(f"\nSelected users: {', '.join(selected_users)}")
+        print(f"\nSelected users: {abbreviate_list(selected_users)}")
         
         # Get expiration time
         expiration_date = self.get_expiration_date()
+        if isinstance(expiration_date, ExpirationSpread):
+            return self.run_spread(selected_users, expiration_date, confirm=True)
         print(f"Set expiration time to: {expiration_date}")
         
         # 确认操作
@@ -485,12 +4546,10 @@ class FreeIPAPasswordReset:
             return False
         
         # Execute modification
-        success_count = 0
-        for username in selected_users:
-            if self.modify_user_expiration(username, expiration_date):
-                success_count += 1
-        
-        print(f"\nOperation completed: Successfully modified {success_count}/{len(selected_users)} users")
+        started = time.monotonic()
+        results = self.execute_modifications(selected_users, expiration_date)
+        self.print_modify_summary(results, time.monotonic() - started)
+        self.record_modifications(results)
         return True
     
     def run_batch(self, users: List[str], expiration_date: str):
@@ -500,30 +4559,754 @@ class FreeIPAPasswordReset:
         print("FreeIPA User Password Expiration Reset Tool - Batch Mode")
         print("="*60)
         
-        print(f"Batch modify users: {', '.join(users)}")
-        print(f"Set expiration time to: {expiration_date}")
+        print(f"Batch modify users: {abbreviate_list(users)}")
+        print(f"Set expiration time to: {expiration_date}")
+        
+        # Execute modification
+        started = time.monotonic()
+        results = self.execute_modifications(users, expiration_date)
+        self.print_modify_summary(results, time.monotonic() - started)
+        self.record_modifications(results)
+        return True
+    
+    def run_spread(self, users: List[str], spread: ExpirationSpread, dry_run: bool = False,
+                   confirm: bool = False) -> bool:
+        """
+        Spread the expirations of the given users over a window of days
+        
+        Users already on their planned expiration are not written again, so
+        re-running a spread only touches users that are new or were moved.
+        
+        Args:
+            users: Logins to spread
+            spread: Window, daily cap and rebalancing
+            dry_run: Only show the planned distribution
+            confirm: Ask before applying the changes (interactive mode)
+        """
+        print("FreeIPA User Password Expiration Reset Tool - Spread Mode")
+        print("="*60)
+        
+        # Current expirations decide who is skipped or kept in place: when writing,
+        # never take them from a cache that only --cache-ttl refreshes
+        if dry_run:
+            loaded = bool(self.users_data) or self.get_users_list()
+        else:
+            loaded = self.load_fresh_users()
+        if not loaded:
+            return False
+        table = self.users_data
+        current = []
+        for login in users:
+            row = table.index_of(login)
+            current.append((login, table.expirations[row] if row is not None else None))
+        
+        try:
+            changes, planned, before = spread.plan(current)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return False
+        
+        print(f"Spread {len(users)} users over {spread.describe()}")
+        for line in spread.histogram(planned, before if spread.rebalance else None):
+            print(line)
+        print(f"\nPer day: min {min(planned)}, max {max(planned)}, average {len(users) / spread.days:.1f}; "
+              f"{len(changes)} users to change, {len(users) - len(changes)} already in place")
+        
+        if dry_run or not changes:
+            if dry_run:
+                print("Dry run - no changes applied")
+            return True
+        if confirm:
+            answer = input(f"\nConfirm to modify password expiration time for {len(changes)} users? (y/N): ")
+            if answer.strip().lower() != 'y':
+                print("Operation cancelled")
+                return False
+        
+        started = time.monotonic()
+        results = self.execute_assignments([(change.login, change.target) for change in changes])
+        self.print_modify_summary(results, time.monotonic() - started)
+        self.record_modifications(results)
+        return True
+    
+    def run_resume(self, journal_path: str) -> bool:
+        """
+        Resume an interrupted run from its journal, skipping users already modified
+        """
+        print("FreeIPA User Password Expiration Reset Tool - Resume Mode")
+        print("="*60)
+        
+        try:
+            pending, completed = ModificationJournal.pending(journal_path)
+        except OSError as e:
+            print(f"Error: Cannot read journal - {e}")
+            return False
+        
+        print(f"Journal {journal_path}: {completed} users already modified, {len(pending)} remaining")
+        if not pending:
+            return True
+        
+        started = time.monotonic()
+        results = self.execute_assignments(pending)
+        self.print_modify_summary(results, time.monotonic() - started)
+        self.record_modifications(results)
+        return True
+    
+    def run_expiration_query(self, window: ExpirationWindow, users_expression: Optional[str] = None,
+                             expiration_date: Optional[str] = None, spread: Optional[ExpirationSpread] = None,
+                             dry_run: bool = False) -> bool:
+        """
+        List users in an expiration window, or re-set their expiration when expiration_date is given
+        
+        Args:
+            window: Expiration conditions
+            users_expression: Optional --users expression restricting the candidates
+            expiration_date: New expiration for all matched users (list only when None)
+            spread: Spread the matched users over a window of days instead
+            dry_run: With spread: only show the planned distribution
+        """
+        if not self.get_users_list():
+            return False
+        
+        rows = self.users_data.select_by_expiration(window)
+        if users_expression:
+            try:
+                selected, warnings = self.selector().select(users_expression)
+            except ValueError as e:
+                print(f"Error: {e}")
+                return False
+            for warning in warnings:
+                print(warning)
+            wanted = {self.users_data.index_of(login) for login in selected}
+            rows = [row for row in rows if row in wanted]
+        
+        print(f"\n{len(rows)} of {len(self.users_data)} users {window.describe()}")
+        if not rows:
+            if self.output_format != 'table':
+                # Machine-readable listings are written even when empty
+                self.display_users(rows)
+            return True
+        self.display_users(rows)
+        
+        logins = [self.users_data.logins[row] for row in rows]
+        if spread is not None:
+            return self.run_spread(logins, spread, dry_run)
+        if expiration_date is None:
+            return True
+        return self.run_batch(logins, expiration_date)
+    
+    def plan_policy(self, rules: List[PolicyRule], now: Optional[float] = None) -> Tuple[List[PolicyChange], int, int]:
+        """
+        Evaluate a policy against the enumerated users
+        
+        Returns:
+            tuple: (changes, compliant_count, unmatched_count)
+        """
+        now = time.time() if now is None else now
+        table = self.users_data
+        selector = self.selector()
+        epochs = table.expiration_epochs()
+        assigned = bytearray(len(table))
+        changes = []
+        compliant = 0
+        
+        for number, rule in enumerate(rules, 1):
+            logins, warnings = selector.select(rule.select)
+            for warning in warnings:
+                print(f"Rule {number}: {warning}")
+            
+            if rule.expiration is not None:
+                target = rule.expiration
+                target_epoch = parse_expiration_timestamp(target)
+            else:
+                target = time.strftime('%Y-%m-%dT12:00:00Z', time.gmtime(now + rule.days * 86400))
+                threshold = now + rule.min_remaining_days * 86400
+            
+            for login in logins:
+                row = table.index_of(login)
+                if assigned[row]:
+                    continue
+                assigned[row] = 1
+                current = epochs[row]
+                if rule.expiration is not None:
+                    in_line = abs(current - target_epoch) < 1
+                else:
+                    in_line = current >= threshold
+                if in_line:
+                    compliant += 1
+                else:
+                    changes.append(PolicyChange(login, table.expirations[row], target, number))
+        
+        return changes, compliant, len(table) - sum(assigned)
+    
+    def run_reconcile(self, policy_path: str, dry_run: bool = False) -> bool:
+        """
+        Bring password expirations in line with a policy file, writing only the users that differ
+        """
+        print("FreeIPA User Password Expiration Reset Tool - Reconcile Mode")
+        print("="*60)
+        
+        try:
+            rules = load_policy(policy_path)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return False
+        
+        # The diff decides which users are written: never take it from a cache only --cache-ttl refreshes
+        if not self.get_users_list(fresh=not dry_run):
+            return False
+        
+        try:
+            changes, compliant, unmatched = self.plan_policy(rules)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return False
+        
+        print("\nPolicy rules:")
+        for number, rule in enumerate(rules, 1):
+            print(f"  #{number} {rule.describe()}")
+        
+        if changes:
+            print(f"\n  {'用户名':<20} {'当前过期时间':<22}    {'目标过期时间':<22} 规则")
+            for change in changes:
+                print(f"~ {change.login:<20} {change.current or 'N/A':<22} -> {change.target:<22} #{change.rule}")
+        
+        print(f"\n{len(self.users_data)} users evaluated: {len(changes)} to change, "
+              f"{compliant} already compliant, {unmatched} not covered by any rule")
+        
+        if dry_run or not changes:
+            if dry_run:
+                print("Dry run - no changes applied")
+                if self.users_stale:
+                    print("(diff computed from the cached user list; an actual run re-enumerates first)")
+            return True
+        
+        started = time.monotonic()
+        results = self.execute_assignments([(change.login, change.target) for change in changes])
+        self.print_modify_summary(results, time.monotonic() - started)
+        self.record_modifications(results)
+        return True
+
+def default_socket_path() -> str:
+    """
+    Location of the daemon socket ($XDG_RUNTIME_DIR, else the temp directory)
+    """
+    base = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(base, f"freeipa-password-reset-{os.getuid()}.sock")
+
+
+class ResetDaemon:
+    """
+    Serve list/query/modify requests from a warm tool instance over a Unix socket
+    
+    The daemon enumerates the directory once, keeps the UserTable, the backend
+    (and its credentials/session pool) and the command executor alive, and
+    re-enumerates every refresh_interval seconds in the background. Requests
+    and responses are JSON lines; a response is a stream of "user" or
+    "result" lines followed by one "done" line. The socket is created with
+    mode 0600, so only the owner (and root) can connect.
+    """
+    
+    def __init__(self, tool: 'FreeIPAPasswordReset', socket_path: str, refresh_interval: float = 300):
+        self.tool = tool
+        self.socket_path = socket_path
+        self.refresh_interval = refresh_interval
+        self.table = UserTable()
+        self.loaded_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self._modify_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.server = None
+    
+    def refresh(self) -> bool:
+        """
+        Re-enumerate the directory and swap in the new table
+        """
+        with self._refresh_lock:
+            if not self.tool.get_users_list():
+                return False
+            if self.tool.group_graph is not None and not self.tool.load_group_graph():
+                return False
+            self.table = self.tool.users_data
+            self.loaded_at = time.time()
+            print(f"Daemon: user index loaded, {len(self.table)} users")
+            return True
+    
+    def _refresh_loop(self):
+        while not self._stopped.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Daemon: background refresh failed - {e}")
+    
+    def select_rows(self, table: UserTable, request: dict) -> List[int]:
+        """
+        Rows selected by a request's users expression and/or expiration window
+        
+        Raises:
+            ValueError: On an invalid selection expression or date
+        """
+        before = None
+        if request.get('before'):
+            before = parse_expiration_timestamp(request['before'])
+            if math.isnan(before):
+                raise ValueError(f"Unsupported date '{request['before']}'")
+        window = ExpirationWindow(expired=bool(request.get('expired')),
+                                  within_days=request.get('within_days'), before=before)
+        rows = table.select_by_expiration(window) if window else list(range(len(table)))
+        if request.get('users'):
+            logins, _ = UserSelector(table, self.tool.group_graph).select(request['users'])
+            wanted = {table.index_of(login) for login in logins}
+            rows = [row for row in rows if row in wanted]
+        return rows
+    
+    def op_ping(self, request: dict, send):
+        send({'type': 'done', 'ok': True, 'users': len(self.table),
+              'age': round(time.time() - self.loaded_at, 3), 'pid': os.getpid()})
+    
+    def op_refresh(self, request: dict, send):
+        ok = self.refresh()
+        send({'type': 'done', 'ok': ok, 'users': len(self.table),
+              'error': "" if ok else "Enumeration failed, see the daemon log"})
+    
+    def op_list(self, request: dict, send):
+        table = self.table
+        rows = self.select_rows(table, request)
+        for row in rows:
+            send({'type': 'user', 'row': row + 1, 'user': table[row].to_dict()})
+        send({'type': 'done', 'ok': True, 'count': len(rows), 'total': len(table)})
+    
+    def op_modify(self, request: dict, send):
+        expiration = request.get('expiration')
+        if not expiration:
+            raise ValueError("'expiration' is required")
+        if request.get('users') and not UserSelector.needs_directory(request['users']) \
+                and not any(request.get(key) for key in ('expired', 'within_days', 'before')):
+            logins = [login.strip() for login in request['users'].split(',') if login.strip()]
+        else:
+            table = self.table
+            logins = [table.logins[row] for row in self.select_rows(table, request)]
+        if not logins:
+            raise ValueError("No users selected")
+        
+        with self._modify_lock:
+            results = self.tool.execute_assignments([(login, expiration) for login in logins])
+            # The index answers the next request; the cache only matters for the next start
+            for result in results:
+                if result.success:
+                    self.table.set_expiration(result.username, result.expiration)
+            try:
+                self.tool.record_modifications(results)
+            except sqlite3.Error as e:
+                print(f"Daemon: user cache not updated - {e}")
+        for result in results:
+            send({'type': 'result', 'user': result.username, 'expiration': result.expiration,
+                  'success': result.success, 'error': result.error, 'attempts': result.attempts,
+                  'latency': round(result.latency, 6)})
+        send({'type': 'done', 'ok': True, 'count': len(results),
+              'succeeded': sum(1 for result in results if result.success)})
+    
+    def handle(self, request: dict, send):
+        """
+        Dispatch one request; errors are reported to the client as a failed "done" line
+        """
+        operation = getattr(self, f"op_{request.get('op', '')}", None)
+        if operation is None:
+            send({'type': 'done', 'ok': False, 'error': f"Unknown operation '{request.get('op')}'"})
+            return
+        try:
+            operation(request, send)
+        except (ValueError, TypeError) as e:
+            send({'type': 'done', 'ok': False, 'error': str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            raise
+        except Exception as e:
+            # One failing request must not take the connection (or the daemon) down
+            print(f"Daemon: {request.get('op')} failed - {e}")
+            send({'type': 'done', 'ok': False, 'error': f"{type(e).__name__}: {e}"})
+    
+    def serve_forever(self) -> bool:
+        """
+        Load the user index and serve until interrupted
+        """
+        if not self.refresh():
+            return False
+        
+        daemon = self
         
-        # Execute modification
-        success_count = 0
-        for username in users:
-            if self.modify_user_expiration(username, expiration_date):
-                success_count += 1
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    self.serve_requests()
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client went away mid-response (e.g. piped into head)
+                    pass
+            
+            def serve_requests(self):
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    
+                    def send(message):
+                        self.wfile.write(json.dumps(message, ensure_ascii=False).encode() + b"\n")
+                    
+                    try:
+                        request = json.loads(line)
+                    except ValueError:
+                        send({'type': 'done', 'ok': False, 'error': "Malformed request"})
+                        continue
+                    daemon.handle(request, send)
+                    self.wfile.flush()
         
-        print(f"\nOperation completed: Successfully modified {success_count}/{len(users)} users")
+        if os.path.exists(self.socket_path):
+            # Only replace a stale socket, never a live daemon
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+                print(f"Error: A daemon is already listening on {self.socket_path}")
+                return False
+            except OSError:
+                os.unlink(self.socket_path)
+            finally:
+                probe.close()
+        
+        old_umask = os.umask(0o177)
+        try:
+            self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        finally:
+            os.umask(old_umask)
+        self.server.daemon_threads = True
+        
+        if self.refresh_interval > 0:
+            threading.Thread(target=self._refresh_loop, name='daemon-refresh', daemon=True).start()
+        print(f"Daemon: listening on {self.socket_path}")
+        try:
+            self.server.serve_forever()
+        finally:
+            self._stopped.set()
+            self.server.server_close()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
         return True
 
+
+def daemon_request(socket_path: str, request: dict, timeout: Optional[float] = None):
+    """
+    Send one request to a daemon and yield its response lines until "done"
+    
+    Raises:
+        OSError: If the daemon cannot be reached
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(socket_path)
+        connection.sendall(json.dumps(request).encode() + b"\n")
+        with connection.makefile('rb') as responses:
+            for line in responses:
+                message = json.loads(line)
+                yield message
+                if message.get('type') == 'done':
+                    return
+    raise ConnectionError("Daemon closed the connection")
+
+
+def run_client(args, socket_path: str, columns: Optional[List[str]] = None,
+               users: Optional[str] = None) -> bool:
+    """
+    Thin client: send a listing or batch modification to a running daemon
+    
+    Args:
+        users: Users expression (default: --users)
+    
+    Returns:
+        bool: True if the daemon completed the request
+    """
+    users = users if users is not None else args.users
+    request = {'users': users, 'expired': args.expired, 'within_days': args.expiring_within,
+               'before': args.expires_before}
+    window = args.expired or args.expiring_within is not None or args.expires_before
+    if args.list_only or (window and not args.expiration):
+        request['op'] = 'list'
+    elif args.expiration and (users or window):
+        request['op'] = 'modify'
+        request['expiration'] = args.expiration
+    else:
+        print("Error: Only listings, expiration queries and batch modifications can be sent to the daemon")
+        return False
+    
+    exporter = None
+    succeeded = 0
+    for message in daemon_request(socket_path, request):
+        kind = message.get('type')
+        if kind == 'user':
+            if exporter is None:
+                exporter = UserExporter(sys.stdout, args.format, columns)
+                exporter.begin()
+            exporter.write(message['row'], message['user'])
+        elif kind == 'result':
+            if message['success']:
+                succeeded += 1
+                print(f"✓ Successfully modified user {message['user']} password expiration time to {message['expiration']}")
+            else:
+                print(f"Error: Failed to modify user {message['user']} - {message['error']}")
+        elif kind == 'done':
+            if not message.get('ok'):
+                print(f"Error: {message.get('error', 'request failed')}", file=sys.stderr)
+                return False
+            if request['op'] == 'list':
+                if exporter is None and args.format == 'table':
+                    print("No user data found")
+                    return True
+                if exporter is None:
+                    exporter = UserExporter(sys.stdout, args.format, columns)
+                    exporter.begin()
+                exporter.end()
+            else:
+                print(f"\nOperation completed: Successfully modified {succeeded}/{message['count']} users")
+            return True
+    return False
+
+
+def read_user_list(path: str) -> List[str]:
+    """
+    Read user terms from a file ('-' for stdin): logins or selection terms
+    separated by commas, spaces or newlines; '#' starts a comment
+    
+    Raises:
+        OSError: If the file cannot be read
+    """
+    if path == '-':
+        text = sys.stdin.read()
+    else:
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+    terms = []
+    for line in text.splitlines():
+        terms.extend(term for term in re.split(r'[,\s]+', line.split('#', 1)[0]) if term)
+    return terms
+
+
+def read_password(args, account: str) -> Optional[str]:
+    """
+    Read the login password from --password-file, $IPA_PASSWORD or an interactive prompt
+    """
+    if args.password_file:
+        try:
+            with open(args.password_file) as f:
+                return f.readline().rstrip('\n')
+        except OSError as e:
+            print(f"Error: Cannot read password file - {e}")
+            return None
+    if os.environ.get('IPA_PASSWORD'):
+        return os.environ['IPA_PASSWORD']
+    return getpass.getpass(f"Password for {account}: ")
+
+
+def create_ldap_backend(args, executor: AsyncCommandExecutor, uri: Optional[str] = None,
+                        password: Optional[str] = None) -> Optional[LdapBackend]:
+    """
+    Build the LDAP backend from command line arguments
+    
+    Args:
+        uri: Server to use instead of --ldap-uri/--server (for replicas)
+        password: Bind password, when it has already been read
+    """
+    ipa_conf = read_ipa_default_conf()
+    base_dn = args.base_dn or ipa_conf.get('basedn')
+    if not base_dn:
+        print("Error: --base-dn is required for the ldap backend (no /etc/ipa/default.conf found)")
+        return None
+    
+    uri = uri or args.ldap_uri
+    if uri is None:
+        server = args.server or ipa_conf.get('server')
+        if not server:
+            print("Error: --ldap-uri or --server is required for the ldap backend")
+            return None
+        uri = server if '://' in server else f"ldap://{server}"
+    
+    if args.bind_dn and password is None:
+        password = read_password(args, args.bind_dn)
+        if password is None:
+            return None
+    
+    return LdapBackend(uri, base_dn, bind_dn=args.bind_dn, password=password,
+                       batch_size=args.batch_size, page_size=args.page_size, executor=executor)
+
+
+def create_user_cache(args, backend) -> Optional[UserCache]:
+    """
+    Open the user cache for the current backend, server and query
+    """
+    if backend is None:
+        origin = read_ipa_default_conf().get('server', 'localhost')
+    else:
+        origin = getattr(backend, 'base_url', None) or getattr(backend, 'uri', '')
+    source = f"{args.backend}:{origin}:{args.login_prefix or ''}:{args.in_group or ''}"
+    try:
+        return UserCache(args.cache_file, source, ttl=args.cache_ttl, refresh=args.refresh)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Warning: User cache disabled - {e}")
+        return None
+
+
+def create_jsonrpc_backend(args, server: Optional[str] = None, password: Optional[str] = None,
+                           pool_size: Optional[int] = None) -> Optional[JsonRpcBackend]:
+    """
+    Build the JSON-RPC backend from command line arguments
+    
+    Args:
+        server: Server to use instead of --server (for replicas)
+        password: Password, when it has already been read
+        pool_size: Connection pool size (default: --workers)
+    """
+    ipa_conf = read_ipa_default_conf()
+    server = server or args.server or ipa_conf.get('server')
+    if not server:
+        print("Error: --server is required for the jsonrpc backend (no /etc/ipa/default.conf found)")
+        return None
+    
+    if password is None:
+        password = read_password(args, f"{args.username}@{server}")
+    if password is None:
+        return None
+    
+    ca_file = args.ca_cert
+    if ca_file is None and os.path.isfile('/etc/ipa/ca.crt'):
+        ca_file = '/etc/ipa/ca.crt'
+    
+    backend = JsonRpcBackend(server, args.username, password, batch_size=args.batch_size,
+                             pool_size=pool_size or args.workers, ca_file=ca_file, verify=not args.insecure)
+    try:
+        backend.login()
+    except JsonRpcError as e:
+        print(f"Error: {e}")
+        return None
+    return backend
+
+
+def create_replica_set(args, executor: AsyncCommandExecutor, metrics: Metrics) -> Optional[ReplicaSet]:
+    """
+    Build one write backend per --replicas entry, sharing credentials
+    """
+    servers = [server.strip() for server in args.replicas.split(',') if server.strip()]
+    if not servers:
+        print("Error: --replicas needs at least one server")
+        return None
+    
+    password = None
+    if args.backend == 'jsonrpc':
+        password = read_password(args, f"{args.username}@{servers[0]}")
+    elif args.backend == 'ldap' and args.bind_dn:
+        password = read_password(args, args.bind_dn)
+    if password is None and (args.backend == 'jsonrpc' or (args.backend == 'ldap' and args.bind_dn)):
+        return None
+    
+    replicas = []
+    for server in servers:
+        if args.backend == 'jsonrpc':
+            backend = create_jsonrpc_backend(args, server=server, password=password,
+                                             pool_size=args.replica_concurrency)
+            if backend is not None:
+                backend.metrics = metrics
+        elif args.backend == 'ldap':
+            uri = server if '://' in server else f"ldap://{server}"
+            backend = create_ldap_backend(args, executor, uri=uri, password=password)
+        else:
+            backend = IpaCliBackend(server, executor, timeout=args.command_timeout)
+        if backend is None:
+            print(f"Warning: Replica {server} skipped")
+            continue
+        replicas.append(Replica(server, backend, args.replica_concurrency))
+    
+    if not replicas:
+        print("Error: No usable replica")
+        return None
+    return ReplicaSet(replicas, metrics=metrics)
+
+
+def write_metrics(args, metrics: Metrics):
+    """
+    Emit the run metrics requested with --stats / --prometheus-textfile
+    """
+    try:
+        if args.stats:
+            metrics.write_json(args.stats)
+        if args.prometheus_textfile:
+            metrics.write_prometheus(args.prometheus_textfile)
+    except OSError as e:
+        print(f"Warning: Failed to write metrics - {e}")
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='FreeIPA User Password Expiration Reset Tool',
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 Usage examples:
-  # Interactive mode
+  # Interactive mode: browse users while they load, type to filter, Space marks, Enter selects
   python3 freeipa_password_reset.py
   
   # Batch mode - specify users and expiration time
   python3 freeipa_password_reset.py --users user1,user2 --expiration 2030-12-31T12:00:00Z
   
+  # Batch mode with a long list of users from a file (or - for stdin), checked against the directory first
+  python3 freeipa_password_reset.py --users-file users.txt --expiration 2030-12-31T12:00:00Z
+  
+  # Batch mode with 8 parallel workers
+  python3 freeipa_password_reset.py --users user1,user2 --expiration 2030-12-31T12:00:00Z --workers 8
+  
+  # JSON-RPC backend: one login, user_mod calls sent in server-side batches of 200
+  python3 freeipa_password_reset.py --backend jsonrpc --server ipa.example.com --username admin \\
+      --users user1,user2 --expiration 2030-12-31T12:00:00Z --batch-size 200
+  
+  # LDAP backend: GSSAPI bind with the current Kerberos ticket, 4 connections in flight
+  python3 freeipa_password_reset.py --backend ldap --users user1,user2 --expiration 2030-12-31T12:00:00Z \\
+      --workers 4 --batch-size 500
+  
+  # Users whose password expires in the next 14 days, then push them to the end of 2030
+  python3 freeipa_password_reset.py --expiring-within 14
+  python3 freeipa_password_reset.py --expiring-within 14 --expired --expiration 2030-12-31T12:00:00Z
+  
+  # Reconcile against a policy file: show the diff, then apply only the differences
+  python3 freeipa_password_reset.py --reconcile policy.json --dry-run
+  python3 freeipa_password_reset.py --reconcile policy.json --workers 8
+  
+  # Journal a long run, and pick it up again after a crash or an expired ticket
+  python3 freeipa_password_reset.py --users @staff --expiration 2030-12-31T12:00:00Z --journal reset.journal
+  python3 freeipa_password_reset.py --resume reset.journal
+  
+  # Stream the user list as NDJSON/CSV/JSON (untruncated) for reporting pipelines
+  python3 freeipa_password_reset.py --list-only --format ndjson > users.ndjson
+  python3 freeipa_password_reset.py --list-only --format csv --columns login,email,password_expiration > users.csv
+  
+  # Daemon keeping credentials and the user index warm; clients answer in milliseconds
+  python3 freeipa_password_reset.py --serve --backend jsonrpc --server ipa.example.com
+  FREEIPA_PW_RESET_SOCKET=$XDG_RUNTIME_DIR/freeipa-password-reset-$(id -u).sock python3 freeipa_password_reset.py --users jdoe --expiration 2030-12-31T12:00:00Z
+  
+  # Spread modifications over three replicas, at most 8 requests in flight on each
+  python3 freeipa_password_reset.py --backend jsonrpc --replicas ipa1.example.com,ipa2.example.com,ipa3.example.com --replica-concurrency 8 --workers 24 --users @staff --expiration 2030-12-31T12:00:00Z
+  
+  # Per-phase timings as JSON, and a Prometheus textfile for the node exporter
+  python3 freeipa_password_reset.py --users @staff --expiration 2030-12-31T12:00:00Z --stats --prometheus-textfile /var/lib/node_exporter/textfile/freeipa_pw_reset.prom
+  
+  # Audit a saved dump offline, parsed by all CPUs (ldapsearch LDIF works too)
+  ipa user-find --all --raw --sizelimit=0 > users.txt
+  python3 freeipa_password_reset.py --from-file users.txt --expiring-within 14 --list-only --format csv > expiring.csv
+  python3 freeipa_password_reset.py --from-file users.txt --reconcile policy.json
+  
+  # Everyone in contractors, including members of groups nested in it (one bulk group query)
+  python3 freeipa_password_reset.py --group contractors --list-only
+  python3 freeipa_password_reset.py --group contractors --users '!svc_*' --expiration 2030-12-31T12:00:00Z
+  
+  # Spread expirations over the summer instead of one day: preview the per-day load, then apply
+  python3 freeipa_password_reset.py --group staff --spread 2030-06-01..2030-08-31 --spread-cap 200 --dry-run
+  python3 freeipa_password_reset.py --group staff --spread 2030-06-01..2030-08-31 --spread-cap 200
+  
+  # Even out an existing pile-up, moving as few users as possible
+  python3 freeipa_password_reset.py --users all --spread 2030-06-01..2030-08-31 --rebalance
+  
   # Demo mode (when FreeIPA is not available)
   python3 freeipa_password_reset.py --demo --list-only
   python3 freeipa_password_reset.py --demo --users testuser1,testuser2 --expiration 2030-12-31T12:00:00Z
@@ -534,7 +5317,28 @@ Usage examples:
     
     parser.add_argument(
         '--users', '-u',
-        help='List of usernames to modify, separated by commas (e.g.: user1,user2,user3)'
+        help='Users to modify, separated by commas: logins, numbers/ranges, globs (dev-*), '
+             'regexes (re:^svc_), groups (@admins) and exclusions (!admin), e.g.: @devs,!dev-bot*'
+    )
+    
+    parser.add_argument(
+        '--users-file',
+        metavar='FILE',
+        help='Read more users (or selection terms) from FILE, one per line or comma separated; - reads stdin'
+    )
+    
+    parser.add_argument(
+        '--no-preflight',
+        action='store_true',
+        help='In batch mode, do not check the users against the directory before modifying them'
+    )
+    
+    parser.add_argument(
+        '--group', '-g',
+        action='append',
+        metavar='GROUP',
+        help='Select all members of GROUP, including members of nested groups (repeatable; '
+             'combined with --users, and @group terms then include nested groups too)'
     )
     
     parser.add_argument(
@@ -542,18 +5346,317 @@ Usage examples:
         help='Password expiration time (format: YYYY-MM-DDTHH:MM:SSZ, e.g.: 2030-12-31T12:00:00Z)'
     )
     
+    parser.add_argument(
+        '--spread',
+        metavar='START..END',
+        help='Instead of one --expiration, spread the selected users over the days START..END '
+             '(a stable day and time per login, e.g.: 2030-06-01..2030-08-31)'
+    )
+    
+    parser.add_argument(
+        '--spread-cap',
+        type=int,
+        metavar='N',
+        help='With --spread: at most N expirations on any single day'
+    )
+    
+    parser.add_argument(
+        '--rebalance',
+        action='store_true',
+        help='With --spread: keep users already in the window on days under the cap (default cap: an even '
+             'share) and move only the rest'
+    )
+    
+    parser.add_argument(
+        '--expired',
+        action='store_true',
+        help='Select users whose password has already expired'
+    )
+    
+    parser.add_argument(
+        '--expiring-within',
+        type=float,
+        metavar='DAYS',
+        help='Select users whose password expires within the next DAYS days'
+    )
+    
+    parser.add_argument(
+        '--expires-before',
+        metavar='DATE',
+        help='Select users whose password expires before DATE (e.g.: 2030-12-31 or 2030-12-31T12:00:00Z)'
+    )
+    
+    parser.add_argument(
+        '--reconcile',
+        metavar='POLICY',
+        help='Apply a JSON expiration policy, modifying only users whose expiration differs from it'
+    )
+    
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='With --reconcile or --spread: only show the changes that would be made'
+    )
+    
     parser.add_argument(
         '--list-only', '-l',
         action='store_true',
         help='Only list user information, do not modify'
     )
     
+    parser.add_argument(
+        '--format', '-f',
+        choices=UserExporter.FORMATS,
+        default='table',
+        help='Output format of user listings - --list-only or an expiration query without --expiration '
+             '(default: table). ndjson, csv and json stream untruncated records to stdout; status messages go to stderr'
+    )
+    
+    parser.add_argument(
+        '--columns',
+        help=f"Comma separated columns of user listings (default: all): {','.join(UserTable.FIELDS)}"
+    )
+    
+    parser.add_argument(
+        '--no-browser',
+        action='store_true',
+        help='In interactive mode, page through users on plain lines instead of the full-screen browser'
+    )
+    
     parser.add_argument(
         '--demo', '-d',
         action='store_true',
         help='Run in demo mode with mock data (useful when FreeIPA is not available)'
     )
     
+    parser.add_argument(
+        '--from-file',
+        metavar='FILE',
+        help='Read users from a saved `ipa user-find --all --raw` output or ldapsearch LDIF dump '
+             'instead of the server (read-only: listings, expiration queries, reconcile dry runs)'
+    )
+    
+    parser.add_argument(
+        '--parse-workers',
+        type=int,
+        metavar='N',
+        default=os.cpu_count() or 1,
+        help='Processes parsing a --from-file dump in parallel (default: number of CPUs)'
+    )
+    
+    parser.add_argument(
+        '--workers', '-w',
+        type=int,
+        default=1,
+        help='Number of modifications to run in parallel (default: 1)'
+    )
+    
+    parser.add_argument(
+        '--login-prefix',
+        help='Only enumerate users whose login starts with this prefix (filtered on the server)'
+    )
+    
+    parser.add_argument(
+        '--in-group',
+        help='Only enumerate direct members of this group (filtered on the server)'
+    )
+    
+    parser.add_argument(
+        '--sizelimit',
+        type=int,
+        default=0,
+        help='Maximum number of users returned by the server (default: 0, unlimited)'
+    )
+    
+    parser.add_argument(
+        '--timelimit',
+        type=int,
+        default=0,
+        help='Server-side search time limit in seconds (default: 0, unlimited)'
+    )
+    
+    parser.add_argument(
+        '--page-size',
+        type=int,
+        default=500,
+        help='Entries per page for the ldap backend paged search (default: 500)'
+    )
+    
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Do not read or write the local user cache'
+    )
+    
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='Ignore cached users and re-enumerate the whole directory'
+    )
+    
+    parser.add_argument(
+        '--cache-ttl',
+        type=int,
+        default=900,
+        help='Seconds after which the cached user list is fully re-enumerated (default: 900); '
+             'listings from an older cache say how old it is'
+    )
+    
+    parser.add_argument(
+        '--cache-file',
+        default=default_cache_path(),
+        help='User cache database (default: ~/.cache/freeipa-password-reset/users.sqlite)'
+    )
+    
+    parser.add_argument(
+        '--journal',
+        metavar='FILE',
+        help='Append planned and completed modifications to this crash-safe journal'
+    )
+    
+    parser.add_argument(
+        '--resume',
+        metavar='JOURNAL',
+        help='Resume an interrupted run: skip users the journal shows as done, retry the rest'
+    )
+    
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help='Run as a daemon keeping credentials, the user index and the backend warm, '
+             'answering requests on a Unix socket (see --socket)'
+    )
+    
+    parser.add_argument(
+        '--socket',
+        metavar='PATH',
+        help='Daemon socket. With --serve: where to listen (default: $XDG_RUNTIME_DIR/freeipa-password-reset-UID.sock). '
+             'Otherwise: send this invocation to the daemon listening there ($FREEIPA_PW_RESET_SOCKET works too)'
+    )
+    
+    parser.add_argument(
+        '--refresh-interval',
+        type=float,
+        default=300,
+        metavar='SECONDS',
+        help='With --serve: re-enumerate users in the background this often (default: 300, 0 disables)'
+    )
+    
+    parser.add_argument(
+        '--stats',
+        nargs='?',
+        const='-',
+        metavar='FILE',
+        help='Write per-phase timings, counts, error classes and bytes read as JSON '
+             '(to stderr, or to FILE)'
+    )
+    
+    parser.add_argument(
+        '--prometheus-textfile',
+        metavar='FILE',
+        help='Write the run metrics to FILE for the node exporter textfile collector '
+             '(e.g. /var/lib/node_exporter/textfile/freeipa_pw_reset.prom)'
+    )
+    
+    parser.add_argument(
+        '--adaptive',
+        action='store_true',
+        help='Adapt the number of parallel modifications (up to --workers) to server latency and errors'
+    )
+    
+    parser.add_argument(
+        '--max-retries',
+        type=int,
+        default=3,
+        help='Retries for modifications failing with transient errors such as timeouts or busy servers (default: 3)'
+    )
+    
+    parser.add_argument(
+        '--retry-backoff',
+        type=float,
+        default=1.0,
+        help='Base delay in seconds for the jittered exponential retry backoff (default: 1.0)'
+    )
+    
+    parser.add_argument(
+        '--command-timeout',
+        type=float,
+        default=30,
+        help='Seconds before a single ipa command is killed (default: 30)'
+    )
+    
+    parser.add_argument(
+        '--backend', '-b',
+        choices=['cli', 'jsonrpc', 'ldap'],
+        default='cli',
+        help='How to talk to FreeIPA: local ipa CLI (default), the JSON-RPC API over one persistent session, '
+             'or direct LDAP modifies over one bound connection per worker'
+    )
+    
+    parser.add_argument(
+        '--server', '-s',
+        help='FreeIPA server for the jsonrpc backend (hostname or URL, default: server from /etc/ipa/default.conf)'
+    )
+    
+    parser.add_argument(
+        '--username',
+        default='admin',
+        help='Account used to log into the JSON-RPC API (default: admin)'
+    )
+    
+    parser.add_argument(
+        '--password-file',
+        help='File containing the login password (default: $IPA_PASSWORD or interactive prompt)'
+    )
+    
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=100,
+        help='Number of modifications sent per JSON-RPC batch request or ldapmodify connection (default: 100)'
+    )
+    
+    parser.add_argument(
+        '--replicas',
+        metavar='SERVER[,SERVER...]',
+        help='Spread modifications over these IPA replicas (with the selected backend); '
+             'users are still enumerated from --server/--ldap-uri'
+    )
+    
+    parser.add_argument(
+        '--replica-concurrency',
+        type=int,
+        default=4,
+        metavar='N',
+        help='Maximum requests in flight per replica (default: 4)'
+    )
+    
+    parser.add_argument(
+        '--ldap-uri',
+        help='LDAP URI for the ldap backend (default: ldap://<server from /etc/ipa/default.conf>)'
+    )
+    
+    parser.add_argument(
+        '--base-dn',
+        help='Directory base DN for the ldap backend (default: basedn from /etc/ipa/default.conf)'
+    )
+    
+    parser.add_argument(
+        '--bind-dn',
+        help='Simple bind DN for the ldap backend (default: GSSAPI bind with the current Kerberos ticket)'
+    )
+    
+    parser.add_argument(
+        '--ca-cert',
+        help='CA certificate used to verify the server (default: /etc/ipa/ca.crt when present)'
+    )
+    
+    parser.add_argument(
+        '--insecure',
+        action='store_true',
+        help='Do not verify the server TLS certificate'
+    )
+    
     parser.add_argument(
         '--install',
         action='store_true',
@@ -564,39 +5667,233 @@ Usage examples:
     
     args = parser.parse_args()
     
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.batch_size < 1:
+        parser.error('--batch-size must be at least 1')
+    if args.max_retries < 0 or args.retry_backoff < 0:
+        parser.error('--max-retries and --retry-backoff must not be negative')
+    if args.command_timeout <= 0:
+        parser.error('--command-timeout must be greater than 0')
+    if args.page_size < 1:
+        parser.error('--page-size must be at least 1')
+    if args.sizelimit < 0 or args.timelimit < 0:
+        parser.error('--sizelimit and --timelimit must not be negative')
+    if args.replica_concurrency < 1:
+        parser.error('--replica-concurrency must be at least 1')
+    spread = None
+    if args.spread_cap is not None and args.spread_cap < 1:
+        parser.error('--spread-cap must be at least 1')
+    if (args.spread_cap is not None or args.rebalance) and not args.spread:
+        parser.error('--spread-cap and --rebalance require --spread')
+    if args.spread:
+        if args.expiration:
+            parser.error('--spread and --expiration cannot be combined')
+        try:
+            spread = ExpirationSpread.parse(args.spread, args.spread_cap, args.rebalance)
+        except ValueError as e:
+            parser.error(f"--spread: {e}")
+    if args.parse_workers < 1:
+        parser.error('--parse-workers must be at least 1')
+    window_query = args.expired or args.expiring_within is not None or args.expires_before
+    if args.from_file:
+        if args.demo or args.serve or args.resume or args.install:
+            parser.error('--from-file cannot be combined with --demo, --serve, --resume or --install')
+        if not (args.list_only or args.reconcile or (window_query and not args.expiration)
+                or (args.spread and args.dry_run)):
+            parser.error('--from-file is read-only: use it with --list-only, --reconcile '
+                         '(always a dry run), --spread with --dry-run or an expiration query without --expiration')
+    listing = args.list_only or (window_query and not args.expiration and not args.spread)
+    if args.format != 'table' and (not listing or args.reconcile or args.serve or args.resume):
+        parser.error('--format ndjson/csv/json is only supported for listings (--list-only, or an '
+                     'expiration query without --expiration/--spread)')
+    columns = None
+    if args.columns:
+        try:
+            columns = UserExporter.parse_columns(args.columns)
+        except ValueError as e:
+            parser.error(f"--columns: {e}")
+    
+    users_terms = [args.users] if args.users else []
+    if args.users_file:
+        try:
+            users_terms.extend(read_user_list(args.users_file))
+        except OSError as e:
+            parser.error(f"--users-file: {e}")
+    users_terms.extend(f"@{group}" for group in args.group or [])
+    users_expression = ','.join(users_terms) or None
+    
+    # Thin client mode: let a running daemon answer
+    socket_path = args.socket or os.environ.get('FREEIPA_PW_RESET_SOCKET')
+    if (socket_path and not args.serve and not args.install and not args.from_file and not args.group
+            and not args.spread):
+        try:
+            ok = run_client(args, socket_path, columns, users_expression)
+        except BrokenPipeError:
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+            sys.exit(1)
+        except KeyboardInterrupt:
+            print("\nOperation interrupted by user")
+            sys.exit(1)
+        except (OSError, ValueError) as e:
+            print(f"Error: Cannot reach the daemon at {socket_path} - {e}")
+            sys.exit(1)
+        sys.exit(0 if ok else 1)
+    
     # Handle installation request
     if args.install:
         tool = FreeIPAPasswordReset()
         success = tool.install_to_system()
         sys.exit(0 if success else 1)
     
+    metrics = Metrics()
+    executor = AsyncCommandExecutor(max_concurrency=args.workers)
+    executor.metrics = metrics
+    backend = None
+    if args.from_file:
+        try:
+            backend = SnapshotFile(args.from_file, workers=args.parse_workers)
+        except OSError as e:
+            print(f"Error: Cannot read {args.from_file} - {e}")
+            sys.exit(1)
+        backend.metrics = metrics
+    elif args.backend == 'jsonrpc' and not args.demo:
+        backend = create_jsonrpc_backend(args)
+        if backend is None:
+            sys.exit(1)
+        backend.metrics = metrics
+    elif args.backend == 'ldap' and not args.demo:
+        backend = create_ldap_backend(args, executor)
+        if backend is None:
+            sys.exit(1)
+    
+    replicas = None
+    if args.replicas and not args.demo and not args.from_file:
+        replicas = create_replica_set(args, executor, metrics)
+        if replicas is None:
+            sys.exit(1)
+    
     # Create tool instance
-    tool = FreeIPAPasswordReset(demo_mode=args.demo)
+    query = UserQuery(login_prefix=args.login_prefix, group=args.in_group,
+                      sizelimit=args.sizelimit, timelimit=args.timelimit)
+    cache = None
+    if not args.no_cache and not args.demo and not args.from_file:
+        cache = create_user_cache(args, backend)
+    tool = FreeIPAPasswordReset(demo_mode=args.demo, workers=args.workers, backend=backend, query=query,
+                                cache=cache, executor=executor, command_timeout=args.command_timeout,
+                                adaptive=args.adaptive, max_retries=args.max_retries,
+                                retry_backoff=args.retry_backoff, metrics=metrics)
+    tool.output_format = args.format
+    tool.columns = columns
+    tool.replicas = replicas
+    
+    before = None
+    if args.expires_before:
+        before = parse_expiration_timestamp(args.expires_before)
+        if math.isnan(before):
+            parser.error(f"--expires-before: unsupported date '{args.expires_before}'")
+    window = ExpirationWindow(expired=args.expired, within_days=args.expiring_within, before=before)
+    
+    journal_path = args.journal or args.resume
+    if journal_path:
+        try:
+            tool.journal = ModificationJournal(journal_path)
+        except OSError as e:
+            print(f"Error: Cannot open journal - {e}")
+            sys.exit(1)
+    
+    # Machine-readable listings own stdout; everything else printed goes to stderr
+    redirect = contextlib.ExitStack()
+    if args.format != 'table':
+        sys.stdout.flush()
+        tool.output = open(sys.stdout.fileno(), 'w', encoding='utf-8', newline='',
+                           buffering=1 << 16, closefd=False)
+        redirect.enter_context(contextlib.redirect_stdout(sys.stderr))
     
     try:
-        if args.list_only:
-            # Only list users
-            if not tool.get_users_list():
+        if args.group and not tool.load_group_graph():
+            sys.exit(1)
+        
+        if args.serve:
+            # SIGTERM (systemd stop) unwinds like Ctrl-C so the socket is removed
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            daemon = ResetDaemon(tool, args.socket or default_socket_path(), args.refresh_interval)
+            if not daemon.serve_forever():
+                sys.exit(1)
+        
+        elif args.resume:
+            if not tool.run_resume(args.resume):
+                sys.exit(1)
+        
+        elif args.reconcile:
+            dry_run = args.dry_run or args.list_only or bool(args.from_file)
+            if not tool.run_reconcile(args.reconcile, dry_run=dry_run):
+                sys.exit(1)
+        
+        elif window:
+            # Expiration query: list matching users, or modify them when --expiration is given
+            expiration = None if args.list_only else args.expiration
+            if not tool.run_expiration_query(window, users_expression, expiration, spread=spread,
+                                             dry_run=args.dry_run or args.list_only):
+                sys.exit(1)
+        
+        elif args.list_only and users_expression:
+            # List only the selected users
+            if not tool.list_selected_users(users_expression):
+                sys.exit(1)
+        
+        elif args.list_only:
+            # Only list users, printing them as they are enumerated
+            if not tool.list_users():
                 sys.exit(1)
-            tool.display_users()
             
-        elif args.users and args.expiration:
+        elif users_expression and (args.expiration or spread):
             # Batch processing mode
-            users = [u.strip() for u in args.users.split(',')]
-            if not tool.run_batch(users, args.expiration):
+            users = tool.resolve_users(users_expression)
+            if not users:
+                print("Error: No users selected")
+                sys.exit(1)
+            if not args.no_preflight:
+                users = tool.preflight_users(users, None if spread is not None else args.expiration)
+                if users is None:
+                    sys.exit(1)
+                if not users:
+                    print("Nothing to modify")
+                    sys.exit(0)
+            if spread is not None:
+                if not tool.run_spread(users, spread, dry_run=args.dry_run):
+                    sys.exit(1)
+            elif not tool.run_batch(users, args.expiration):
                 sys.exit(1)
                 
         else:
             # Interactive mode
-            if not tool.run_interactive():
+            if not tool.run_interactive(full_screen=not args.no_browser):
                 sys.exit(1)
                 
+    except BrokenPipeError:
+        # The reader went away (e.g. piped into head): stop enumerating quietly
+        executor.cancel_all()
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
     except KeyboardInterrupt:
+        executor.cancel_all()
         print("\nOperation interrupted by user")
+        if tool.journal is not None:
+            print(f"Completed modifications are recorded in {tool.journal.path}; continue with --resume {tool.journal.path}")
         sys.exit(1)
     except Exception as e:
         print(f"Program execution error: {e}")
         sys.exit(1)
+    finally:
+        redirect.close()
+        if tool.journal is not None:
+            tool.journal.close()
+        write_metrics(args, metrics)
 
 if __name__ == '__main__':
+    # Parse workers of --from-file in frozen (PyInstaller) builds
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""
+Shared fixtures: the tool module and the stand-ins from benchmarks/
+"""
+
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+TOOL_DIR = os.path.dirname(TESTS_DIR)
+BENCH_DIR = os.path.join(TOOL_DIR, 'benchmarks')
+
+sys.path.insert(0, TOOL_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_ipa_server import start_servers  # noqa: E402
+
+
+@pytest.fixture
+def fake_ipa(tmp_path, monkeypatch):
+    """
+    Put benchmarks/fake_ipa on PATH as `ipa`, answering with 50 users
+    """
+    directory = tmp_path / 'bin'
+    directory.mkdir()
+    os.symlink(os.path.join(BENCH_DIR, 'fake_ipa'), directory / 'ipa')
+    monkeypatch.setenv('PATH', f"{directory}{os.pathsep}{os.environ.get('PATH', '')}")
+    monkeypatch.setenv('FAKE_IPA_USERS', '50')
+    return directory
+
+
+@pytest.fixture
+def fake_ldap(tmp_path, monkeypatch):
+    """
+    Put benchmarks/fake_ldapsearch and fake_ldapmodify on PATH, serving a persistent 40 user directory
+    """
+    directory = tmp_path / 'ldapbin'
+    directory.mkdir()
+    for tool in ('ldapsearch', 'ldapmodify'):
+        os.symlink(os.path.join(BENCH_DIR, f"fake_{tool}"), directory / tool)
+    monkeypatch.setenv('PATH', f"{directory}{os.pathsep}{os.environ.get('PATH', '')}")
+    monkeypatch.setenv('FAKE_LDAP_USERS', '40')
+    monkeypatch.setenv('FAKE_LDAP_DIRECTORY', str(tmp_path / 'directory.json'))
+    return directory
+
+
+@pytest.fixture
+def server(request):
+    """
+    A benchmarks/fake_ipa_server.py instance serving 60 users
+    
+    Parametrize it indirectly for another directory size, e.g.
+    @pytest.mark.parametrize('server', [20], indirect=True)
+    """
+    instance = start_servers([0], users=getattr(request, 'param', 60))[0]
+    yield instance
+    instance.shutdown()
+    instance.server_close()
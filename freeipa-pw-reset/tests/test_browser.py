@@ -0,0 +1,72 @@
+import pytest
+
+from freeipa_password_reset import UserBrowser, UserTable
+
+curses = pytest.importorskip('curses')
+
+
+class FakeScreen:
+    """
+    Just enough of a curses window for UserBrowser._run_screen, fed with scripted keys
+    """
+    
+    def __init__(self, keys):
+        self.keys = list(keys)
+    
+    def getmaxyx(self):
+        return 24, 120
+    
+    def get_wch(self):
+        if not self.keys:
+            pytest.fail("the browser asked for more keys than the test scripted")
+        return self.keys.pop(0)
+    
+    def timeout(self, delay):
+        pass
+    
+    def erase(self):
+        pass
+    
+    def refresh(self):
+        pass
+    
+    def addnstr(self, *args):
+        pass
+
+
+@pytest.fixture
+def browser(monkeypatch):
+    monkeypatch.setattr(curses, 'curs_set', lambda visibility: None)
+    table = UserTable([
+        {'login': 'asmith', 'first_name': 'Alice', 'last_name': 'Smith'},
+        {'login': 'bsmith', 'first_name': 'Bob', 'last_name': 'Smith'},
+        {'login': 'ajones', 'first_name': 'Alice', 'last_name': 'Jones'},
+    ])
+    browser = UserBrowser()
+    for index, user in enumerate(table, 1):
+        browser.add(index, user)
+    browser.finish()
+    return browser
+
+
+def run(browser, keys):
+    return browser._run_screen(FakeScreen(keys))
+
+
+def test_space_types_into_the_filter_while_typing(browser):
+    # "alice smith" needs both terms; the space must not mark a row
+    assert run(browser, list("alice smith") + ['\n']) == ['asmith']
+    assert browser.query == 'alice smith'
+    assert browser.marked == set()
+
+
+def test_space_marks_once_the_cursor_has_moved(browser):
+    keys = list("smith") + [curses.KEY_DOWN, curses.KEY_UP, ' ', ' ', '\n']
+    assert run(browser, keys) == ['asmith', 'bsmith']
+
+
+def test_space_marks_when_no_filter_is_typed(browser):
+    assert run(browser, [' ', curses.KEY_DOWN, ' ', '\n']) == ['asmith', 'ajones']
+    # Backspacing the filter away leaves typing mode too
+    browser.marked.clear()
+    assert run(browser, ['x', '\x7f', ' ', '\n']) == ['asmith']
@@ -0,0 +1,57 @@
+import os
+import time
+import threading
+
+import pytest
+
+from freeipa_password_reset import FreeIPAPasswordReset, JsonRpcBackend, ResetDaemon, UserCache, daemon_request
+
+
+@pytest.fixture
+def daemon(server, tmp_path):
+    backend = JsonRpcBackend(server.url, 'admin', 'secret')
+    cache = UserCache(str(tmp_path / 'users.sqlite'), f"jsonrpc:{server.url}::")
+    tool = FreeIPAPasswordReset(backend=backend, cache=cache)
+    instance = ResetDaemon(tool, str(tmp_path / 'daemon.sock'), refresh_interval=0)
+    thread = threading.Thread(target=instance.serve_forever, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while instance.server is None or not os.path.exists(instance.socket_path):
+        assert time.time() < deadline, "daemon did not start"
+        time.sleep(0.01)
+    yield instance
+    instance.server.shutdown()
+    thread.join()
+
+
+def request(daemon, **message):
+    return list(daemon_request(daemon.socket_path, message, timeout=10))
+
+
+def expiration_of(daemon, login):
+    lines = request(daemon, op='list', users=f"re:^{login}$")
+    return [line['user']['password_expiration'] for line in lines if line['type'] == 'user']
+
+
+def test_modify_updates_index_and_cache_and_survives_refresh(daemon):
+    lines = request(daemon, op='modify', users='user0000003', expiration='2030-12-31T12:00:00Z')
+    assert lines[-1] == {'type': 'done', 'ok': True, 'count': 1, 'succeeded': 1}
+    assert expiration_of(daemon, 'user0000003') == ['2030-12-31T12:00:00Z']
+    
+    # Refreshes run on other threads than the one that opened the cache
+    assert request(daemon, op='refresh')[-1]['ok']
+    refresher = threading.Thread(target=daemon.refresh)
+    refresher.start()
+    refresher.join()
+    assert expiration_of(daemon, 'user0000003') == ['20301231120000Z']
+
+
+def test_unexpected_error_is_reported_and_connection_stays_usable(daemon, monkeypatch):
+    def explode(assignments):
+        raise RuntimeError("backend exploded")
+    
+    monkeypatch.setattr(daemon.tool, 'execute_assignments', explode)
+    lines = request(daemon, op='modify', users='user0000003', expiration='2030-12-31T12:00:00Z')
+    assert lines[-1]['ok'] is False
+    assert 'backend exploded' in lines[-1]['error']
+    assert request(daemon, op='ping')[-1]['ok']
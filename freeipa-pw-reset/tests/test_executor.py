@@ -0,0 +1,101 @@
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+from freeipa_password_reset import AsyncCommandExecutor, CommandStream
+
+
+def test_a_slow_consumer_pauses_the_command(tmp_path, monkeypatch):
+    monkeypatch.setattr(CommandStream, 'BUFFER_LINES', 8)
+    # The stream reader buffers up to twice this before it stops reading the pipe
+    monkeypatch.setattr(AsyncCommandExecutor, 'LINE_LIMIT', 1024)
+    marker = tmp_path / 'done'
+    # About 600 KB: far more than the buffers and a pipe hold together
+    script = f"for i in range(100000): print(i)\nopen({str(marker)!r}, 'w').close()"
+    lines = iter(AsyncCommandExecutor().stream([sys.executable, '-c', script], timeout=30))
+
+    assert next(lines) == "0\n"
+    time.sleep(0.5)
+    assert not marker.exists()
+    assert sum(1 for _ in lines) == 99999
+    assert marker.exists()
+
+
+def started_process(tmp_path, body):
+    """
+    A python -c command that records its pid before running `body`
+    """
+    pid_file = tmp_path / 'pid'
+    return pid_file, [sys.executable, '-c', f"import os, sys, time\nopen({str(pid_file)!r}, 'w').write(str(os.getpid()))\n{body}"]
+
+
+def assert_reaped(pid_file):
+    # A zombie would still accept signal 0; a killed and reaped process is gone
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid_file.read_text()), 0)
+
+
+def settled_thread_count():
+    """
+    The number of threads once asyncio's per-process waitpid threads have exited
+    """
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        if not any(thread.name.startswith('asyncio-waitpid') for thread in threading.enumerate()):
+            break
+        time.sleep(0.01)
+    return threading.active_count()
+
+
+def test_a_command_over_its_timeout_is_killed(tmp_path):
+    pid_file, argv = started_process(tmp_path, "time.sleep(30)")
+    started = time.monotonic()
+    assert AsyncCommandExecutor().run(argv, timeout=1) == (1, "", "Command execution timeout")
+    assert time.monotonic() - started < 10
+    assert_reaped(pid_file)
+
+
+def test_a_stream_over_its_timeout_is_killed(tmp_path):
+    pid_file, argv = started_process(tmp_path, "print('first', flush=True)\ntime.sleep(30)")
+    stream = AsyncCommandExecutor().stream(argv, timeout=1)
+    assert list(stream) == ["first\n"]
+    assert (stream.return_code, stream.stderr) == (1, "Command execution timeout")
+    assert_reaped(pid_file)
+
+
+def test_stopping_a_stream_early_kills_the_command(tmp_path):
+    executor = AsyncCommandExecutor()
+    assert executor.run(['true']) == (0, "", "")
+    threads = settled_thread_count()
+
+    pid_file, argv = started_process(tmp_path, "while True:\n    print('line', flush=True)")
+    stream = executor.stream(argv, timeout=30)
+    lines = iter(stream)
+    assert [next(lines) for _ in range(100)] == ["line\n"] * 100
+    lines.close()
+
+    assert (stream.return_code, stream.stderr) == (1, "Command cancelled")
+    assert_reaped(pid_file)
+    # Only the executor's event loop thread, which was already running
+    assert settled_thread_count() == threads, [thread.name for thread in threading.enumerate()]
+
+
+def test_cancel_all_stops_commands_waited_on_by_other_threads(tmp_path):
+    executor = AsyncCommandExecutor()
+    pid_file, argv = started_process(tmp_path, "time.sleep(30)")
+    outcome = []
+    waiter = threading.Thread(target=lambda: outcome.append(executor.run(argv)))
+    waiter.start()
+    deadline = time.monotonic() + 10
+    while not pid_file.exists() or not pid_file.read_text():
+        assert time.monotonic() < deadline, "command did not start"
+        time.sleep(0.01)
+
+    executor.cancel_all()
+    waiter.join(10)
+    assert not waiter.is_alive()
+    assert outcome == [(1, "", "Command cancelled")]
+    assert_reaped(pid_file)
@@ -0,0 +1,53 @@
+import json
+
+from freeipa_password_reset import FreeIPAPasswordReset, JsonRpcBackend, ModificationJournal, ModifyResult
+
+TARGET = '2030-12-31T12:00:00Z'
+
+
+def interrupted_journal(path):
+    """
+    A run of 10 users that crashed after 4 successes, 1 failure and half a line
+    """
+    records = [{'type': 'run', 'time': 0, 'planned': 10}]
+    records += [{'type': 'plan', 'user': f"user{index:07d}", 'expiration': TARGET} for index in range(10)]
+    records += [{'type': 'done', 'user': f"user{index:07d}", 'expiration': TARGET, 'success': True}
+                for index in range(4)]
+    records.append({'type': 'done', 'user': 'user0000004', 'expiration': TARGET, 'success': False})
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(''.join(json.dumps(record) + '\n' for record in records))
+        f.write('{"type": "done", "user": "user00000')
+
+
+def test_pending_skips_only_successful_users(tmp_path):
+    path = tmp_path / 'reset.journal'
+    interrupted_journal(path)
+    pending, completed = ModificationJournal.pending(str(path))
+    assert pending == [(f"user{index:07d}", TARGET) for index in range(4, 10)]
+    assert completed == 4
+
+
+def test_a_new_plan_for_a_user_supersedes_an_old_success(tmp_path):
+    path = str(tmp_path / 'reset.journal')
+    journal = ModificationJournal(path)
+    journal.plan([('alice', TARGET)])
+    journal.record(ModifyResult('alice', TARGET, True, '', 0.0))
+    journal.plan([('alice', '2031-01-01T00:00:00Z')])
+    journal.close()
+    assert ModificationJournal.pending(path) == ([('alice', '2031-01-01T00:00:00Z')], 0)
+
+
+def test_resume_applies_the_rest_and_completes_the_journal(server, tmp_path):
+    path = str(tmp_path / 'reset.journal')
+    interrupted_journal(path)
+    tool = FreeIPAPasswordReset(backend=JsonRpcBackend(server.url, 'admin', 'secret'))
+    tool.journal = ModificationJournal(path)
+    try:
+        assert tool.run_resume(path)
+    finally:
+        tool.journal.close()
+
+    assert server.stats['modified'] == 6
+    assert server.directory['user0000003']['krbpasswordexpiration'] != [TARGET]
+    assert server.directory['user0000009']['krbpasswordexpiration'] == [TARGET]
+    assert ModificationJournal.pending(path) == ([], 10)
@@ -0,0 +1,55 @@
+import threading
+
+from freeipa_password_reset import JsonRpcBackend, UserQuery
+
+TARGET = '2030-12-31T12:00:00Z'
+
+
+def test_modifications_are_sent_in_batches(server):
+    backend = JsonRpcBackend(server.url, 'admin', 'secret', batch_size=7)
+    assignments = [(f"user{index:07d}", TARGET) for index in range(19)] + [('nobody', TARGET)]
+    outcomes = backend.modify_expirations(assignments)
+
+    assert outcomes[:19] == [(True, '')] * 19
+    assert outcomes[19] == (False, 'nobody: user not found')
+    # One login, then ceil(20 / 7) batch requests carrying all 20 calls
+    assert server.stats['logins'] == 1
+    assert server.stats['requests'] == 1 + 3
+    assert server.stats['calls'] == 20
+    assert server.directory['user0000018']['krbpasswordexpiration'] == [TARGET]
+
+
+def test_expired_session_logs_in_again_once(server):
+    backend = JsonRpcBackend(server.url, 'admin', 'secret', batch_size=10)
+    assert len(list(backend.iter_users(UserQuery()))) == 60
+
+    server.expire_sessions()
+    assert backend.modify_expirations([('user0000001', TARGET)]) == [(True, '')]
+    assert server.stats['logins'] == 2
+
+
+def test_concurrent_requests_share_one_relogin(server):
+    backend = JsonRpcBackend(server.url, 'admin', 'secret', batch_size=5, pool_size=4)
+    backend.login()
+    server.expire_sessions()
+
+    outcomes = {}
+
+    def modify(start):
+        outcomes[start] = backend.modify_expirations([(f"user{index:07d}", TARGET) for index in range(start, start + 5)])
+
+    threads = [threading.Thread(target=modify, args=(start,)) for start in range(0, 40, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(result == [(True, '')] * 5 for result in outcomes.values())
+    assert len(outcomes) == 8
+    assert server.stats['logins'] == 2
+
+
+def test_unreachable_server_fails_every_assignment():
+    backend = JsonRpcBackend('http://127.0.0.1:9', 'admin', 'secret', timeout=2)
+    outcomes = backend.modify_expirations([('user0000001', TARGET), ('user0000002', TARGET)])
+    assert len(outcomes) == 2
+    assert all(not success and 'Connection to http://127.0.0.1:9 failed' in error for success, error in outcomes)
@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+import subprocess
+
+from conftest import TOOL_DIR
+from freeipa_password_reset import FreeIPAPasswordReset, LdapBackend, UserCache, UserQuery
+
+BASE_DN = 'dc=example,dc=com'
+
+
+def backend():
+    return LdapBackend('ldap://fake', BASE_DN, batch_size=10)
+
+
+def directory_expiration(login):
+    with open(os.environ['FAKE_LDAP_DIRECTORY']) as f:
+        for entry in json.load(f):
+            if entry['attrs'].get('uid') == [login]:
+                return entry['attrs']['krbPasswordExpiration'][0]
+
+
+def test_enumeration(fake_ldap):
+    users = list(backend().iter_users())
+    assert [user['login'] for user in users] == [f"user{index:07d}" for index in range(40)]
+    assert all(user['password_expiration'] for user in users)
+    assert users[3]['groups'][0] == 'ipausers'
+
+    assert [user['login'] for user in backend().iter_users(UserQuery(login_prefix='user000001'))] == \
+        [f"user{index:07d}" for index in range(10, 20)]
+    assert list(backend().iter_disabled_logins()) == []
+    groups = {entry['cn'][0]: entry for entry in backend().iter_groups()}
+    assert len(groups['ipausers']['member']) == 40
+
+    found = [user['login'] for user in backend().lookup_users(['user0000007', 'nobody', 'USER0000009'])]
+    assert found == ['user0000007', 'user0000009']
+
+
+def test_partial_failures_are_reported_per_user(fake_ldap, monkeypatch):
+    monkeypatch.setenv('FAKE_LDAP_REJECT', 'user0000002')
+    outcomes = backend().modify_expirations([('user0000001', '2030-12-31T12:00:00Z'),
+                                             ('user0000002', '2030-12-31T12:00:00Z'),
+                                             ('nobody', '2030-12-31T12:00:00Z'),
+                                             ('user0000003', 'not a date'),
+                                             ('user0000004', '2030-12-31T12:00:00Z')])
+    assert outcomes[0] == (True, '')
+    assert outcomes[1] == (False, 'Insufficient access (50)')
+    assert outcomes[2] == (False, 'No such object (32)')
+    assert outcomes[3][0] is False
+    assert outcomes[4] == (True, '')
+    assert directory_expiration('user0000001') == '20301231120000Z'
+    assert directory_expiration('user0000002') != '20301231120000Z'
+
+
+def test_cache_picks_up_changes_through_a_modify_timestamp_delta(fake_ldap, tmp_path, capsys):
+    cache = UserCache(str(tmp_path / 'users.sqlite'), 'ldap')
+    tool = FreeIPAPasswordReset(backend=backend(), cache=cache)
+    assert tool.get_users_list()
+    assert len(tool.users_data) == 40
+
+    # Changed behind the cache's back, e.g. by another administrator
+    assert backend().modify_expirations([('user0000005', '2031-01-01T00:00:00Z')]) == [(True, '')]
+    capsys.readouterr()
+
+    tool = FreeIPAPasswordReset(backend=backend(), cache=cache)
+    assert tool.get_users_list()
+    # The delta is inclusive: the newest entry of the previous sync comes back along with the change
+    assert "(2 users changed since last sync)" in capsys.readouterr().out
+    assert not tool.users_stale
+    table = tool.users_data
+    assert len(table) == 40
+    assert table.expirations[table.index_of('user0000005')] == '20310101000000Z'
+
+
+def test_batch_run_reports_rejected_users(fake_ldap, tmp_path, monkeypatch):
+    monkeypatch.setenv('FAKE_LDAP_REJECT', 'user0000002')
+    result = subprocess.run(
+        [sys.executable, os.path.join(TOOL_DIR, 'freeipa_password_reset.py'), '--backend', 'ldap',
+         '--ldap-uri', 'ldap://fake', '--base-dn', BASE_DN, '--cache-file', str(tmp_path / 'users.sqlite'),
+         '--users', 'user0000001,user0000002,nobody', '--expiration', '2030-12-31T12:00:00Z'],
+        stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=60)
+    assert "Successfully modified 1/2 users" in result.stdout
+    assert "user0000002: Insufficient access (50)" in result.stdout
+    assert directory_expiration('user0000001') == '20301231120000Z'
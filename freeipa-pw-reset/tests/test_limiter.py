@@ -0,0 +1,72 @@
+import threading
+import time
+
+from freeipa_password_reset import AdaptiveLimiter, FreeIPAPasswordReset
+
+TARGET = '2030-12-31T12:00:00Z'
+BUSY = "ipa: ERROR: Server is busy, try again later"
+
+
+def test_overload_halves_the_limit_once_per_round_and_successes_regrow_it():
+    limiter = AdaptiveLimiter(maximum=8, initial=8)
+    assert limiter.acquire() and limiter.release(0.5, overloaded=True) == 4
+    # A burst of failures from the same round (within one latency) counts once
+    assert limiter.acquire() and limiter.release(0.5, overloaded=True) is None
+    time.sleep(0.02)
+    assert limiter.acquire() and limiter.release(0.01, overloaded=True) == 2
+    assert (limiter.limit, limiter.lowest_limit, limiter.decreases) == (2, 2, 2)
+
+    # +1/limit per success: about one step per round of operations
+    releases = 0
+    while limiter.limit < limiter.maximum:
+        assert limiter.acquire()
+        assert limiter.release(0.01, overloaded=False) is None
+        releases += 1
+    assert limiter.limit == 8 and 20 < releases < 40
+    assert (limiter.lowest_limit, limiter.decreases) == (2, 2)
+
+
+def test_a_latency_spike_counts_as_overload_and_the_limit_has_a_floor():
+    limiter = AdaptiveLimiter(maximum=4, initial=2, minimum=1)
+    assert limiter.acquire() and limiter.release(0.01, overloaded=False) is None
+    assert limiter.acquire() and limiter.release(0.05, overloaded=True) == 1
+    time.sleep(0.1)
+    # More than three times the best latency seen
+    assert limiter.acquire() and limiter.release(0.05, overloaded=False) == 1
+    assert limiter.limit == 1 and limiter.decreases == 2
+
+
+def test_acquire_waits_for_a_slot_and_close_rejects_waiters():
+    limiter = AdaptiveLimiter(maximum=2, initial=2)
+    assert limiter.acquire() and limiter.acquire()
+    outcome = []
+    waiter = threading.Thread(target=lambda: outcome.append(limiter.acquire()))
+    waiter.start()
+    time.sleep(0.1)
+    assert outcome == [] and limiter.in_flight == 2
+    limiter.close()
+    waiter.join(5)
+    assert outcome == [False]
+
+
+def test_transient_failures_are_retried_up_to_max_retries(monkeypatch):
+    tool = FreeIPAPasswordReset(max_retries=2, retry_backoff=0.001)
+    calls = []
+
+    def apply_expirations(assignments):
+        calls.append([username for username, _ in assignments])
+        # bob recovers on the second attempt, carol stays busy, alice fails for good
+        return [(True, "") if username == 'bob' and len(calls) > 1
+                else (False, "ipa: ERROR: Insufficient access") if username == 'alice'
+                else (False, BUSY)
+                for username, _ in assignments]
+
+    monkeypatch.setattr(tool, 'apply_expirations', apply_expirations)
+    limiter = AdaptiveLimiter(maximum=4, initial=4)
+    results = tool._timed_apply([('alice', TARGET), ('bob', TARGET), ('carol', TARGET)], limiter)
+
+    # Only the transient failures are retried, and at most max_retries times
+    assert calls == [['alice', 'bob', 'carol'], ['bob', 'carol'], ['carol']]
+    assert [(result.success, result.attempts) for result in results] == [(False, 1), (True, 2), (False, 3)]
+    assert results[2].error == BUSY
+    assert limiter.decreases >= 1 and limiter.in_flight == 0
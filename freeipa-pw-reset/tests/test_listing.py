@@ -0,0 +1,43 @@
+import os
+import sys
+import json
+import subprocess
+
+from conftest import TOOL_DIR
+
+
+def run_tool(*arguments):
+    return subprocess.run([sys.executable, os.path.join(TOOL_DIR, 'freeipa_password_reset.py'), '--no-cache']
+                          + list(arguments), stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=60)
+
+
+def test_expiration_queries_support_machine_readable_formats(fake_ipa):
+    result = run_tool('--expired', '--format', 'ndjson', '--columns', 'login,password_expiration')
+    assert result.returncode == 0
+    records = [json.loads(line) for line in result.stdout.splitlines()]
+    assert records and all(set(record) == {'login', 'password_expiration'} for record in records)
+    expirations = [record['password_expiration'] for record in records]
+    assert expirations == sorted(expirations)
+    assert "users already expired" in result.stderr
+
+    result = run_tool('--expires-before', '2000-01-01', '--format', 'json')
+    assert result.returncode == 0
+    assert json.loads(result.stdout) == []
+
+
+def test_formats_are_rejected_for_modifications(fake_ipa):
+    result = run_tool('--expired', '--expiration', '2030-12-31T12:00:00Z', '--format', 'csv')
+    assert result.returncode == 2
+    assert "--format ndjson/csv/json is only supported for listings" in result.stderr
+
+
+def test_demo_status_lines_stay_outside_the_table():
+    result = run_tool('--demo', '--list')
+    assert result.returncode == 0
+    lines = result.stdout.splitlines()
+    rules = [number for number, line in enumerate(lines) if line.startswith('=' * 20)]
+    assert len(rules) == 3
+    # Header rule, column names, rule, then only the three user rows up to the closing rule
+    table = lines[rules[1] + 1:rules[2]]
+    assert [row.split()[1] for row in table] == ['testuser1', 'testuser2', 'admin']
+    assert lines.index("Demo mode - Loaded 3 mock users") < rules[0]
@@ -0,0 +1,79 @@
+import os
+import re
+
+import pytest
+
+from freeipa_password_reset import Histogram, Metrics
+
+
+def test_observations_land_in_the_first_bucket_that_holds_them():
+    histogram = Histogram()
+    for value in (0.0005, 0.001, 0.0011, 0.3, 0.3, 400.0):
+        histogram.observe(value)
+    buckets = dict(zip(Histogram.BUCKETS + (float('inf'),), histogram.counts))
+    # Bounds are inclusive (Prometheus "le")
+    assert buckets[0.001] == 2 and buckets[0.0025] == 1 and buckets[0.5] == 2
+    assert buckets[float('inf')] == 1
+    assert sum(histogram.counts) == histogram.count == 6
+    assert histogram.max == 400.0 and histogram.sum == pytest.approx(400.6026)
+    # The third of six observations is the last one in (0.001, 0.0025]
+    assert histogram.quantile(0.5) == pytest.approx(0.0025)
+
+
+def test_prometheus_text_format():
+    metrics = Metrics()
+    metrics.observe('command', 0.002, 'ipa user-mod')
+    metrics.observe('command', 0.02, 'ipa user-mod')
+    metrics.observe('command', 1000.0, 'ipa user-mod')
+    metrics.count('modifications', 2, 'success')
+    metrics.error('ipa: ERROR: Server is busy')
+    metrics.count('custom', 1.5, 'say "hi"')
+    lines = metrics.prometheus_text().splitlines()
+
+    prefix = 'freeipa_pw_reset_phase_seconds'
+    labels = 'phase="command",kind="ipa user-mod"'
+    buckets = [line for line in lines if line.startswith(f'{prefix}_bucket{{{labels},')]
+    assert len(buckets) == len(Histogram.BUCKETS) + 1
+    # Cumulative, one per bound in order, ending with +Inf = count
+    assert buckets[0] == f'{prefix}_bucket{{{labels},le="0.001"}} 0'
+    assert f'{prefix}_bucket{{{labels},le="0.0025"}} 1' in buckets
+    assert f'{prefix}_bucket{{{labels},le="0.025"}} 2' in buckets
+    assert buckets[-2] == f'{prefix}_bucket{{{labels},le="300.0"}} 2'
+    assert buckets[-1] == f'{prefix}_bucket{{{labels},le="+Inf"}} 3'
+    values = [int(line.rsplit(' ', 1)[1]) for line in buckets]
+    assert values == sorted(values)
+    assert f'{prefix}_sum{{{labels}}} 1000.022000' in lines
+    assert f'{prefix}_count{{{labels}}} 3' in lines
+
+    assert '# TYPE freeipa_pw_reset_modifications_total counter' in lines
+    assert 'freeipa_pw_reset_modifications_total{result="success"} 2' in lines
+    assert 'freeipa_pw_reset_errors_total{class="transient"} 1' in lines
+    assert 'freeipa_pw_reset_custom_total{kind="say \\"hi\\""} 1.5' in lines
+    # Every sample line is "name{labels} value" or "name value"
+    sample = re.compile(r'^[a-z_]+(\{[^}]*\})? [0-9.e+-]+$')
+    assert all(sample.match(line) for line in lines if not line.startswith('#'))
+
+
+def test_write_prometheus_replaces_the_file_atomically(tmp_path, monkeypatch):
+    path = tmp_path / 'freeipa_pw_reset.prom'
+    path.write_text('old\n')
+    metrics = Metrics()
+    metrics.count('modifications', 1, 'success')
+    metrics.write_prometheus(str(path))
+
+    written = path.read_text().splitlines()
+    # Identical apart from the run duration, which keeps growing
+    assert written[:-1] == metrics.prometheus_text().splitlines()[:-1]
+    assert 'freeipa_pw_reset_modifications_total{result="success"} 1' in written
+    assert os.stat(path).st_mode & 0o777 == 0o644
+    assert os.listdir(tmp_path) == [path.name]
+
+    # A failed write leaves the old file and no temporary file behind
+    def fail(*args):
+        raise OSError("disk full")
+    monkeypatch.setattr(os, 'replace', fail)
+    metrics.count('modifications', 1, 'success')
+    with pytest.raises(OSError):
+        metrics.write_prometheus(str(path))
+    assert os.listdir(tmp_path) == [path.name]
+    assert 'freeipa_pw_reset_modifications_total{result="success"} 1' in path.read_text()
@@ -0,0 +1,61 @@
+import base64
+
+from generate_users import generate, iter_users
+from freeipa_password_reset import StructuredOutputParser
+
+
+def expected_records(count, **options):
+    return [{'login': user['login'], 'first_name': user['first_name'], 'last_name': user['last_name'],
+             'uid': str(user['uid']), 'email': user['email'], 'password_expiration': user['expiration'],
+             'modify_timestamp': user['expiration'], 'groups': tuple(user['groups'])}
+            for user in iter_users(count, **options)]
+
+
+def test_ordinary_entries_match_the_directory():
+    parser = StructuredOutputParser()
+    # Every 10th user is in 300 groups
+    records = list(parser.parse(generate(200, 'raw', heavy_every=10)))
+
+    assert records == expected_records(200, heavy_every=10)
+    assert parser.problems == []
+
+
+def test_streamed_lines_give_the_same_records():
+    data = generate(300, 'raw', heavy_every=7)
+    lines = (line + '\r\n' for line in data.split('\n'))
+    assert list(StructuredOutputParser().parse_lines(lines)) == list(StructuredOutputParser().parse(data))
+
+
+def test_unusual_entries():
+    encoded = base64.b64encode('Zoë'.encode()).decode()
+    data = '\n'.join([
+        "  dn: uid=user0000000,cn=users,cn=accounts,dc=example,dc=com",
+        "  uid: user0000000",
+        "  givenName: Alice",
+        "  krbPasswordExpiration: 20300101000000Z",
+        "",
+        "  dn: uid=user0000001,cn=users,cn=accounts,dc=example,dc=com",
+        "  uid: user0000001",
+        f"  givenName:: {encoded}",
+        "  memberOf: cn=admins,cn=groups,cn=accounts,dc=exam",
+        "   ple,dc=com",
+        "  memberOf: cn=Sudo Rule,cn=sudorules,cn=sudo,dc=example,dc=com",
+        "this is not an attribute",
+        "  krbPasswordExpiration: 20300102000000Z",
+        "",
+        "  uid: orphan",
+        "",
+        "  dn: uid=user0000002,cn=users,cn=accounts,dc=example,dc=com",
+        "  uid: user0000002",
+        "  givenName: Carol",
+        "  krbPasswordExpiration: 20300103000000Z",
+        "",
+    ])
+    parser = StructuredOutputParser()
+    records = list(parser.parse(data))
+
+    assert [record['login'] for record in records] == ['user0000000', 'user0000001', 'user0000002']
+    assert records[1] == {'login': 'user0000001', 'first_name': 'Zoë', 'groups': ('admins',),
+                          'password_expiration': '20300102000000Z'}
+    assert [line for line, _ in parser.problems] == [12, 15]
+
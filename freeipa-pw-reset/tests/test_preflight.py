@@ -0,0 +1,81 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from conftest import TOOL_DIR
+from freeipa_password_reset import FreeIPAPasswordReset, JsonRpcBackend, UserCache
+
+TARGET = '2030-12-31T12:00:00Z'
+
+
+def stale_cache(tmp_path, source, expiration):
+    """
+    A cache claiming every user already expires at `expiration`
+    """
+    cache = UserCache(str(tmp_path / 'users.sqlite'), source)
+    list(cache.full_sync({'login': f"user{index:07d}", 'password_expiration': expiration} for index in range(60)))
+    return cache
+
+
+def test_jsonrpc_preflight_looks_up_only_the_requested_users(server, tmp_path, monkeypatch):
+    backend = JsonRpcBackend(server.url, 'admin', 'secret')
+    tool = FreeIPAPasswordReset(backend=backend, cache=stale_cache(tmp_path, 'jsonrpc', '20301231120000Z'))
+    monkeypatch.setattr(backend, 'iter_users', lambda *args, **kwargs: pytest.fail("enumerated the directory"))
+    server.directory['user0000005']['krbpasswordexpiration'] = ['20301231120000Z']
+    
+    users = tool.preflight_users(['user0000003', 'USER0000004', 'nobody', 'user0000049', 'user0000003',
+                                  'user0000005'], TARGET)
+    # user0000003 is not at the target on the server, whatever the cache says
+    assert users == ['user0000003', 'user0000004']
+    skipped = {label: value for (name, label), value in tool.metrics.counters.items() if name == 'preflight_skipped'}
+    assert skipped == {'unknown': 1, 'disabled': 1, 'compliant': 1}
+
+
+def test_cli_preflight_uses_user_show_for_short_lists(fake_ipa, tmp_path):
+    tool = FreeIPAPasswordReset(cache=stale_cache(tmp_path, 'cli', '20301231120000Z'))
+    assert tool.preflight_users(['user0000003', 'nobody', 'user0000049'], TARGET) == ['user0000003']
+    assert not tool.users_data
+
+
+def test_cli_preflight_of_long_lists_bypasses_a_stale_cache(fake_ipa, tmp_path):
+    tool = FreeIPAPasswordReset(cache=stale_cache(tmp_path, 'cli', '20301231120000Z'))
+    tool.get_users_list()
+    assert tool.users_stale
+    
+    logins = [f"user{index:07d}" for index in range(40)]
+    assert tool.preflight_users(logins, TARGET) == logins
+    assert not tool.users_stale
+
+
+def test_preflight_reuses_a_list_enumerated_in_this_run(server, monkeypatch):
+    backend = JsonRpcBackend(server.url, 'admin', 'secret')
+    tool = FreeIPAPasswordReset(backend=backend)
+    assert tool.get_users_list()
+    monkeypatch.setattr(backend, 'lookup_users', lambda logins: pytest.fail("looked the users up again"))
+    assert tool.preflight_users(['user0000003', 'nobody'], TARGET) == ['user0000003']
+
+
+def run_demo(*arguments):
+    return subprocess.run([sys.executable, os.path.join(TOOL_DIR, 'freeipa_password_reset.py'), '--demo']
+                          + list(arguments), stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=60)
+
+
+def test_the_documented_demo_command_modifies_the_demo_users():
+    result = run_demo('--users', 'testuser1,testuser2', '--expiration', TARGET)
+    assert result.returncode == 0
+    assert "Preflight: 2 requested, 2 to modify" in result.stdout
+    assert "Successfully modified 2/2 users" in result.stdout
+
+
+def test_only_unknown_users_is_an_error():
+    result = run_demo('--users', 'nobody,ghost', '--expiration', TARGET)
+    assert result.returncode == 1
+    assert "2 not found in the directory: nobody, ghost" in result.stdout
+    assert "Error: None of the requested users exist" in result.stdout
+    
+    # Some unknown users are only reported
+    result = run_demo('--users', 'nobody,admin', '--expiration', TARGET)
+    assert result.returncode == 0
+    assert "1 not found in the directory: nobody" in result.stdout
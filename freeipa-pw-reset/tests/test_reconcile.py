@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from freeipa_password_reset import FreeIPAPasswordReset, JsonRpcBackend, UserCache, load_policy
+
+# Every test runs against a directory of 20 users
+pytestmark = pytest.mark.parametrize('server', [20], indirect=True)
+
+
+@pytest.fixture
+def policy(tmp_path):
+    path = tmp_path / 'policy.json'
+    path.write_text(json.dumps({'rules': [
+        {'select': 'user000000*', 'expiration': '2030-12-31T12:00:00Z'},
+        {'select': 'all', 'days': 90, 'min_remaining_days': 14},
+    ]}))
+    return str(path)
+
+
+def make_tool(server, tmp_path, cached_expiration=None):
+    cache = UserCache(str(tmp_path / 'users.sqlite'), 'jsonrpc')
+    if cached_expiration:
+        list(cache.full_sync({'login': f"user{index:07d}", 'password_expiration': cached_expiration}
+                             for index in range(20)))
+    return FreeIPAPasswordReset(backend=JsonRpcBackend(server.url, 'admin', 'secret'), cache=cache)
+
+
+def test_plan_policy_first_matching_rule_wins(server, tmp_path, policy):
+    tool = make_tool(server, tmp_path)
+    assert tool.get_users_list()
+    server_now = 1704110400.0  # 2024-01-01T12:00:00Z, the generator epoch
+    changes, compliant, unmatched = tool.plan_policy(load_policy(policy), now=server_now)
+    
+    assert unmatched == 0
+    assert {change.login: change.rule for change in changes if change.rule == 1} == {
+        f"user{index:07d}": 1 for index in range(10)}
+    for change in changes:
+        if change.rule == 2:
+            assert change.target == '2024-03-31T12:00:00Z'
+    assert len(changes) + compliant == 20
+
+
+def test_reconcile_does_not_trust_a_stale_cache(server, tmp_path, policy):
+    # The cache claims rule 1 is already satisfied everywhere; the server disagrees
+    tool = make_tool(server, tmp_path, cached_expiration='20301231120000Z')
+    assert tool.run_reconcile(policy)
+    for index in range(10):
+        assert server.directory[f"user{index:07d}"]['krbpasswordexpiration'] == ['2030-12-31T12:00:00Z']
+
+
+def test_reconcile_dry_run_may_use_the_cache(server, tmp_path, policy, capsys):
+    tool = make_tool(server, tmp_path, cached_expiration='20301231120000Z')
+    assert tool.run_reconcile(policy, dry_run=True)
+    assert tool.users_stale
+    assert "an actual run re-enumerates first" in capsys.readouterr().out
+    assert server.stats['modified'] == 0
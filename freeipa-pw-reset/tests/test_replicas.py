@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+from fake_ipa_server import start_servers
+from freeipa_password_reset import FreeIPAPasswordReset, JsonRpcBackend, Replica, ReplicaSet
+
+TARGET = '2030-12-31T12:00:00Z'
+
+
+@pytest.fixture
+def servers():
+    instances = start_servers([0, 0], users=60)
+    yield instances
+    for instance in instances:
+        instance.shutdown()
+        instance.server_close()
+
+
+def replica_set(servers, limit=1, batch_size=100):
+    return ReplicaSet([Replica(f"replica{index}", JsonRpcBackend(server.url, 'admin', 'secret',
+                                                                 batch_size=batch_size, timeout=5), limit)
+                       for index, server in enumerate(servers)])
+
+
+def units(first, count, size=1):
+    return [[(f"user{index:07d}", TARGET) for index in range(start, start + size)]
+            for start in range(first, first + count * size, size)]
+
+
+def test_a_dead_replica_is_ejected_and_its_units_fail_over(servers):
+    replicas = replica_set(servers)
+    live, dead = replicas.replicas
+    servers[1].shutdown()
+    servers[1].server_close()
+
+    for unit in units(0, 10):
+        assert replicas.modify_expirations(unit) == [(True, "")]
+    # Three refused connections in a row, each unit then applied on the live replica
+    assert (dead.requests, dead.succeeded, dead.ejections) == (ReplicaSet.EJECT_AFTER, 0, 1)
+    assert dead.ejected_until > time.monotonic() + ReplicaSet.EJECT_SECONDS - 5
+    assert (live.requests, live.succeeded) == (10, 10)
+    assert servers[0].stats['modified'] == 10
+
+
+def test_an_ejected_replica_is_readmitted_after_its_cooldown(servers, monkeypatch):
+    monkeypatch.setattr(ReplicaSet, 'EJECT_SECONDS', 0.5)
+    replicas = replica_set(servers)
+    healthy, flaky = replicas.replicas
+    servers[1].busy_rate = 1.0
+    for unit in units(0, 6):
+        assert replicas.modify_expirations(unit) == [(True, "")]
+    assert flaky.ejections == 1 and flaky.succeeded == 0
+
+    # Recovered, but still cooling down: nothing is sent to it
+    servers[1].busy_rate = 0.0
+    requests = flaky.requests
+    for unit in units(6, 4):
+        replicas.modify_expirations(unit)
+    assert flaky.requests == requests
+
+    time.sleep(0.6)
+    for unit in units(10, 10):
+        assert replicas.modify_expirations(unit) == [(True, "")]
+    assert flaky.succeeded >= 4 and healthy.succeeded >= 4
+    assert servers[1].stats['modified'] == flaky.succeeded
+
+
+def test_a_replica_failing_mid_run_does_not_lose_changes(servers):
+    # 30 units of two users
+    replicas = replica_set(servers, limit=2, batch_size=2)
+    tool = FreeIPAPasswordReset(workers=4, retry_backoff=0.001)
+    tool.replicas = replicas
+    users = [f"user{index:07d}" for index in range(60)]
+    original = tool.apply_expirations
+    applied = []
+
+    def apply_expirations(assignments):
+        applied.append(len(assignments))
+        if len(applied) == 5:
+            # From now on every change on the second replica is rejected as busy
+            servers[1].busy_rate = 1.0
+        return original(assignments)
+
+    tool.apply_expirations = apply_expirations
+    results = tool.execute_modifications(users, TARGET)
+
+    assert all(result.success for result in results), [result.error for result in results if not result.success]
+    assert all(result.attempts == 1 for result in results)
+    assert servers[1].stats['busy'] > 0 and replicas.replicas[1].ejections == 1
+    assert servers[0].stats['modified'] + servers[1].stats['modified'] == 60
+    assert all(entry['krbpasswordexpiration'] == [TARGET] for entry in servers[0].directory.values())
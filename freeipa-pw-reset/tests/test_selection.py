@@ -0,0 +1,127 @@
+import math
+import tracemalloc
+
+import pytest
+
+from freeipa_password_reset import ExpirationWindow, GroupGraph, UserSelector, UserTable
+
+NOW = 1893456000.0  # 2030-01-01T00:00:00Z
+DAY = 86400
+
+
+def group_entry(name, users=(), groups=(), parents=()):
+    return {'cn': [name],
+            'member': ([f"uid={login},cn=users,cn=accounts,dc=example,dc=com" for login in users]
+                       + [f"cn={group},cn=groups,cn=accounts,dc=example,dc=com" for group in groups]),
+            'memberOf': [f"cn={group},cn=groups,cn=accounts,dc=example,dc=com" for group in parents]}
+
+
+@pytest.fixture
+def table():
+    return UserTable([
+        {'login': 'admin', 'groups': ('admins',)},
+        {'login': 'dev-alice', 'groups': ('devs',)},
+        {'login': 'dev-bob', 'groups': ('devs', 'ops')},
+        {'login': 'dev-bot1', 'groups': ('devs',)},
+        {'login': 'svc_backup', 'groups': ('services',)},
+        {'login': 'carol', 'groups': ('ops',)},
+    ])
+
+
+def test_selection_terms(table):
+    selector = UserSelector(table)
+    assert selector.select('2-3,carol,2') == (['dev-alice', 'dev-bob', 'carol'], [])
+    assert selector.select('dev-*')[0] == ['dev-alice', 'dev-bob', 'dev-bot1']
+    assert selector.select('dev-b?b')[0] == ['dev-bob']
+    assert selector.select('re:^svc_|^car')[0] == ['svc_backup', 'carol']
+    assert selector.select('@devs,!dev-bot*')[0] == ['dev-alice', 'dev-bob']
+    assert selector.select('!@devs,!admin')[0] == ['svc_backup', 'carol']
+    assert selector.select('all')[0] == table.logins
+
+
+def test_selection_warnings_and_errors(table):
+    selector = UserSelector(table)
+    selected, warnings = selector.select('admin,nobody,9,@nogroup,zz*')
+    assert selected == ['admin']
+    assert warnings == ["Warning: User 'nobody' does not exist",
+                        "Warning: Number '9' is out of range (1-6)",
+                        "Warning: Group 'nogroup' has no members in the user list",
+                        "Warning: Pattern 'zz*' matched no users"]
+    with pytest.raises(ValueError):
+        selector.select('5-2')
+    with pytest.raises(ValueError):
+        selector.select('re:(')
+    assert UserSelector.needs_directory('alice,bob') is False
+    assert UserSelector.needs_directory('alice,@devs') is True
+
+
+def nested_groups():
+    graph = GroupGraph()
+    graph.add_entry(group_entry('staff', groups=['devs']))
+    graph.add_entry(group_entry('devs', users=['dev-alice']))
+    graph.add_entry(group_entry('ops', users=['carol'], parents=['staff']))
+    # admins and services contain each other
+    graph.add_entry(group_entry('admins', users=['admin'], groups=['services']))
+    graph.add_entry(group_entry('services', groups=['admins']))
+    return graph
+
+
+def test_nested_groups_and_cycles(table):
+    graph = nested_groups()
+    assert graph.closure('staff') == {'staff', 'devs', 'ops'}
+    assert graph.members('staff') == {'dev-alice', 'carol'}
+    assert graph.closure('admins') == graph.closure('services') == {'admins', 'services'}
+    assert graph.cycles == [('admins', 'services')]
+
+    selector = UserSelector(table, nested_groups())
+    selected, warnings = selector.select('@staff')
+    # Members listed on the user entries count too (dev-bob, dev-bot1 via memberOf devs)
+    assert sorted(selected) == ['carol', 'dev-alice', 'dev-bob', 'dev-bot1']
+    assert warnings == []
+    selected, warnings = selector.select('@services')
+    assert sorted(selected) == ['admin', 'svc_backup']
+    assert warnings == ["Warning: Groups admins, services are nested in each other; their members are counted once"]
+
+
+def test_deep_nesting_uses_linear_memory():
+    depth = 20000
+    graph = GroupGraph()
+    for level in range(depth):
+        graph.add_entry(group_entry(f"g{level}", users=[f"u{level}"],
+                                    groups=[f"g{level + 1}"] if level + 1 < depth else []))
+
+    tracemalloc.start()
+    try:
+        # Closures memoized per group would hold depth^2 / 2 names after the first query
+        sizes = [len(graph.closure(f"g{level}")) for level in range(depth - 1, -1, -500)]
+        assert len(graph.members('g0')) == depth
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert sizes[0] == 1 and sizes[-1] == depth - 499
+    assert graph.cycles == []
+    assert peak < 30e6
+
+
+def test_expiration_window():
+    table = UserTable([
+        {'login': 'expired', 'password_expiration': '20291201000000Z'},
+        {'login': 'soon', 'password_expiration': '2030-01-05T00:00:00Z'},
+        {'login': 'later', 'password_expiration': '20300301000000Z'},
+        {'login': 'sooner', 'password_expiration': '20300102000000Z'},
+        {'login': 'never'},
+        {'login': 'garbage', 'password_expiration': 'tomorrow'},
+    ])
+    assert math.isnan(table.expiration_epochs()[4])
+
+    def logins(window):
+        return [table.logins[row] for row in table.select_by_expiration(window, now=NOW)]
+
+    assert not ExpirationWindow()
+    assert logins(ExpirationWindow(expired=True)) == ['expired']
+    assert logins(ExpirationWindow(within_days=7)) == ['sooner', 'soon']
+    assert logins(ExpirationWindow(expired=True, within_days=7)) == ['expired', 'sooner', 'soon']
+    assert logins(ExpirationWindow(before=NOW + 90 * DAY)) == ['expired', 'sooner', 'soon', 'later']
+
+    table.set_expiration('later', '20300103000000Z')
+    assert logins(ExpirationWindow(within_days=7)) == ['sooner', 'later', 'soon']
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+import freeipa_password_reset
+from generate_users import generate
+from freeipa_password_reset import SnapshotFile, StructuredOutputParser
+
+
+@pytest.fixture
+def snapshot(tmp_path, monkeypatch):
+    """
+    A raw user-find dump of 300 users (about 290 KB), cut into four chunks per worker
+    """
+    monkeypatch.setattr(SnapshotFile, 'MIN_CHUNK_SIZE', 4096)
+    path = tmp_path / 'users.raw'
+    path.write_text(generate(300, 'raw', heavy_every=50))
+    return path
+
+
+def test_chunks_cover_the_file_and_end_between_entries(snapshot):
+    source = SnapshotFile(str(snapshot), workers=1)
+    chunks = source.chunks()
+    data = snapshot.read_bytes()
+
+    assert len(chunks) == 4
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(data)
+    assert all(end == start for (_, end), (start, _) in zip(chunks, chunks[1:]))
+    assert all(data[end - 2:end] == b'\n\n' for _, end in chunks[:-1])
+    # Parsed chunk by chunk, the records are those of the whole file
+    assert list(source.iter_records()) == list(StructuredOutputParser().parse(snapshot.read_text()))
+
+
+def test_worker_processes_keep_the_file_order(snapshot, monkeypatch):
+    pools = []
+
+    class RecordingPool(freeipa_password_reset.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            pools.append(kwargs.get('max_workers'))
+
+    monkeypatch.setattr(freeipa_password_reset, 'ProcessPoolExecutor', RecordingPool)
+    records = list(SnapshotFile(str(snapshot), workers=3).iter_records())
+
+    assert pools == [3]
+    assert [record['login'] for record in records] == [f"user{index:07d}" for index in range(300)]
+    assert records == list(StructuredOutputParser().parse(snapshot.read_text()))
+
+
+def test_problem_line_numbers_count_from_the_start_of_the_file(snapshot, capsys):
+    lines = snapshot.read_text().split('\n')
+    # Deep inside a later chunk, inside an entry
+    number = lines.index('  uid: user0000250') + 1
+    lines.insert(number, "garbage")
+    snapshot.write_text('\n'.join(lines))
+    source = SnapshotFile(str(snapshot), workers=2)
+
+    assert len(list(source.iter_records())) == 300
+    assert source.metrics.counters[('parse_problems', 'structured')] == 1
+    assert f"line {number + 1}: not an attribute, ignored: 'garbage'" in capsys.readouterr().out
+
+
+def test_only_regular_files_are_accepted(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        SnapshotFile(str(tmp_path / 'missing.raw'))
+    with pytest.raises(OSError, match="not a regular file"):
+        SnapshotFile(str(tmp_path))
+    fifo = tmp_path / 'pipe'
+    os.mkfifo(fifo)
+    with pytest.raises(OSError, match="not a regular file"):
+        SnapshotFile(str(fifo))
@@ -0,0 +1,62 @@
+import pytest
+
+from freeipa_password_reset import ExpirationSpread, FreeIPAPasswordReset, JsonRpcBackend, UserCache
+
+
+def test_slots_are_stable_and_inside_the_window():
+    spread = ExpirationSpread.parse('2030-06-01..2030-06-30')
+    users = [(f"user{index}", None) for index in range(300)]
+    changes, planned, _ = spread.plan(users)
+    again, _, _ = ExpirationSpread.parse('2030-06-01..2030-06-30').plan(list(reversed(users)))
+    assert {change.login: change.target for change in changes} == {change.login: change.target for change in again}
+    assert all('2030-06-01' <= change.target[:10] <= '2030-06-30' for change in changes)
+    assert sum(planned) == 300
+
+
+def test_daily_cap_is_respected():
+    spread = ExpirationSpread.parse('2030-06-01..2030-06-10', daily_cap=12)
+    _, planned, _ = spread.plan([(f"user{index}", None) for index in range(100)])
+    assert max(planned) <= 12
+    assert sum(planned) == 100
+
+
+def test_cap_too_small_for_the_users_is_an_error():
+    spread = ExpirationSpread.parse('2030-06-01..2030-06-02', daily_cap=3)
+    with pytest.raises(ValueError):
+        spread.plan([(f"user{index}", None) for index in range(10)])
+
+
+def test_users_already_in_place_are_not_written():
+    spread = ExpirationSpread.parse('2030-06-01..2030-06-30')
+    first, _, _ = spread.plan([(f"user{index}", None) for index in range(20)])
+    changes, _, _ = spread.plan([(change.login, change.target) for change in first])
+    assert changes == []
+
+
+def test_rebalance_moves_only_the_excess():
+    spread = ExpirationSpread.parse('2030-06-01..2030-06-10', rebalance=True)
+    # 40 users piled up on June 3rd, 10 already on June 7th
+    users = [(f"user{index}", '20300603120000Z') for index in range(40)]
+    users += [(f"other{index}", '20300607120000Z') for index in range(10)]
+    changes, planned, current = spread.plan(users)
+
+    assert current[2] == 40 and current[6] == 10
+    # ceil(50 / 10) = 5 per day: 5 stay on each of the two days, the other 40 move
+    assert planned == [5] * 10
+    assert len(changes) == 40
+    assert all(change.current in ('20300603120000Z', '20300607120000Z') for change in changes)
+
+
+def test_spread_does_not_trust_a_stale_cache(server, tmp_path):
+    spread = ExpirationSpread.parse('2030-06-01..2030-06-30')
+    logins = [f"user{index:07d}" for index in range(30)]
+    planned, _, _ = spread.plan([(login, None) for login in logins])
+    
+    # The cache claims every user already sits on its planned slot; the server disagrees
+    cache = UserCache(str(tmp_path / 'users.sqlite'), 'jsonrpc')
+    list(cache.full_sync({'login': change.login, 'password_expiration': change.target} for change in planned))
+    tool = FreeIPAPasswordReset(backend=JsonRpcBackend(server.url, 'admin', 'secret'), cache=cache)
+    assert tool.get_users_list() and tool.users_stale
+    
+    assert tool.run_spread(logins, spread)
+    assert server.stats['modified'] == 30
@@ -0,0 +1,98 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from conftest import TOOL_DIR
+from freeipa_password_reset import FreeIPAPasswordReset, UserCache
+
+
+def make_tool(tmp_path):
+    cache = UserCache(str(tmp_path / 'users.sqlite'), 'cli:test')
+    return FreeIPAPasswordReset(cache=cache)
+
+
+def enumerate_in_thread(tool):
+    outcome = []
+    loader = threading.Thread(target=lambda: outcome.append(tool.get_users_list()))
+    loader.start()
+    loader.join()
+    return outcome == [True]
+
+
+def test_enumeration_in_another_thread_fills_and_reads_the_cache(fake_ipa, tmp_path):
+    tool = make_tool(tmp_path)
+    assert enumerate_in_thread(tool)
+    assert len(tool.users_data) == 50
+    assert not tool.cache.needs_full_sync()
+    
+    # Second run is served from the cache, again from a thread other than the one that opened it
+    assert enumerate_in_thread(tool)
+    assert tool.users_data.logins == [f"user{index:07d}" for index in range(50)]
+
+
+def test_write_through_while_a_full_sync_is_in_progress(tmp_path):
+    cache = UserCache(str(tmp_path / 'users.sqlite'), 'cli:test')
+    list(cache.full_sync({'login': f"user{index}", 'password_expiration': '20240101000000Z'} for index in range(3)))
+    
+    def users():
+        yield {'login': 'user0', 'password_expiration': '20240101000000Z'}
+        # Another thread writes through while the sync generator is suspended
+        writer = threading.Thread(target=cache.update_expirations, args=([('user1', '2030-12-31T12:00:00Z')],))
+        writer.start()
+        writer.join()
+        yield {'login': 'user1', 'password_expiration': '20240101000000Z'}
+    
+    list(cache.full_sync(users()))
+    rows = {user['login']: user['password_expiration'] for user in cache.iter_users()}
+    assert rows == {'user0': '20240101000000Z', 'user1': '20240101000000Z'}
+
+
+def test_interrupted_full_sync_keeps_the_previous_users(tmp_path):
+    cache = UserCache(str(tmp_path / 'users.sqlite'), 'cli:test')
+    list(cache.full_sync({'login': f"user{index}"} for index in range(3)))
+    
+    def failing():
+        yield {'login': 'new'}
+        raise RuntimeError("enumeration failed")
+    
+    try:
+        list(cache.full_sync(failing()))
+    except RuntimeError:
+        pass
+    assert [user['login'] for user in cache.iter_users()] == ['user0', 'user1', 'user2']
+
+
+def test_interactive_browser_with_cache_enabled(fake_ipa, tmp_path, monkeypatch):
+    tool = make_tool(tmp_path)
+    monkeypatch.setattr('builtins.input', lambda prompt='': 'user0000003')
+    assert tool.browse_users(full_screen=False) == ['user0000003']
+    assert len(tool.users_data) == 50
+
+
+def test_a_cache_older_than_the_default_ttl_is_refreshed(tmp_path, monkeypatch):
+    cache = UserCache(str(tmp_path / 'users.sqlite'), 'cli:test')
+    list(cache.full_sync({'login': f"user{index}"} for index in range(3)))
+    assert not cache.needs_full_sync()
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 16 * 60)
+    assert cache.needs_full_sync()
+
+
+def test_listings_from_the_cache_say_how_old_it_is(fake_ipa, tmp_path):
+    command = [sys.executable, os.path.join(TOOL_DIR, 'freeipa_password_reset.py'), '--list-only',
+               '--format', 'ndjson', '--cache-file', str(tmp_path / 'users.sqlite')]
+    first = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=60)
+    assert "Refreshing user cache" in first.stderr
+    second = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=60)
+    assert "Using cached user list from 0 minutes ago" in second.stderr
+    assert second.stdout == first.stdout and len(second.stdout.splitlines()) == 50
+
+
+def test_browser_status_shows_the_age_of_a_cached_list(fake_ipa, tmp_path, monkeypatch, capsys):
+    tool = make_tool(tmp_path)
+    assert tool.get_users_list()
+    monkeypatch.setattr('builtins.input', lambda prompt='': 'user0000003')
+    assert tool.browse_users(full_screen=False) == ['user0000003']
+    assert "cached 0 min ago, --refresh to re-enumerate" in capsys.readouterr().out
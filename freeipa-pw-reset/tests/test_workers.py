@@ -0,0 +1,49 @@
+import threading
+
+from freeipa_password_reset import FreeIPAPasswordReset
+
+TARGET = '2030-12-31T12:00:00Z'
+
+
+def test_workers_modify_concurrently_and_keep_the_input_order(monkeypatch):
+    tool = FreeIPAPasswordReset(workers=4)
+    # Only passes when four modifications are in flight at the same time
+    barrier = threading.Barrier(4, timeout=10)
+    lock = threading.Lock()
+    order = []
+
+    def apply_expiration(username, expiration_date):
+        barrier.wait()
+        with lock:
+            order.append(username)
+        return True, ""
+
+    monkeypatch.setattr(tool, 'apply_expiration', apply_expiration)
+    users = [f"user{index:07d}" for index in range(12)]
+    results = tool.execute_modifications(users, TARGET)
+
+    assert [result.username for result in results] == users
+    assert all(result.success and result.expiration == TARGET for result in results)
+    assert sorted(order) == users
+
+
+def test_failures_are_collected_per_user(fake_ipa, monkeypatch, capsys):
+    monkeypatch.setenv('FAKE_IPA_REJECT', 'user0000002,user0000007')
+    tool = FreeIPAPasswordReset(workers=4)
+    users = [f"user{index:07d}" for index in range(10)]
+    results = tool.execute_modifications(users, TARGET)
+    tool.print_modify_summary(results, 1.0)
+
+    assert [result.username for result in results] == users
+    assert [result.username for result in results if not result.success] == ['user0000002', 'user0000007']
+    assert all('Insufficient' in result.error for result in results if not result.success)
+    # Permanent errors are not retried
+    assert all(result.attempts == 1 for result in results)
+
+    out = capsys.readouterr().out
+    assert "Successfully modified 8/10 users" in out
+    assert "Failed users (2):\n  user0000002: ipa: ERROR: Insufficient access" in out
+    counters = tool.metrics.counters
+    assert counters[('modifications', 'success')] == 8
+    assert counters[('modifications', 'failure')] == 2
+    assert counters[('errors', 'permission')] == 2